@@ -1,10 +1,263 @@
+import queue
+import re
+import threading
 import tkinter as tk
-from PIL import Image, ImageTk
-import pandas as pd
-import pandastable as pt
-import prolog_dfa
+from array import array
+from bisect import bisect_left
+from operator import attrgetter
+from tkinter import ttk
 import prolog_parser
 import prolog_scanner
+from prolog_tokens import Token
+
+# PIL and prolog_dfa (graphviz) are imported by the DFA buttons, so the window opens
+# without loading them.
+
+POLL_MS = 16  # check for worker results at about 60 frames per second
+VALIDATE_DELAY_MS = 300  # live validation waits this long after the last keystroke
+ROW_HEIGHT = 20
+HEADING_HEIGHT = 24
+
+
+class ParseWorker:
+    """
+    Scans and parses on a background thread so the window stays responsive.
+
+    Jobs are keyed by kind ('validate', 'tree' or 'tokens'), and only the latest job of
+    each kind matters: submitting one replaces the one waiting and stops the running one
+    of that kind at its next declaration or clause, and cancel() does so for every kind.
+    The worker keeps its own scanner and IncrementalParser, which only it touches, so each
+    job re-lexes and re-parses just what changed since the previous one. Results are put
+    on the results queue as (job id, kind, result or exception) for the Tk thread to poll.
+    """
+
+    def __init__(self):
+        self.scanner = None
+        self.parser = None
+        self.columns = None  # TokenColumns of the scanner's tokens, once the Token List is opened
+        self.results = queue.Queue()
+        self.cancelled = threading.Event()
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.pending = {}  # kind -> (job id, text), oldest first
+        self.running = None  # kind of the job being worked on
+        self.job_id = 0
+        threading.Thread(target=self.run, name="prolog-parse", daemon=True).start()
+
+    def submit(self, kind, text):
+        with self.lock:
+            self.job_id += 1
+            self.pending.pop(kind, None)
+            self.pending[kind] = (self.job_id, text)
+            if self.running == kind:
+                self.cancelled.set()
+            self.wakeup.set()
+            return self.job_id
+
+    def cancel(self):
+        with self.lock:
+            self.pending.clear()
+            self.cancelled.set()
+
+    @property
+    def busy(self):
+        return self.running is not None or bool(self.pending)
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            with self.lock:
+                if not self.pending:
+                    self.wakeup.clear()
+                    continue
+                kind = next(iter(self.pending))
+                job_id, text = self.pending.pop(kind)
+                self.cancelled.clear()
+                self.running = kind
+            try:
+                self.results.put((job_id, kind, self.work(kind, text)))
+            except prolog_parser.ParseCancelled:
+                pass
+            except Exception as error:
+                self.results.put((job_id, kind, error))
+            with self.lock:
+                self.running = None
+
+    def work(self, kind, text):
+        if self.scanner is None:
+            self.scanner = prolog_scanner.Scanner(text, statistics=True)
+            self.parser = prolog_parser.IncrementalParser(self.scanner, cancelled=self.cancelled)
+        elif text != self.scanner.text:
+            start, end, new_text = prolog_scanner.text_edit(self.scanner.text, text)
+            first, removed, added = self.scanner.apply_edit(start, end, new_text)
+            if self.columns is not None:
+                self.columns.splice(first, removed, self.scanner.tokens[first:first + added],
+                                    len(new_text) - (end - start))
+        if kind == 'tokens':
+            return self.token_snapshot()
+        self.parser.parse()
+        if kind == 'tree':
+            return self.parser.display_parse_tree()
+        return list(self.parser.error_list)
+
+    def token_snapshot(self):
+        """
+        (TokenColumns, TokenStatistics, newline offsets) of the current text, copied so
+        that later edits leave them alone.
+        """
+        if self.columns is None:
+            self.scanner.settle()
+            self.columns = TokenColumns(self.scanner.tokens)
+        text = self.scanner.text
+        newlines = array('I', [match.start() for match in re.finditer('\n', text)])
+        return self.columns.snapshot(text), self.scanner.statistics.copy(), newlines
+
+
+class TokenColumns:
+    """
+    The worker scanner's token types and offsets in arrays, so that opening the Token
+    List copies three arrays instead of reading every Token.
+
+    They are built the first time the list is opened and then follow the scanner's
+    edits: the re-lexed tokens are spliced in and, as in Scanner.apply_edit, the
+    offsets after an edit are corrected lazily, so an edit costs its size plus the
+    distance to the previous one. A snapshot() keeps the pending correction too, and
+    applies it to the rows it is asked for.
+    """
+
+    def __init__(self, tokens, text=None):
+        self.text = text  # set on snapshots, which build Tokens from it
+        self.types = array('B', map(attrgetter('token_type.code'), tokens))
+        # signed, since offsets are behind by a negative shift while it is pending
+        self.starts = array('i', map(attrgetter('start'), tokens))
+        self.ends = array('i', map(attrgetter('end'), tokens))
+        # offsets from shift_index on are behind by shift
+        self.shift_index = len(self.types)
+        self.shift = 0
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        shift = self.shift if index >= self.shift_index else 0
+        start = self.starts[index] + shift
+        end = self.ends[index] + shift
+        return Token(self.text[start:end], prolog_scanner.TOKEN_TYPES[self.types[index]], start, end)
+
+    def splice(self, first, removed, tokens, delta):
+        """
+        Replace the removed rows from first with tokens, after an edit that changed the
+        length of the text by delta; the arguments are what Scanner.apply_edit returned.
+        """
+        old = first + removed
+        # make the pending shift uniform over the rows that survive after the splice
+        if self.shift_index < first:
+            self.settle(first)
+        elif self.shift_index > old and self.shift:
+            self.move(old, self.shift_index, -self.shift)
+        self.types[first:old] = array('B', map(attrgetter('token_type.code'), tokens))
+        self.starts[first:old] = array('i', map(attrgetter('start'), tokens))
+        self.ends[first:old] = array('i', map(attrgetter('end'), tokens))
+        self.shift_index = first + len(tokens)
+        self.shift += delta
+
+    def move(self, start, stop, delta):
+        if start < stop:
+            self.starts[start:stop] = array('i', map(delta.__add__, self.starts[start:stop]))
+            self.ends[start:stop] = array('i', map(delta.__add__, self.ends[start:stop]))
+
+    def settle(self, upto):
+        """
+        Apply the pending offset correction to the rows before index ``upto``.
+        """
+        if self.shift:
+            self.move(self.shift_index, upto, self.shift)
+        if upto >= len(self.types):
+            self.shift = 0
+        self.shift_index = max(self.shift_index, upto)
+
+    def snapshot(self, text):
+        """
+        A copy of the columns, with the text they index, that later edits leave alone.
+        """
+        snapshot = TokenColumns((), text)
+        snapshot.types = array('B', self.types)
+        snapshot.starts = array('i', self.starts)
+        snapshot.ends = array('i', self.ends)
+        snapshot.shift_index = self.shift_index
+        snapshot.shift = self.shift
+        return snapshot
+
+
+class TokenTable:
+    """
+    A ttk.Treeview over a token sequence of any length that only holds the visible rows.
+
+    The tree is refilled from the tokens whenever it is scrolled or resized, and the
+    scrollbar is driven by hand, so opening and scrolling cost the same for a million
+    tokens as for ten.
+    """
+
+    def __init__(self, parent, tokens, newlines):
+        self.tokens = tokens
+        self.newlines = newlines
+        self.first = 0
+        self.rows = 1
+
+        frame = tk.Frame(parent)
+        frame.pack(fill=tk.BOTH, expand=True)
+        frame.pack_propagate(False)
+        ttk.Style().configure('Tokens.Treeview', rowheight=ROW_HEIGHT)
+        self.scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree = ttk.Treeview(frame, columns=('index', 'line', 'column', 'type', 'lexeme'),
+                                 show='headings', style='Tokens.Treeview', height=1)
+        for column, width in (('index', 70), ('line', 60), ('column', 60), ('type', 150), ('lexeme', 320)):
+            self.tree.heading(column, text=column.capitalize())
+            self.tree.column(column, width=width, stretch=column == 'lexeme')
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        frame.bind('<Configure>', self.resize)
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.tree.bind(sequence, self.wheel)
+        for sequence, (amount, unit) in (('<Prior>', (-1, 'pages')), ('<Next>', (1, 'pages')),
+                                         ('<Up>', (-1, 'units')), ('<Down>', (1, 'units'))):
+            self.tree.bind(sequence, lambda event, amount=amount, unit=unit: self.scroll('scroll', amount, unit))
+
+    def resize(self, event):
+        self.rows = max(1, (event.height - HEADING_HEIGHT) // ROW_HEIGHT)
+        self.tree.configure(height=self.rows)
+        self.refresh()
+
+    def wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            return self.scroll('scroll', -3, 'units')
+        return self.scroll('scroll', 3, 'units')
+
+    def scroll(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.first = int(float(amount) * len(self.tokens))
+        else:
+            self.first += int(amount) * (self.rows if unit == 'pages' else 1)
+        self.refresh()
+        return 'break'
+
+    def location(self, offset):
+        line = bisect_left(self.newlines, offset)
+        return line + 1, offset - (self.newlines[line - 1] + 1 if line else 0) + 1
+
+    def refresh(self):
+        total = len(self.tokens)
+        self.first = max(0, min(self.first, total - self.rows))
+        last = min(total, self.first + self.rows)
+        self.tree.delete(*self.tree.get_children())
+        for index in range(self.first, last):
+            token = self.tokens[index]
+            self.tree.insert('', tk.END, values=(index, *self.location(token.start), token.token_type.name, token.lex))
+        if total:
+            self.scrollbar.set(self.first / total, last / total)
+        else:
+            self.scrollbar.set(0, 1)
 
 
 class PrologApp:
@@ -12,6 +265,12 @@ class PrologApp:
         self.root = root
         self.root.title("Enter Your Code")
         self.root.geometry("700x700")
+        self.dfa_images = {}
+        self.worker = ParseWorker()
+        self.job_ids = {}  # kind -> id of the job whose result is still wanted
+        self.live_validate = tk.BooleanVar(value=False)
+        self.validate_after = None
+        self.poll_after = None
 
         self.create_widgets()
 
@@ -44,69 +303,119 @@ class PrologApp:
         token_list = tk.Button(self.root, text="Token List", width=13, height=2, command=self.tokens_list_button)
         token_list.grid(row=1, column=4, sticky="nsew")
 
-    def operators_DFA_button(self):
-        op_dfa_window = tk.Toplevel(self.root)
-        op_dfa_window.geometry("700x700")
-        op_dfa_window.title("Operators DFA")
+        live = tk.Checkbutton(self.root, text="Live Validate", variable=self.live_validate,
+                              command=self.text_changed)
+        live.grid(row=2, column=0, sticky="w")
 
-        prolog_dfa.generate_dfa_operators()
+        self.status = tk.Label(self.root, anchor="w")
+        self.status.grid(row=2, column=1, columnspan=4, sticky="ew")
 
-        op_image = Image.open("dfa_output/operators.png")
-        op_image = op_image.resize((700, 700))
-        op_image = ImageTk.PhotoImage(op_image)
-        tk.Label(op_dfa_window, image=op_image).pack()
-        op_dfa_window.mainloop()
+        self.textarea.bind("<<Modified>>", self.text_changed)
+
+    def operators_DFA_button(self):
+        self.show_dfa("Operators DFA", 'dfa_operators')
 
     def res_DFA_button(self):
-        res_dfa_window = tk.Toplevel(self.root)
-        res_dfa_window.geometry("700x700")
-        res_dfa_window.title("Reserved Words DFA")
+        self.show_dfa("Reserved Words DFA", 'dfa_reserved_words')
 
-        prolog_dfa.generate_dfa_res()
+    def values_DFA_button(self):
+        self.show_dfa("Values DFA", 'dfa_values')
 
-        res_image = Image.open("dfa_output/reserved_words.png")
-        res_image = res_image.resize((700, 700))
-        res_image = ImageTk.PhotoImage(res_image)
-        tk.Label(res_dfa_window, image=res_image).pack()
-        res_dfa_window.mainloop()
+    def show_dfa(self, title, name):
+        import prolog_dfa
+        from PIL import Image, ImageTk
 
-    def values_DFA_button(self):
-        values_dfa_window = tk.Toplevel(self.root)
-        values_dfa_window.geometry("700x700")
-        values_dfa_window.title("Values DFA")
+        dfa_window = tk.Toplevel(self.root)
+        dfa_window.geometry("700x700")
+        dfa_window.title(title)
 
-        prolog_dfa.generate_dfa_values()
+        # renderings are cached in dfa_output, and resized images for this session here
+        if name not in self.dfa_images:
+            dfa_image = Image.open(prolog_dfa.render_dfa(name))
+            self.dfa_images[name] = ImageTk.PhotoImage(dfa_image.resize((700, 700)))
+        tk.Label(dfa_window, image=self.dfa_images[name]).pack()
+        dfa_window.mainloop()
 
-        values_image = Image.open("dfa_output/dfa_values.gv.png")
-        values_image = values_image.resize((700, 700))
-        values_image = ImageTk.PhotoImage(values_image)
-        tk.Label(values_dfa_window, image=values_image).pack()
-        values_dfa_window.mainloop()
+    def text_changed(self, event=None):
+        # results for the old text are stale: stop them, and re-validate once typing pauses
+        if event is not None:
+            if not self.textarea.edit_modified():
+                return  # the event for resetting the flag below
+            self.textarea.edit_modified(False)
+        self.worker.cancel()
+        self.job_ids.clear()
+        if self.validate_after is not None:
+            self.root.after_cancel(self.validate_after)
+            self.validate_after = None
+        if self.live_validate.get():
+            self.validate_after = self.root.after(VALIDATE_DELAY_MS, self.validate)
+        else:
+            self.status.config(text="")
 
-    def parse_tree_button(self):
-        input_text = self.textarea.get('1.0', 'end')
-        scanner = prolog_scanner.Scanner(input_text)
-        parser = prolog_parser.Parser(scanner)
+    def validate(self):
+        self.validate_after = None
+        self.start_job('validate')
+
+    def start_job(self, kind):
+        self.job_ids[kind] = self.worker.submit(kind, self.textarea.get('1.0', 'end'))
+        self.status.config(text="Parsing...")
+        if self.poll_after is None:
+            self.poll_results()
+
+    def poll_results(self):
+        self.poll_after = None
+        while True:
+            try:
+                job_id, kind, result = self.worker.results.get_nowait()
+            except queue.Empty:
+                break
+            if self.job_ids.get(kind) == job_id:
+                del self.job_ids[kind]
+                self.show_result(kind, result)
+        if self.worker.busy or not self.worker.results.empty():
+            self.poll_after = self.root.after(POLL_MS, self.poll_results)
 
-        parse_tree = parser.parse()
-        parse_tree.draw()
+    def show_result(self, kind, result):
+        if isinstance(result, Exception):
+            self.status.config(text=f"Parser stopped: {type(result).__name__}: {result}")
+            return
+        if kind == 'validate':
+            self.status.config(text=f"{len(result)} errors: {result[0]}" if result else "No errors")
+        else:
+            self.status.config(text="")
+        if kind == 'tree':
+            result.draw()
+        elif kind == 'tokens':
+            self.show_tokens(result)
+
+    def parse_tree_button(self):
+        self.start_job('tree')
 
     def tokens_list_button(self):
+        self.start_job('tokens')
+
+    def show_tokens(self, snapshot):
+        tokens, statistics, newlines = snapshot
+
         token_window = tk.Toplevel(self.root)
         token_window.geometry("700x700")
         token_window.title("Token List")
 
-        input_text = self.textarea.get('1.0', 'end')
-        scanner = prolog_scanner.Scanner(input_text)
-        tokens_list = scanner.tokens
-
-        tokens_dict = {str(item.token_type): set() for item in tokens_list}
-        for item in tokens_list:
-            tokens_dict[str(item.token_type)].add(item.lex)
-        tokens_df = pd.DataFrame.from_dict(tokens_dict, orient='index').transpose()
+        summary = ttk.Treeview(token_window, columns=('tokens', 'distinct', 'common'), height=8)
+        summary.heading('#0', text='Type')
+        summary.heading('tokens', text='Tokens')
+        summary.heading('distinct', text='Distinct')
+        summary.heading('common', text='Most common')
+        summary.column('#0', width=150, stretch=False)
+        summary.column('tokens', width=80, stretch=False)
+        summary.column('distinct', width=80, stretch=False)
+        for token_type in sorted(statistics.lexemes, key=lambda token_type: token_type.value):
+            lexemes = statistics.lexemes[token_type]
+            common = '  '.join(lex for lex, _ in lexemes.most_common(5))
+            summary.insert('', tk.END, text=token_type.name, values=(lexemes.total(), len(lexemes), common))
+        summary.pack(fill=tk.X)
 
-        token_table = pt.Table(token_window, dataframe=tokens_df)
-        token_table.show()
+        TokenTable(token_window, tokens, newlines)
 
         token_window.mainloop()
 
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the Prolog scanner and parser.
+
+Run a benchmark from the repository root, e.g. ``python -m benchmarks.lexer_throughput``.
+"""
@@ -0,0 +1,78 @@
+"""
+Time goal lookups in a FactDatabase as the number of facts grows.
+
+    python -m benchmarks.fact_lookup [--facts 1000000] [--lookups 2000] [--seed 0]
+
+For each size, from a thousandth of --facts up to --facts by powers of ten, one
+predicate edge(symbol, symbol) gets that many random facts. It then times goals with
+the first argument bound, such as edge(n17, X), and goals with only the second bound,
+such as edge(X, n17). The second kind scans every fact with the default first-argument
+index, and is looked up like the first with index_all=True (scans are timed on fewer
+goals). Times are microseconds per goal, fetching all of its answers. The last line
+loads the facts of a program from benchmarks.generator to time from_program().
+"""
+import argparse
+import random
+import time
+
+from benchmarks.generator import generate_program
+from benchmarks.scaling import best_of
+from prolog_engine import FactDatabase, Variable
+from prolog_parser import Parser
+from prolog_scanner import Scanner
+from prolog_tokens import Token_type
+
+X = Variable('X')
+
+
+def edges(count, seed):
+    choose = random.Random(seed).randrange
+    nodes = max(count // 4, 1)
+    return [((Token_type.identifier, f"n{choose(nodes)}"), (Token_type.identifier, f"n{choose(nodes)}"))
+            for _ in range(count)]
+
+
+def per_goal(database, goals, repeat=3):
+    def run():
+        for goal in goals:
+            for _ in database.solve('edge', goal):
+                pass
+    return best_of(repeat, run) / len(goals) * 1e6
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--facts', type=int, default=1000000)
+    arg_parser.add_argument('--lookups', type=int, default=2000)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    print(f"{'facts':>9} {'load s':>8} {'edge(n, X)':>12} {'edge(X, n) scan':>16} {'edge(X, n) all':>15}")
+    size = max(args.facts // 1000, 1)
+    while size <= args.facts:
+        facts = edges(size, args.seed)
+        started = time.perf_counter()
+        first_only = FactDatabase()
+        for fact in facts:
+            first_only.add('edge', fact)
+        load = time.perf_counter() - started
+        every = FactDatabase(index_all=True)
+        for fact in facts:
+            every.add('edge', fact)
+        picks = random.Random(args.seed + 1)
+        keys = [picks.choice(facts) for _ in range(args.lookups)]
+        bound_first = [(first, X) for first, _ in keys]
+        bound_second = [(X, second) for _, second in keys]
+        print(f"{size:>9} {load:>8.2f} {per_goal(first_only, bound_first):>10.2f}us "
+              f"{per_goal(first_only, bound_second[:max(args.lookups // 100, 3)], 1):>14.1f}us "
+              f"{per_goal(every, bound_second):>13.2f}us")
+        size *= 10
+
+    program = Parser(Scanner(generate_program(facts=100000, rules=100))).parse()
+    started = time.perf_counter()
+    database = FactDatabase.from_program(program)
+    print(f"from_program: {len(database)} facts of a generated program in {time.perf_counter() - started:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
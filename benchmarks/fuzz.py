@@ -0,0 +1,253 @@
+"""
+Fuzz the scanners and the parser with malformed programs, failing on any crash, hang or
+super-linear run.
+
+    python -m benchmarks.fuzz [--iterations 5000] [--seed 0] [--timeout 2] [--max-steps 600]
+        [--max-scan-steps 200] [--max-scan-us 10]
+
+The corpus starts with the programs in input.txt and a few from benchmarks.generator.
+Each input is a mutation of a corpus entry, made by inserting, deleting, replacing,
+repeating or splicing tokens, and then, half the time, by inserting raw characters
+that no whole token holds: unbalanced quotes, backslashes and comment openers, alone
+or repeated up to 4096 times. Parser.parse and Validator.validate run on it with and
+without semantic checks while a trace function counts the lines of prolog_parser that
+execute and the pairs of consecutive lines. An input that covers a new pair joins the
+corpus, so mutations work towards unexplored recovery paths.
+
+Every input is also lexed by scan_text, dfa_tokens, a TokenStream over its bytes and a
+streaming Scanner fed small chunks, which must all give the same tokens. The lines run
+in prolog_scanner and prolog_automaton are counted and their pairs join the coverage.
+The master regex and the program pre-scan run in C, out of the trace's sight, so they
+are timed instead.
+
+The run exits with status 1 if a parse raises, takes longer than --timeout seconds or
+executes more than --max-steps parser lines per token, beyond a fixed STARTUP_STEPS. It
+also fails when lexing runs more than --max-scan-steps lines per character, when the
+regexes take more than --max-scan-us microseconds per character beyond SCAN_STARTUP
+seconds, when the lexers disagree, or when Validator and Parser report different
+errors. A mutation can repeat tokens up to 64 times and raw characters up to 4096
+times, so work that grows faster than the input shows up as a high count. Failing
+inputs are written to --output.
+"""
+import argparse
+import os
+import random
+import signal
+import sys
+import time
+from collections import deque
+
+import prolog_automaton
+import prolog_parser
+import prolog_scanner
+from benchmarks.generator import generate_program
+from prolog_automaton import dfa_tokens
+from prolog_parser import Parser, Validator
+from prolog_scanner import PROGRAM_PATTERN, TOKEN_PATTERN, Scanner, TokenStream, program_offsets, scan_text
+from prolog_tokens import Operators, ReservedWords
+
+PARSER_FILES = (prolog_parser.__file__,)
+SCANNER_FILES = (prolog_scanner.__file__, prolog_automaton.__file__)
+STARTUP_STEPS = 2000
+SCAN_STARTUP = 0.05  # seconds the regexes may take on any input, for timer noise
+VOCABULARY = (list(ReservedWords) + list(Operators) +
+              ['run', 'graph', 'x', 'A', 'B', 'Num1', '_', '3', '2.5', '"s"', "'c'", '12ab', '{', '/*', '"'])
+RAW = ['"', "'", '\\', '/*', '*/', '//', '\n', '"\\', "'\\", '\\"', 'é']
+
+
+class Timeout(Exception):
+    pass
+
+
+class Tracer:
+    """
+    A sys.settrace function counting the lines run in the given files and collecting
+    the (file, previous line, line) triples seen.
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.arcs = set()
+        self.steps = 0
+        self.previous = 0
+
+    def __call__(self, frame, event, argument):
+        if frame.f_code.co_filename not in self.files:
+            return None
+        self.previous = 0
+        return self.line
+
+    def line(self, frame, event, argument):
+        if event == 'line':
+            self.steps += 1
+            self.arcs.add((frame.f_code.co_filename, self.previous, frame.f_lineno))
+            self.previous = frame.f_lineno
+        return self.line
+
+
+def raise_timeout(signum, frame):
+    raise Timeout()
+
+
+def lexed(tokens):
+    return [(token.lex, token.token_type, token.start, token.end) for token in tokens]
+
+
+def scan(text, chunk_size):
+    """
+    Lex text every way. Returns (seconds, steps, arcs, failure): the seconds the two
+    regexes took over it, the lines and arcs the Python lexers ran, and what went wrong
+    or None.
+    """
+    started = time.perf_counter()
+    deque(TOKEN_PATTERN.finditer(text), 0)
+    deque(PROGRAM_PATTERN.finditer(text), 0)
+    seconds = time.perf_counter() - started
+    tracer = Tracer(SCANNER_FILES)
+    sys.settrace(tracer)
+    try:
+        expected = lexed(scan_text(text))
+        program_offsets(text)
+        streamed = lexed(Scanner(text[offset:offset + chunk_size] for offset in range(0, len(text), chunk_size)).stream)
+        others = {'dfa_tokens': lexed(dfa_tokens(text)), 'a streaming Scanner': streamed}
+        if text.isascii():  # a TokenStream over bytes counts offsets in bytes
+            others['a TokenStream'] = lexed(TokenStream(text.encode()))
+        failure = next((f"{name} disagrees with scan_text" for name, tokens in others.items() if tokens != expected),
+                       None)
+    finally:
+        sys.settrace(None)
+    return seconds, tracer.steps, tracer.arcs, failure
+
+
+def run(text, timeout, chunk_size):
+    """
+    Lex, parse and validate text every way. Returns (tokens, steps, scan_steps,
+    scan_seconds, arcs, failure), where failure describes what went wrong or is None.
+    """
+    tracer = Tracer(PARSER_FILES)
+    tokens = 0
+    scan_seconds = scan_steps = 0
+    arcs = set()
+    failure = None
+    if hasattr(signal, 'setitimer'):
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        scan_seconds, scan_steps, arcs, failure = scan(text, chunk_size)
+        sys.settrace(tracer)
+        for semantic in (True, False):
+            if failure is not None:
+                break
+            scanner = Scanner(text)
+            tokens = len(scanner.tokens)
+            parser = Parser(scanner, semantic=semantic)
+            parser.parse()
+            diagnostics = Validator(Scanner(text, tokens=scanner.tokens), semantic=semantic).validate()
+            if [diagnostic.message for diagnostic in diagnostics] != parser.error_list:
+                failure = f"Validator disagrees with Parser (semantic={semantic})"
+    except Timeout:
+        failure = f"no result within {timeout} s"
+    except Exception as error:
+        failure = f"{type(error).__name__}: {error}"
+    finally:
+        sys.settrace(None)
+        if hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return tokens, tracer.steps, scan_steps, scan_seconds, arcs | tracer.arcs, failure
+
+
+def mutate(lexemes, corpus, rng):
+    """
+    Return a copy of a token list with a few random edits.
+    """
+    lexemes = list(lexemes)
+    for _ in range(rng.randint(1, 4)):
+        position = rng.randint(0, len(lexemes))
+        edit = rng.randrange(6)
+        if edit == 0:
+            lexemes.insert(position, rng.choice(VOCABULARY))
+        elif edit == 1 and lexemes:
+            del lexemes[position:position + rng.randint(1, 4)]
+        elif edit == 2 and position < len(lexemes):
+            lexemes[position] = rng.choice(VOCABULARY)
+        elif edit == 3:
+            lexemes[position:position] = lexemes[position:position + rng.randint(1, 8)] * rng.randint(1, 64)
+        elif edit == 4:
+            other = rng.choice(corpus)
+            lexemes[position:] = other[rng.randint(0, len(other)):]
+        else:
+            del lexemes[position:]
+    return lexemes
+
+
+def garble(text, rng):
+    """
+    Return text with a few raw characters inserted, some of them repeated many times.
+    """
+    for _ in range(rng.randint(1, 3)):
+        position = rng.randint(0, len(text))
+        raw = rng.choice(RAW) * (rng.choice((1, 1, 2, 64, 4096)))
+        text = text[:position] + raw + text[position:]
+    return text
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--input', default='input.txt')
+    arg_parser.add_argument('--iterations', type=int, default=5000)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--timeout', type=float, default=2, help='seconds allowed per input')
+    arg_parser.add_argument('--max-steps', type=int, default=600, help='parser lines allowed per token')
+    arg_parser.add_argument('--max-scan-steps', type=int, default=200, help='lexer lines allowed per character')
+    arg_parser.add_argument('--max-scan-us', type=float, default=10,
+                            help='microseconds per character allowed for the regexes')
+    arg_parser.add_argument('--output', default='fuzz-failures', help='directory for failing inputs')
+    args = arg_parser.parse_args()
+
+    if hasattr(signal, 'setitimer'):
+        signal.signal(signal.SIGALRM, raise_timeout)
+    rng = random.Random(args.seed)
+    with open(args.input) as source:
+        text = source.read()
+    offsets = program_offsets(text)
+    seeds = [text[start:end] for start, end in zip(offsets, offsets[1:] + [len(text)])]
+    seeds += [generate_program(facts=10, rules=4, seed=seed) for seed in range(4)]
+    corpus = [[token.lex for token in Scanner(seed).tokens] for seed in seeds]
+
+    covered = set()
+    failures = 0
+    worst = worst_scan = 0
+    for iteration in range(args.iterations):
+        lexemes = mutate(rng.choice(corpus), corpus, rng)
+        source = ' '.join(lexemes)
+        if rng.random() < 0.5:
+            source = garble(source, rng)
+        tokens, steps, scan_steps, scan_seconds, arcs, failure = run(source, args.timeout, rng.choice((1, 7, 64)))
+        characters = max(len(source), 1)
+        worst = max(worst, (steps - STARTUP_STEPS) / max(tokens, 1))
+        worst_scan = max(worst_scan, (scan_steps - STARTUP_STEPS) / characters)
+        if failure is None and steps > STARTUP_STEPS + args.max_steps * tokens:
+            failure = f"{steps} parser lines for {tokens} tokens"
+        if failure is None and scan_steps > STARTUP_STEPS + args.max_scan_steps * characters:
+            failure = f"{scan_steps} lexer lines for {characters} characters"
+        if failure is None and scan_seconds > SCAN_STARTUP + args.max_scan_us * 1e-6 * characters:
+            failure = f"the regexes took {scan_seconds:.3f} s for {characters} characters"
+        if failure is not None:
+            failures += 1
+            os.makedirs(args.output, exist_ok=True)
+            path = os.path.join(args.output, f"failure-{args.seed}-{iteration}.pl")
+            with open(path, 'w') as output:
+                output.write(source)
+            print(f"FAIL {path}: {failure}")
+        elif not arcs <= covered:
+            covered |= arcs
+            corpus.append(lexemes)
+
+    print(f"{args.iterations} inputs, corpus of {len(corpus)}, {len(covered)} line pairs covered, "
+          f"at most {worst:.1f} parser lines per token and {worst_scan:.1f} lexer lines per character, "
+          f"{failures} failures")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Generate grammar-valid Prolog programs of any size.
+
+    python -m benchmarks.generator [--facts 1000] [--predicates 20] [--rules 100] [--seed 0]
+
+Programs have predicates with mixed symbol/integer/char/string/real signatures, facts
+that match them, rules built from readint/readln/readchar, write and arithmetic or
+relational statements, and a goal. They parse without errors, so benchmarks measure
+the parser's normal path rather than its error recovery.
+"""
+import argparse
+import random
+import string
+
+DATA_TYPES = ('symbol', 'integer', 'char', 'string', 'real')
+
+
+def value(data_type, rng):
+    if data_type == 'symbol':
+        return rng.choice(string.ascii_lowercase) + str(rng.randrange(1000))
+    if data_type == 'integer':
+        return str(rng.randrange(100000))
+    if data_type == 'char':
+        return f"'{rng.choice(string.ascii_letters + string.digits)}'"
+    if data_type == 'string':
+        return '"' + ' '.join(rng.choice(('alpha', 'beta', 'gamma', 'delta')) for _ in range(rng.randint(1, 3))) + '"'
+    return f"{rng.randrange(1000)}.{rng.randrange(100)}"
+
+
+def rule_body(rng, variables):
+    """
+    Statements for one rule body, introducing fresh variables from the iterator
+    ``variables`` (the parser's variable table is shared by all rules).
+    """
+    first, second, third = next(variables), next(variables), next(variables)
+    statements = [
+        f'write("enter two numbers")',
+        f'readint({first})',
+        f'readint({second})',
+        f'{first} = {second} + {rng.randrange(1, 100)} * {first}',
+        f'{first} {rng.choice((">", "<", ">=", "<=", "<>"))} {second}',
+        rng.choice((f'readln({third})', f'readchar({third})', f'readint({third})')),
+        f'write("result", {first})',
+    ]
+    separators = [rng.choice((',', ',', ';')) for _ in statements[1:]]
+    return statements[0] + ''.join(f'{separator} {statement}'
+                                   for separator, statement in zip(separators, statements[1:]))
+
+
+def generate_program(facts=1000, predicates=20, rules=100, seed=0):
+    """
+    Return the text of a program with the given number of fact-bearing predicates,
+    facts and rules. Rules belong to zero-arity predicates, one of which is the goal.
+    """
+    rng = random.Random(seed)
+    signatures = {f'p{index}': [rng.choice(DATA_TYPES) for _ in range(rng.randint(1, 4))]
+                  for index in range(max(1, predicates))}
+    actions = [f'action{index}' for index in range(max(1, rules // 10 or 1))]
+    variables = (f'V{index}' for index in range(1, 1 << 62))
+
+    lines = ['predicates']
+    lines.extend(f'{name}({",".join(signature)})' for name, signature in signatures.items())
+    lines.extend(actions)
+    lines.append('')
+    lines.append('clauses')
+    names = list(signatures)
+    for _ in range(facts):
+        name = rng.choice(names)
+        lines.append(f'{name}({",".join(value(data_type, rng) for data_type in signatures[name])}).')
+    for index in range(rules):
+        lines.append(f'{actions[index % len(actions)]} :- {rule_body(rng, variables)}.')
+    lines.append('')
+    lines.append('goal')
+    lines.append(f'{actions[0]}.')
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--facts', type=int, default=1000)
+    arg_parser.add_argument('--predicates', type=int, default=20)
+    arg_parser.add_argument('--rules', type=int, default=100)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+    print(generate_program(args.facts, args.predicates, args.rules, args.seed), end='')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Check that the headless core starts fast and without GUI or plotting libraries.
+
+    python -m benchmarks.import_budget [--budget-ms 100] [--repeat 5]
+
+Imports each core module in a fresh interpreter under ``python -X importtime`` and exits
+with status 1 when it loads any of the libraries only the GUI, tree drawing or DFA
+rendering need, or when its cumulative import time (best of --repeat) exceeds the budget.
+"""
+import argparse
+import subprocess
+import sys
+
+CORE_MODULES = ('prolog_tokens', 'prolog_scanner', 'prolog_ast', 'prolog_metrics', 'prolog_grammar',
+                'prolog_parser', 'prolog_automaton', 'prolog_cache', 'prolog_serialize', 'prolog_lsp',
+                'prolog_engine', 'prolog_dfa')
+FORBIDDEN = ('tkinter', 'nltk', 'numpy', 'pandas', 'pandastable', 'graphviz', 'PIL', 'matplotlib')
+
+
+def import_times(module):
+    """
+    Return {imported module: cumulative microseconds} for a cold import of module.
+    """
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               capture_output=True, text=True, check=True)
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--budget-ms', type=float, default=100)
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    failures = []
+    for module in CORE_MODULES:
+        runs = [import_times(module) for _ in range(args.repeat)]
+        best = min(run[module] for run in runs) / 1000
+        loaded = sorted({name.split('.')[0] for run in runs for name in run} & set(FORBIDDEN))
+        print(f"{module:>16}: {best:7.1f} ms")
+        if loaded:
+            failures.append(f"{module} imports {', '.join(loaded)}")
+        if best > args.budget_ms:
+            failures.append(f"{module} takes {best:.1f} ms to import, over the {args.budget_ms:g} ms budget")
+    for failure in failures:
+        print(f"OVER BUDGET: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
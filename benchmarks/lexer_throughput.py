@@ -0,0 +1,93 @@
+"""
+Compare the single-pass master-regex lexer with the per-word cascade it replaced.
+
+    python -m benchmarks.lexer_throughput [--scale 1000] [--repeat 3]
+"""
+import argparse
+import re
+import time
+
+from prolog_scanner import Scanner
+from prolog_tokens import Token, Token_type, ReservedWords, Operators
+
+
+def legacy_find_tokens(text):
+    """
+    The original Scanner.find_tokens: two comment passes, then re.findall per line and
+    a cascade of re.match calls per word.
+    """
+    Tokens = []
+    lines = re.sub(re.compile(r"/\*.*?\*/", re.DOTALL), "", text)
+    lines = re.sub(re.compile(r"//.*?$", re.MULTILINE), "", lines)
+    inside_comment = False
+
+    for line in lines.split('\n'):
+        if '*/' in line and inside_comment:
+            inside_comment = False
+            continue
+        if inside_comment:
+            continue
+        if '/*' in line:
+            inside_comment = True
+            continue
+        words = re.findall(
+            r"[0-9]*[a-zA-Z_]+[0-9]*|[0-9]+(?:\.[0-9]+)?|'[a-zA-Z0-9]?'|\"(?:\\.|[^\"])*\"|<=|>=|<|:-|>|\.|<>|[(){};,\[\]=+\-*/]",
+            line)
+        for word in words:
+            if word.strip() == "":
+                continue
+            elif word in ReservedWords:
+                Tokens.append(Token(word, ReservedWords[word]))
+            elif word in Operators:
+                Tokens.append(Token(word, Operators[word]))
+            elif re.match(r"^[a-z][a-zA-Z0-9_]*$", word):
+                Tokens.append(Token(word, Token_type.identifier))
+            elif re.match(r"^[A-Z_][a-zA-Z0-9_]*$", word):
+                Tokens.append(Token(word, Token_type.variable))
+            elif re.match(r"^[0-9]+$", word):
+                Tokens.append(Token(word, Token_type.integer))
+            elif re.match(r"^'[a-zA-Z0-9]?'$", word):
+                Tokens.append(Token(word, Token_type.char))
+            elif re.match(r"^[0-9]+(\.[0-9]+)?$", word):
+                Tokens.append(Token(word, Token_type.real))
+            elif word.startswith('"') and word.endswith('"'):
+                Tokens.append(Token(word, Token_type.string))
+            else:
+                Tokens.append(Token(word, Token_type.error))
+    return Tokens
+
+
+def best_of(repeat, function, text):
+    best = None
+    tokens = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = function(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(tokens)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--input', default='input.txt')
+    arg_parser.add_argument('--scale', type=int, default=1000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    with open(args.input) as source:
+        text = source.read() * args.scale
+    print(f"input: {args.input} x{args.scale} ({len(text) / 1e6:.1f} MB)")
+
+    scanner = Scanner('')
+    results = [
+        ('legacy cascade', best_of(args.repeat, legacy_find_tokens, text)),
+        ('master regex', best_of(args.repeat, scanner.find_tokens, text)),
+    ]
+    for name, (elapsed, count) in results:
+        print(f"{name:>15}: {elapsed:8.3f} s  {count:>9} tokens  {count / elapsed / 1e6:6.2f} M tokens/s")
+    print(f"speedup: {results[0][1][0] / results[1][1][0]:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
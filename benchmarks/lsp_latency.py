@@ -0,0 +1,164 @@
+"""
+Time how long the language server takes to publish diagnostics after an edit.
+
+    python -m benchmarks.lsp_latency [--facts 2000] [--edits 200] [--seed 0]
+
+Starts `python -m prolog_parser lsp`, opens a program from benchmarks.generator (with
+a tenth as many rules as facts) and sends single-character didChange notifications at
+random places, alternately breaking a clause and restoring it. Each edit waits for its
+publishDiagnostics. Reports the median, 90th percentile and worst latency, and the time
+to the first diagnostics after opening. A go-to-definition request on the first clause
+checks that it lands on its declaration, and a document closed in a server run in
+this process must be freed by reference counting alone, with the collector disabled.
+"""
+import argparse
+import gc
+import io
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+import weakref
+
+from benchmarks.generator import generate_program
+from prolog_lsp import LanguageServer
+
+URI = 'file:///benchmark.pl'
+
+
+class Client:
+    def __init__(self):
+        self.process = subprocess.Popen([sys.executable, '-m', 'prolog_parser', 'lsp'],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.next_id = 0
+
+    def send(self, method, params, request=False):
+        message = {'jsonrpc': '2.0', 'method': method, 'params': params}
+        if request:
+            self.next_id += 1
+            message['id'] = self.next_id
+        body = json.dumps(message).encode()
+        self.process.stdin.write(b'Content-Length: %d\r\n\r\n' % len(body) + body)
+        self.process.stdin.flush()
+
+    def receive(self):
+        length = None
+        while True:
+            line = self.process.stdout.readline().strip()
+            if not line:
+                break
+            name, _, value = line.partition(b':')
+            if name.lower() == b'content-length':
+                length = int(value)
+        return json.loads(self.process.stdout.read(length))
+
+    def request(self, method, params):
+        self.send(method, params, request=True)
+        while True:
+            message = self.receive()
+            if message.get('id') == self.next_id:
+                return message['result']
+
+    def diagnostics(self, version):
+        while True:
+            message = self.receive()
+            if message.get('method') == 'textDocument/publishDiagnostics' and message['params']['version'] == version:
+                return message['params']['diagnostics']
+
+    def close(self):
+        self.request('shutdown', None)
+        self.send('exit', None)
+        return self.process.wait()
+
+
+def check_collected(text):
+    """
+    Open, edit and close text in a server run in this process, and raise RuntimeError
+    unless the closed document and its parser are freed without the cyclic collector.
+    """
+    server = LanguageServer(io.BytesIO(), io.BytesIO())
+    server.dispatch({'id': 1, 'method': 'initialize', 'params': {'capabilities': {}}})
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        server.dispatch({'method': 'textDocument/didOpen',
+                         'params': {'textDocument': {'uri': URI, 'version': 0, 'text': text}}})
+        server.publish_diagnostics()
+        change = {'range': {'start': {'line': 0, 'character': 0}, 'end': {'line': 0, 'character': 0}}, 'text': '('}
+        server.dispatch({'method': 'textDocument/didChange',
+                         'params': {'textDocument': {'uri': URI, 'version': 1}, 'contentChanges': [change]}})
+        server.publish_diagnostics()
+        document = weakref.ref(server.documents[URI])
+        parser = weakref.ref(server.documents[URI].parser)
+        server.dispatch({'method': 'textDocument/didClose', 'params': {'textDocument': {'uri': URI}}})
+        if document() is not None or parser() is not None:
+            raise RuntimeError("a closed document was kept alive by a reference cycle")
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--facts', type=int, default=2000)
+    arg_parser.add_argument('--edits', type=int, default=200)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    text = generate_program(facts=args.facts, rules=args.facts // 10)
+    lines = text.split('\n')
+    random_lines = random.Random(args.seed)
+    client = Client()
+    client.request('initialize', {'capabilities': {}})
+    client.send('initialized', {})
+    started = time.perf_counter()
+    client.send('textDocument/didOpen', {'textDocument': {'uri': URI, 'languageId': 'prolog', 'version': 0,
+                                                          'text': text}})
+    if client.diagnostics(0):
+        raise RuntimeError("the generated program should have no errors")
+    opened = time.perf_counter() - started
+
+    latencies = []
+    errors = 0
+    for version in range(1, args.edits + 1):
+        if version % 2:
+            line = random_lines.randrange(len(lines))
+            while not lines[line]:
+                line = random_lines.randrange(len(lines))
+            change = {'range': {'start': {'line': line, 'character': 0}, 'end': {'line': line, 'character': 0}},
+                      'text': '('}
+        else:
+            change = {'range': {'start': {'line': line, 'character': 0}, 'end': {'line': line, 'character': 1}},
+                      'text': ''}
+        started = time.perf_counter()
+        client.send('textDocument/didChange', {'textDocument': {'uri': URI, 'version': version},
+                                               'contentChanges': [change]})
+        diagnostics = client.diagnostics(version)
+        latencies.append(time.perf_counter() - started)
+        errors += bool(diagnostics)
+        if not version % 2 and diagnostics:
+            raise RuntimeError(f"restoring line {line} left {len(diagnostics)} errors")
+
+    clause = lines.index('clauses') + 1
+    location = client.request('textDocument/definition', {'textDocument': {'uri': URI},
+                                                           'position': {'line': clause, 'character': 1}})
+    status = client.close()
+
+    latencies.sort()
+    print(f"{args.facts} facts, {args.facts // 10} rules, {len(text)} characters")
+    print(f"first diagnostics after open: {opened * 1000:8.1f} ms")
+    print(f"after an edit: median {statistics.median(latencies) * 1000:.2f} ms, "
+          f"p90 {latencies[int(len(latencies) * 0.9)] * 1000:.2f} ms, worst {latencies[-1] * 1000:.2f} ms "
+          f"({errors} of {len(latencies)} edits had errors)")
+    name = lines[clause].split('(')[0]
+    if location is None or lines[location['range']['start']['line']].split('(')[0] != name:
+        raise RuntimeError(f"go to definition of {name} gave {location}")
+    print(f"definition of {name}: line {location['range']['start']['line']}; exit status {status}")
+    check_collected(text)
+    print("a closed document is freed without the cyclic collector")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+Time scanning, parsing and parse tree construction across program sizes.
+
+    python -m benchmarks.scaling [--sizes 2000,8000,32000] [--repeat 3] [--check | --save]
+
+Each size is the number of facts in a program from benchmarks.generator (with a tenth as
+many rules). Scanner.find_tokens, Parser.parse and display_parse_tree are timed
+separately, best of --repeat with the garbage collector paused as timeit does, and
+reported as tokens per second together with each phase's scaling exponent: the slope
+of log time over log tokens from the smallest size to the largest, about 1 for linear
+work.
+
+Throughputs depend on the machine and on what else it is running, so the baseline
+records ratios instead: each phase's time per token as a multiple of calibrate(), a
+fixed interpreter-bound loop timed next to it (in millionths), and each phase's
+exponent. --save stores them, and --check exits with status 1 when a phase's cost,
+averaged geometrically over the sizes, is more than --tolerance above its baseline,
+when it scales more than --exponent-band above its baseline exponent, or when it
+scales worse than --max-exponent.
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import sys
+import time
+
+from benchmarks.generator import generate_program
+from prolog_parser import Parser
+from prolog_scanner import Scanner
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+PHASES = ('scan', 'parse', 'tree')
+
+
+def best_of(repeat, function):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate(repeat):
+    """
+    Seconds for a fixed mix of the dict lookups, attribute reads, string slicing and
+    calls the scanner and parser spend their time on.
+    """
+    class Item:
+        __slots__ = ('name', 'kind')
+
+        def __init__(self, name, kind):
+            self.name = name
+            self.kind = kind
+
+    words = [f"word{index % 97}" for index in range(1000)]
+    table = {word: index for index, word in enumerate(words)}
+
+    def loop():
+        for _ in range(50):
+            items = [Item(word[:5], table[word]) for word in words]
+            sum(item.kind for item in items if item.name)
+
+    return best_of(repeat, loop)
+
+
+def measure(size, repeat):
+    """
+    Return (tokens, {phase: seconds}) for a generated program of ``size`` facts.
+    """
+    text = generate_program(facts=size, rules=size // 10)
+    tokens = Scanner('').find_tokens(text)
+    parsers = [None]
+
+    def parse():
+        parsers[-1] = None
+        parser = Parser(Scanner(text, tokens=tokens))
+        parser.parse()
+        parsers[-1] = parser
+
+    timings = {
+        'scan': best_of(repeat, lambda: Scanner('').find_tokens(text)),
+        'parse': best_of(repeat, parse),
+    }
+    if parsers[-1].error_list:
+        raise RuntimeError(f"generated program of size {size} does not parse: {parsers[-1].error_list[:3]}")
+    timings['tree'] = best_of(repeat, parsers[-1].display_parse_tree)
+    return len(tokens), timings
+
+
+def exponent(points):
+    """
+    Slope of log(seconds) over log(tokens) between the first and last (tokens, seconds).
+    """
+    (small_tokens, small_time), (large_tokens, large_time) = points[0], points[-1]
+    return math.log(large_time / small_time) / math.log(large_tokens / small_tokens)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--sizes', default='2000,8000,32000')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--baseline', default=BASELINE)
+    arg_parser.add_argument('--tolerance', type=float, default=0.35)
+    arg_parser.add_argument('--exponent-band', type=float, default=0.15)
+    arg_parser.add_argument('--max-exponent', type=float, default=1.25)
+    mode = arg_parser.add_mutually_exclusive_group()
+    mode.add_argument('--check', action='store_true')
+    mode.add_argument('--save', action='store_true')
+    args = arg_parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    relative = {phase: {} for phase in PHASES}
+    points = {phase: [] for phase in PHASES}
+    print(f"{'size':>8} {'tokens':>9}" + ''.join(f" {phase + ' s':>9} {'M tok/s':>8} {'cost':>8}"
+                                              for phase in PHASES))
+    for size in sizes:
+        tokens, timings = measure(size, args.repeat)
+        unit = calibrate(args.repeat)
+        row = f"{size:>8} {tokens:>9}"
+        for phase in PHASES:
+            relative[phase][str(size)] = round(timings[phase] / tokens / unit * 1e6, 3)
+            points[phase].append((tokens, timings[phase]))
+            row += f" {timings[phase]:9.3f} {tokens / timings[phase] / 1e6:8.3f} {relative[phase][str(size)]:8.3f}"
+        print(row)
+    print("cost: time per token in millionths of calibrate()")
+
+    failures = []
+    slopes = {}
+    if len(sizes) > 1:
+        for phase in PHASES:
+            slopes[phase] = round(exponent(points[phase]), 3)
+            print(f"{phase:>5} scaling exponent: {slopes[phase]:.2f}")
+            if slopes[phase] > args.max_exponent:
+                failures.append(f"{phase} scales with exponent {slopes[phase]:.2f} > {args.max_exponent}")
+
+    if args.save:
+        with open(args.baseline, 'w') as output:
+            json.dump({'relative_cost': relative, 'exponent': slopes}, output, indent=2, sort_keys=True)
+            output.write('\n')
+        print(f"baseline saved to {args.baseline}")
+    elif args.check:
+        with open(args.baseline) as source:
+            baseline = json.load(source)
+        for phase in PHASES:
+            ratios = [relative[phase][size] / expected
+                      for size, expected in baseline['relative_cost'].get(phase, {}).items() if size in relative[phase]]
+            if ratios:
+                ratio = math.exp(sum(map(math.log, ratios)) / len(ratios))
+                print(f"{phase:>5} cost against the baseline: {ratio:.2f}")
+                if ratio > 1 + args.tolerance:
+                    failures.append(f"{phase} costs {ratio:.2f} times its baseline")
+            # an exponent is only comparable over the sizes it was measured across
+            expected = baseline['exponent'].get(phase)
+            same_sizes = set(baseline['relative_cost'].get(phase, {})) == set(relative[phase])
+            if phase in slopes and expected is not None and same_sizes and slopes[phase] > expected + args.exponent_band:
+                failures.append(f"{phase} scales with exponent {slopes[phase]:.2f}, baseline {expected:.2f}")
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
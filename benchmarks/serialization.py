@@ -0,0 +1,61 @@
+"""
+Compare the binary tree format and JSON with pickle in time and size.
+
+    python -m benchmarks.serialization [--facts 60000] [--repeat 3]
+
+The tree is Parser.parse's result for a program from benchmarks.generator (with about
+an eighth as many rules as facts; the default gives about a million nodes). Times are
+best of --repeat with the garbage collector paused. 'read' opens the binary data and
+builds the whole program from it; 'units' builds one unit at a time and drops it.
+"""
+import argparse
+import io
+import pickle
+
+from benchmarks.generator import generate_program
+from benchmarks.scaling import best_of
+from prolog_parser import Parser
+from prolog_scanner import Scanner
+from prolog_serialize import TreeReader, dump, write_json
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--facts', type=int, default=60000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    program = Parser(Scanner(generate_program(facts=args.facts, rules=args.facts // 8))).parse()
+    pickled = pickle.dumps(program, protocol=pickle.HIGHEST_PROTOCOL)
+    output = io.BytesIO()
+    dump(program, output)
+    binary = output.getvalue()
+    text = io.StringIO()
+    write_json(program, text)
+
+    def write_binary():
+        dump(program, io.BytesIO())
+
+    def units():
+        for _ in TreeReader(binary).units():
+            pass
+
+    rows = [
+        ('pickle', best_of(args.repeat, lambda: pickle.dumps(program, protocol=pickle.HIGHEST_PROTOCOL)),
+         best_of(args.repeat, lambda: pickle.loads(pickled)), len(pickled)),
+        ('binary', best_of(args.repeat, write_binary),
+         best_of(args.repeat, lambda: TreeReader(binary).program), len(binary)),
+        ('binary, units', None, best_of(args.repeat, units), None),
+        ('JSON', best_of(args.repeat, lambda: write_json(program, io.StringIO())), None, len(text.getvalue())),
+    ]
+
+    print(f"{args.facts} facts, {args.facts // 8} rules, {len(TreeReader(binary))} nodes")
+    for name, write_seconds, read_seconds, size in rows:
+        write = f"write {write_seconds * 1000:9.1f} ms" if write_seconds is not None else ' ' * 19
+        read = f"read {read_seconds * 1000:9.1f} ms" if read_seconds is not None else ' ' * 18
+        bytes_ = f"{size / 1e6:8.2f} MB" if size is not None else ''
+        print(f"{name:>14}: {write}  {read}  {bytes_}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Load-test the parse service with many concurrent clients sending repeated sources.
+
+    python -m benchmarks.service_load [--requests 2000] [--clients 32] [--distinct 40]
+        [--facts 200] [--workers N] [--socket PATH] [--cold 10]
+
+Without --socket it starts `python -m prolog_parser serve` on a temporary unix socket
+and stops it afterwards. --distinct programs from benchmarks.generator (every fifth
+with a character removed, so it has errors) are sent --requests times in all, picked at
+random, by --clients connections that each wait for an answer before sending again.
+Every answer is checked against parse_source() run here. Reports throughput, client
+latency percentiles, the share of coalesced answers and the service's own statistics.
+With --cold N, also times N runs of one fresh `python -m prolog_parser programs`
+process per source, the cost the service replaces.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import generate_program
+from prolog_parser import parse_source
+from prolog_service import percentile
+
+
+def sources(distinct, facts, seed):
+    programs = []
+    for index in range(distinct):
+        text = generate_program(facts=facts, rules=max(facts // 10, 1), seed=seed + index)
+        if index % 5 == 4:
+            cut = random.Random(index).randrange(len(text))
+            text = text[:cut] + text[cut + 1:]
+        programs.append(text)
+    return programs
+
+
+async def client(socket_path, programs, picks, expected, latencies, counts):
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=1 << 26)
+    for number, pick in enumerate(picks):
+        started = time.perf_counter()
+        writer.write(json.dumps({'id': number, 'source': programs[pick]}).encode() + b'\n')
+        await writer.drain()
+        answer = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - started)
+        if answer.get('id') != number or answer.get('errors') != expected[pick]:
+            raise RuntimeError(f"wrong answer for program {pick}: {answer}")
+        counts['coalesced'] += answer['coalesced']
+    writer.close()
+    await writer.wait_closed()
+
+
+async def stats(socket_path):
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    writer.write(b'{"id": "stats", "stats": true}\n')
+    answer = json.loads(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+    return answer
+
+
+async def load(socket_path, programs, expected, requests, clients, seed):
+    picks = random.Random(seed)
+    per_client = [[picks.randrange(len(programs)) for _ in range(requests // clients)] for _ in range(clients)]
+    latencies = []
+    counts = {'coalesced': 0}
+    started = time.perf_counter()
+    await asyncio.gather(*(client(socket_path, programs, picked, expected, latencies, counts)
+                           for picked in per_client))
+    elapsed = time.perf_counter() - started
+    return elapsed, sorted(latencies), counts['coalesced'], await stats(socket_path)
+
+
+def wait_for(path, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError("the service did not start")
+        time.sleep(0.05)
+
+
+def cold_seconds(programs, runs):
+    """
+    Seconds per source for a fresh interpreter parsing one source and exiting.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'source.pl')
+        started = time.perf_counter()
+        for run in range(runs):
+            with open(path, 'w') as output:
+                output.write(programs[run % len(programs)])
+            subprocess.run([sys.executable, '-m', 'prolog_parser', 'programs', path, '--workers', '1'],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return (time.perf_counter() - started) / runs
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--requests', type=int, default=2000)
+    arg_parser.add_argument('--clients', type=int, default=32)
+    arg_parser.add_argument('--distinct', type=int, default=40)
+    arg_parser.add_argument('--facts', type=int, default=200)
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    arg_parser.add_argument('--socket', metavar='PATH', help='use a service already listening here')
+    arg_parser.add_argument('--cold', type=int, default=0, metavar='N')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    programs = sources(args.distinct, args.facts, args.seed)
+    expected = [parse_source(program)['errors'] for program in programs]
+    service = None
+    with tempfile.TemporaryDirectory() as directory:
+        socket_path = args.socket
+        if socket_path is None:
+            socket_path = os.path.join(directory, 'service.sock')
+            service = subprocess.Popen([sys.executable, '-m', 'prolog_parser', 'serve', '--socket', socket_path,
+                                        '--workers', str(args.workers)], stderr=subprocess.DEVNULL)
+            wait_for(socket_path, service)
+        try:
+            elapsed, latencies, coalesced, service_stats = asyncio.run(
+                load(socket_path, programs, expected, args.requests, args.clients, args.seed))
+        finally:
+            if service is not None:
+                service.send_signal(signal.SIGINT)  # as Ctrl-C does, so the service shuts its pool down
+                service.wait()
+
+    answered = len(latencies)
+    print(f"{answered} requests of {args.distinct} distinct programs ({args.facts} facts each), "
+          f"{args.clients} clients")
+    print(f"{answered / elapsed:9.1f} requests/s; latency p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+          f"p90 {percentile(latencies, 0.9) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms; "
+          f"{coalesced / answered:.0%} coalesced")
+    print(f"service: {json.dumps({key: value for key, value in service_stats.items() if key != 'id'})}")
+    if args.cold:
+        seconds = cold_seconds(programs, args.cold)
+        print(f"a cold process per source: {seconds * 1000:.1f} ms each, {1 / seconds:.1f} sources/s")
+
+
+if __name__ == '__main__':
+    main()
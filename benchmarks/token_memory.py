@@ -0,0 +1,69 @@
+"""
+Report memory per token for a list of Token objects versus the compact TokenStream.
+
+    python -m benchmarks.token_memory [--scale 1000]
+"""
+import argparse
+import os
+import tempfile
+import tracemalloc
+
+from prolog_scanner import Scanner
+from prolog_tokens import Token
+
+
+class DictToken:
+    """
+    A Token as it was before __slots__: one instance __dict__ per token.
+    """
+
+    def __init__(self, lex, token_type):
+        self.lex = lex
+        self.token_type = token_type
+
+
+def traced(build):
+    tracemalloc.start()
+    try:
+        result = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--input', default='input.txt')
+    arg_parser.add_argument('--scale', type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    with open(args.input) as source:
+        text = source.read() * args.scale
+    with tempfile.NamedTemporaryFile('w', suffix='.pl', delete=False) as scaled:
+        scaled.write(text)
+    try:
+        tokens = Scanner(text).tokens
+        count = len(tokens)
+        rows = []
+        # copy each lexeme so the strings are counted, as the scanner allocates them
+        legacy, size = traced(lambda: [DictToken((token.lex + ' ')[:-1], token.token_type) for token in tokens])
+        rows.append(('list of dict Tokens', size))
+        del legacy
+        slotted, size = traced(lambda: [Token((token.lex + ' ')[:-1], token.token_type) for token in tokens])
+        rows.append(('list of __slots__ Tokens', size))
+        del slotted, tokens
+        stream, size = traced(lambda: Scanner.from_file(scaled.name).tokens)
+        rows.append(('mmap TokenStream', size))
+        assert len(stream) == count
+        del stream
+    finally:
+        os.unlink(scaled.name)
+
+    print(f"input: {args.input} x{args.scale}, {count} tokens")
+    for name, size in rows:
+        print(f"{name:>25}: {size / 1e6:8.1f} MB  {size / count:6.1f} bytes/token")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare Validator.validate with Parser.parse in time and memory.
+
+    python -m benchmarks.validation [--facts 100000] [--repeat 3]
+
+Both run over the same pre-scanned tokens of a program from benchmarks.generator (with a
+tenth as many rules as facts). Times are best of --repeat with the garbage collector
+paused. Memory is the tracemalloc peak above the tokens: the syntax tree for parse(),
+the diagnostics and symbol tables for validate(). The last row validates a streaming
+Scanner over the text, so the tokens are never all held at once.
+"""
+import argparse
+import tracemalloc
+
+from benchmarks.generator import generate_program
+from benchmarks.scaling import best_of
+from prolog_parser import Parser, Validator
+from prolog_scanner import CHUNK_SIZE, Scanner
+
+
+def peak(function):
+    tracemalloc.start()
+    try:
+        function()
+        _, size = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--facts', type=int, default=100000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    text = generate_program(facts=args.facts, rules=args.facts // 10)
+    tokens = Scanner(text).tokens
+
+    def parse():
+        parser = Parser(Scanner(text, tokens=tokens))
+        parser.parse()
+        return parser.error_list
+
+    def validate():
+        return [diagnostic.message for diagnostic in Validator(Scanner(text, tokens=tokens)).validate()]
+
+    if parse() != validate():
+        raise RuntimeError("Validator and Parser disagree on the generated program")
+    rows = [
+        ('Parser.parse', best_of(args.repeat, parse), peak(parse)),
+        ('Validator.validate', best_of(args.repeat, validate), peak(validate)),
+        # a StringIO would copy the whole text inside the measurement
+        ('Validator, streaming', None, peak(lambda: Validator(Scanner(
+            text[offset:offset + CHUNK_SIZE] for offset in range(0, len(text), CHUNK_SIZE))).validate())),
+    ]
+
+    print(f"{args.facts} facts, {args.facts // 10} rules, {len(tokens)} tokens")
+    for name, seconds, size in rows:
+        timing = f"{seconds * 1000:9.1f} ms" if seconds is not None else ' ' * 12
+        print(f"{name:>22}: {timing}  {size / 1e6:8.2f} MB peak")
+
+
+if __name__ == '__main__':
+    main()
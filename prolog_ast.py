@@ -0,0 +1,236 @@
+"""
+Abstract syntax tree built directly by the parser.
+
+Every node keeps the tokens it was parsed from and, in ``children``, the labelled leaves
+and subtrees in source order. Conversion to an nltk Tree only happens in to_tree(), when
+the tree is actually drawn. pack() and unpack() flatten a tree into arrays and back.
+"""
+from array import array
+
+
+class BaseNode:
+    """
+    What subtrees and leaves share. It has no slots, so a Leaf carries no children list.
+    """
+    __slots__ = ()
+    label = ''
+
+    def to_tree(self):
+        """
+        Convert this subtree to an nltk Tree.
+        """
+        from nltk.tree import Tree
+        return _to_tree(self, Tree)
+
+    def draw(self):
+        self.to_tree().draw()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.label!r}, {len(self.children)} children)"
+
+
+class Node(BaseNode):
+    __slots__ = ('children',)
+
+    def __init__(self):
+        self.children = []
+
+
+class Leaf(BaseNode):
+    """
+    A labelled terminal such as 'Predicate ID', 'Value', '(' or 'Error', with its token.
+    """
+    __slots__ = ('label', 'token')
+
+    def __init__(self, label, token=None):
+        self.label = label
+        self.token = token
+
+    @property
+    def children(self):
+        return ()
+
+    def __reduce__(self):
+        return Leaf, (self.label, self.token)
+
+
+class Program(Node):
+    __slots__ = ()
+    label = 'Program'
+
+    def sections(self, node_type):
+        return [child for child in self.children if isinstance(child, node_type)]
+
+    @property
+    def predicates(self):
+        return [child for section in self.sections(Section) for child in section.children
+                if isinstance(child, PredicateDecl)]
+
+    @property
+    def clauses(self):
+        return [child for section in self.sections(Section) for child in section.children
+                if isinstance(child, (Fact, Rule))]
+
+    @property
+    def goal(self):
+        goals = self.sections(Goal)
+        return goals[0] if goals else None
+
+
+class Section(Node):
+    """
+    The 'Predicates' or 'Clauses' section of a program.
+    """
+    __slots__ = ('label',)
+
+    def __init__(self, label):
+        super().__init__()
+        self.label = label
+
+
+class PredicateDecl(Node):
+    __slots__ = ('name', 'parameters')
+    label = 'Predicate Declaration'
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.parameters = []  # data type tokens
+
+
+class Fact(Node):
+    __slots__ = ('name', 'arguments')
+    label = 'Fact'
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.arguments = []  # value tokens
+
+
+class Rule(Node):
+    __slots__ = ('name', 'body')
+    label = 'Rule'
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.body = []  # Statement nodes
+
+
+class Statement(Node):
+    """
+    A statement in a rule body: 'write statement', 'read statement' or an arithmetic
+    or relational 'Statement'.
+    """
+    __slots__ = ('label', 'tokens')
+
+    def __init__(self, label):
+        super().__init__()
+        self.label = label
+        self.tokens = []
+
+
+class Goal(Node):
+    __slots__ = ('name', 'arguments')
+    label = 'Goal'
+
+    def __init__(self):
+        super().__init__()
+        self.name = None
+        self.arguments = []
+
+
+def _to_tree(node, Tree):
+    return Tree(node.label, [_to_tree(child, Tree) for child in node.children])
+
+
+NODE_TYPES = (Leaf, Program, Section, PredicateDecl, Fact, Rule, Statement, Goal)
+NODE_CODES = {node_type: code for code, node_type in enumerate(NODE_TYPES)}
+
+
+def pack(program, token_index):
+    """
+    Flatten a tree into preorder arrays. Returns (labels, kinds, label_ids, tokens, sizes):
+    the distinct labels, and per node its type code, label number, token number
+    (token_index(token) for a leaf's token or a unit's name, -1 for none) and number of
+    children.
+    """
+    labels = {}
+    kinds, label_ids, tokens, sizes = array('B'), array('H'), array('i'), array('I')
+    add_kind, add_label, add_token, add_size = kinds.append, label_ids.append, tokens.append, sizes.append
+    stack = [program]
+    pop, push = stack.pop, stack.extend
+    while stack:
+        node = pop()
+        node_type = type(node)
+        add_kind(NODE_CODES[node_type])
+        label = node.label
+        number = labels.get(label)
+        if number is None:
+            number = labels[label] = len(labels)
+        add_label(number)
+        if node_type is Leaf:
+            token = node.token
+            add_size(0)
+        else:
+            token = getattr(node, 'name', None)
+            add_size(len(node.children))
+            push(reversed(node.children))
+        add_token(-1 if token is None else token_index(token))
+    return list(labels), kinds, label_ids, tokens, sizes
+
+
+def unpack(labels, kinds, label_ids, tokens, sizes, token_at):
+    """
+    Rebuild the tree pack() flattened, with token_at(number) giving back each token.
+    """
+    root = None
+    open_nodes = []  # [node, children still to come]
+    for index in range(len(kinds)):
+        node_type = NODE_TYPES[kinds[index]]
+        label = labels[label_ids[index]]
+        token = None if tokens[index] < 0 else token_at(tokens[index])
+        node = make_node(node_type, label, token)
+        if open_nodes:
+            parent = open_nodes[-1]
+            attach(parent[0], node)
+            parent[1] -= 1
+            while open_nodes and open_nodes[-1][1] == 0:
+                open_nodes.pop()
+        else:
+            root = node
+        if sizes[index]:
+            open_nodes.append([node, sizes[index]])
+    return root
+
+
+def make_node(node_type, label, token):
+    """
+    Build a node without children from what pack() keeps of it: its type, label and
+    token (a leaf's token or a unit's name, or None).
+    """
+    if node_type is Leaf:
+        return Leaf(label, token)
+    if node_type is Section or node_type is Statement:
+        return node_type(label)
+    if node_type is Program or node_type is Goal:
+        node = node_type()
+        if token is not None:
+            node.name = token
+        return node
+    return node_type(token)
+
+
+def attach(parent, node):
+    """
+    Append node to the children of parent, and to the statements, parameters or
+    arguments it also belongs to.
+    """
+    parent.children.append(node)
+    if isinstance(node, Statement) and isinstance(parent, Rule):
+        parent.body.append(node)
+    elif node.label == 'Data Type' and isinstance(parent, PredicateDecl):
+        parent.parameters.append(node.token)
+    elif (node.label == 'Value' or node.label == 'Variable') and isinstance(parent, (Fact, Goal)):
+        parent.arguments.append(node.token)
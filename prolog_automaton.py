@@ -0,0 +1,419 @@
+"""
+Table-driven DFA for the Prolog token set.
+
+The token specification (ReservedWords, Operators, ValuePatterns and CommentPatterns in
+prolog_tokens) is compiled into a minimized DFA whose transitions live in flat arrays.
+DFAScanner lexes by walking those tables, and prolog_dfa draws the same tables.
+
+Lexing is linear in the length of the text. Maximal munch backs up to the end of the
+longest token found, but the specification gives every unfinished token a short way
+to accept or die (an unclosed string is an error token up to the end of its line), so
+Automaton.lookahead() bounds the characters read twice; the module checks it on import.
+"""
+from array import array
+
+from prolog_scanner import Scanner
+from prolog_tokens import Token, Token_type, ReservedWords, Operators, ValuePatterns, CommentPatterns, SymbolTable
+
+ASCII = 128
+OTHER = ASCII  # every character outside ASCII shares one input symbol
+SYMBOLS = frozenset(range(ASCII + 1))
+
+DEAD = 0
+START = 1
+
+
+class PatternError(ValueError):
+    pass
+
+
+class _NFA:
+    def __init__(self):
+        self.edges = []  # per state: list of (symbol set or None for epsilon, target)
+
+    def new_state(self):
+        self.edges.append([])
+        return len(self.edges) - 1
+
+    def add_edge(self, source, symbols, target):
+        self.edges[source].append((symbols, target))
+
+
+class _PatternParser:
+    """
+    Recursive-descent parser for the regular-expression subset used by the token
+    specification, building Thompson fragments (start, end) into an _NFA.
+    """
+
+    def __init__(self, nfa, pattern):
+        self.nfa = nfa
+        self.pattern = pattern
+        self.pos = 0
+
+    def parse(self):
+        fragment = self.alternation()
+        if self.pos != len(self.pattern):
+            raise PatternError(f"Unexpected {self.pattern[self.pos]!r} at {self.pos} in {self.pattern!r}")
+        return fragment
+
+    def peek(self):
+        return self.pattern[self.pos] if self.pos < len(self.pattern) else None
+
+    def alternation(self):
+        fragments = [self.sequence()]
+        while self.peek() == '|':
+            self.pos += 1
+            fragments.append(self.sequence())
+        if len(fragments) == 1:
+            return fragments[0]
+        start, end = self.nfa.new_state(), self.nfa.new_state()
+        for first, last in fragments:
+            self.nfa.add_edge(start, None, first)
+            self.nfa.add_edge(last, None, end)
+        return start, end
+
+    def sequence(self):
+        start = end = self.nfa.new_state()
+        while self.peek() not in (None, '|', ')'):
+            first, last = self.quantified()
+            self.nfa.add_edge(end, None, first)
+            end = last
+        return start, end
+
+    def quantified(self):
+        first, last = self.atom()
+        quantifier = self.peek()
+        if quantifier not in ('*', '+', '?'):
+            return first, last
+        self.pos += 1
+        start, end = self.nfa.new_state(), self.nfa.new_state()
+        self.nfa.add_edge(start, None, first)
+        self.nfa.add_edge(last, None, end)
+        if quantifier in ('*', '?'):
+            self.nfa.add_edge(start, None, end)
+        if quantifier in ('*', '+'):
+            self.nfa.add_edge(last, None, first)
+        return start, end
+
+    def atom(self):
+        char = self.peek()
+        if char == '(':
+            self.pos += 3 if self.pattern.startswith('(?:', self.pos) else 1
+            fragment = self.alternation()
+            if self.peek() != ')':
+                raise PatternError(f"Missing ')' in {self.pattern!r}")
+            self.pos += 1
+            return fragment
+        if char == '[':
+            symbols = self.char_class()
+        elif char == '\\':
+            symbols = frozenset((self.escape(),))
+        elif char in ('*', '+', '?', ')', '.'):
+            raise PatternError(f"Unsupported {char!r} at {self.pos} in {self.pattern!r}")
+        else:
+            self.pos += 1
+            symbols = frozenset((_symbol(char),))
+        start, end = self.nfa.new_state(), self.nfa.new_state()
+        self.nfa.add_edge(start, symbols, end)
+        return start, end
+
+    def escape(self):
+        self.pos += 2
+        char = self.pattern[self.pos - 1]
+        return _symbol({'n': '\n', 't': '\t', 'r': '\r'}.get(char, char))
+
+    def char_class(self):
+        self.pos += 1
+        negated = self.peek() == '^'
+        if negated:
+            self.pos += 1
+        symbols = set()
+        while self.peek() != ']':
+            if self.peek() is None:
+                raise PatternError(f"Missing ']' in {self.pattern!r}")
+            low = self.escape() if self.peek() == '\\' else self.single()
+            if self.peek() == '-' and self.pattern[self.pos + 1] != ']':
+                self.pos += 1
+                high = self.escape() if self.peek() == '\\' else self.single()
+                symbols.update(range(low, high + 1))
+            else:
+                symbols.add(low)
+        self.pos += 1
+        return SYMBOLS - symbols if negated else frozenset(symbols)
+
+    def single(self):
+        self.pos += 1
+        return _symbol(self.pattern[self.pos - 1])
+
+
+def _symbol(char):
+    code = ord(char)
+    return code if code < ASCII else OTHER
+
+
+class Automaton:
+    """
+    A minimized DFA stored in flat arrays.
+
+    ``class_map[symbol]`` gives the input class of an ASCII code (index ``OTHER`` for
+    everything else), ``transitions[state * n_classes + input_class]`` the next state,
+    and ``accepts[state]`` the index into ``kinds`` of the token the state accepts, or -1.
+    State 0 is the dead state and state 1 the start state.
+    """
+
+    def __init__(self, kinds, class_map, transitions, accepts):
+        self.kinds = kinds
+        self.class_map = class_map
+        self.n_classes = max(class_map) + 1
+        self.transitions = transitions
+        self.accepts = accepts
+        self.n_states = len(accepts)
+
+    def next_state(self, state, char):
+        code = ord(char)
+        return self.transitions[state * self.n_classes + self.class_map[code if code < ASCII else OTHER]]
+
+    def lookahead(self):
+        """
+        The most characters a scan can read past the end of the longest token found so
+        far before it stops: the longest path through states that do not accept. None if
+        such a path can loop, when maximal munch could rescan without bound.
+        """
+        longest = {}  # state -> longest path of non-accepting states from it; -1 while visited
+
+        def walk(state):
+            if state in longest:
+                return longest[state]
+            longest[state] = -1
+            best = 0
+            for input_class in range(self.n_classes):
+                target = self.transitions[state * self.n_classes + input_class]
+                if target == DEAD or self.accepts[target] >= 0:
+                    continue
+                length = walk(target)
+                if length is None or length < 0:
+                    longest[state] = None
+                    return None
+                best = max(best, length + 1)
+            longest[state] = best
+            return best
+
+        lengths = [walk(state) for state in range(START, self.n_states)]
+        return None if None in lengths else max(lengths) + 1
+
+    def edges(self):
+        """
+        Yield (source, target, symbols) for every live transition, merging the input
+        classes that lead to the same target.
+        """
+        members = [[] for _ in range(self.n_classes)]
+        for symbol, input_class in enumerate(self.class_map):
+            members[input_class].append(symbol)
+        for state in range(START, self.n_states):
+            targets = {}
+            for input_class in range(self.n_classes):
+                target = self.transitions[state * self.n_classes + input_class]
+                if target != DEAD:
+                    targets.setdefault(target, []).extend(members[input_class])
+            for target, symbols in targets.items():
+                yield state, target, sorted(symbols)
+
+
+def compile_automaton(spec):
+    """
+    Compile ``spec``, a list of (kind, pattern, literal) in priority order, into a
+    minimized Automaton. A literal pattern is matched as a plain string. Where several
+    patterns accept the same lexeme the earliest one wins.
+    """
+    nfa = _NFA()
+    start = nfa.new_state()
+    accepting = {}
+    kinds = []
+    for priority, (kind, pattern, literal) in enumerate(spec):
+        kinds.append(kind)
+        if literal:
+            first = last = nfa.new_state()
+            for char in pattern:
+                state = nfa.new_state()
+                nfa.add_edge(last, frozenset((_symbol(char),)), state)
+                last = state
+        else:
+            first, last = _PatternParser(nfa, pattern).parse()
+        nfa.add_edge(start, None, first)
+        accepting[last] = min(priority, accepting.get(last, priority))
+
+    class_map, representatives = _input_classes(nfa)
+    accepts, transitions = _determinize(nfa, start, accepting, representatives)
+    accepts, transitions = _minimize(accepts, transitions, len(representatives))
+    return Automaton(kinds, array('B', class_map), array('H', transitions), array('h', accepts))
+
+
+def _input_classes(nfa):
+    """
+    Partition the input symbols into classes no pattern tells apart.
+    """
+    symbol_sets = list({symbols for edges in nfa.edges for symbols, _ in edges if symbols is not None})
+    classes = {}
+    class_map = []
+    representatives = []
+    for symbol in range(ASCII + 1):
+        signature = tuple(symbol in symbols for symbols in symbol_sets)
+        if signature not in classes:
+            classes[signature] = len(representatives)
+            representatives.append(symbol)
+        class_map.append(classes[signature])
+    return class_map, representatives
+
+
+def _closure(nfa, states):
+    stack = list(states)
+    seen = set(states)
+    while stack:
+        for symbols, target in nfa.edges[stack.pop()]:
+            if symbols is None and target not in seen:
+                seen.add(target)
+                stack.append(target)
+    return frozenset(seen)
+
+
+def _determinize(nfa, start, accepting, representatives):
+    """
+    Subset construction. Returns per-state accept indices and the flat transition list,
+    with the dead state at 0 and the start state at 1.
+    """
+    dead = frozenset()
+    index = {dead: DEAD}
+    order = [dead]
+    first = _closure(nfa, (start,))
+    index[first] = START
+    order.append(first)
+    transitions = [DEAD] * len(representatives)
+    pending = 1
+    while pending < len(order):
+        subset = order[pending]
+        pending += 1
+        for symbol in representatives:
+            moved = {target for state in subset for symbols, target in nfa.edges[state]
+                     if symbols is not None and symbol in symbols}
+            target = _closure(nfa, moved) if moved else dead
+            if target not in index:
+                index[target] = len(order)
+                order.append(target)
+            transitions.append(index[target])
+    accepts = [min((accepting[state] for state in subset if state in accepting), default=-1) for subset in order]
+    return accepts, transitions
+
+
+def _minimize(accepts, transitions, n_classes):
+    """
+    Moore partition refinement: states are equivalent when they accept the same kind and
+    their transitions lead to equivalent states. Dead and start states keep numbers 0 and 1.
+    """
+    n_states = len(accepts)
+    block = list(accepts)
+    while True:
+        signatures = {}
+        refined = []
+        for state in range(n_states):
+            row = transitions[state * n_classes:(state + 1) * n_classes]
+            key = (block[state], tuple(block[target] for target in row))
+            refined.append(signatures.setdefault(key, len(signatures)))
+        if len(signatures) == len(set(block)):
+            block = refined
+            break
+        block = refined
+
+    numbering = {block[DEAD]: DEAD, block[START]: START}
+    for state in range(n_states):
+        numbering.setdefault(block[state], len(numbering))
+    minimal_accepts = [-1] * len(numbering)
+    minimal_transitions = [DEAD] * (len(numbering) * n_classes)
+    for state in range(n_states):
+        new = numbering[block[state]]
+        minimal_accepts[new] = accepts[state]
+        for input_class in range(n_classes):
+            minimal_transitions[new * n_classes + input_class] = numbering[block[transitions[state * n_classes + input_class]]]
+    return minimal_accepts, minimal_transitions
+
+
+def reserved_words_spec():
+    return [(token_type, word, True) for word, token_type in ReservedWords.items()] + \
+           [(Token_type.identifier, ValuePatterns[Token_type.identifier], False)]
+
+
+def operators_spec():
+    return [(token_type, operator, True) for operator, token_type in Operators.items()]
+
+
+def values_spec():
+    return [(token_type, ValuePatterns[token_type], False)
+            for token_type in (Token_type.integer, Token_type.real, Token_type.char, Token_type.string)]
+
+
+def token_spec():
+    """
+    The complete lexical specification: reserved words shadow identifiers, comments shadow
+    the '/' operator, and the value patterns follow in ValuePatterns order.
+    """
+    return reserved_words_spec()[:-1] + \
+        [(kind, pattern, False) for kind, pattern in CommentPatterns.items()] + \
+        operators_spec() + \
+        [(token_type, pattern, False) for token_type, pattern in ValuePatterns.items()]
+
+
+TOKEN_AUTOMATON = compile_automaton(token_spec())
+if TOKEN_AUTOMATON.lookahead() is None:
+    raise PatternError("the token specification lets maximal munch rescan without bound")
+
+
+def dfa_tokens(text, automaton=TOKEN_AUTOMATON, symbols=None):
+    """
+    Yield the tokens of ``text`` by maximal munch over the automaton tables. A character
+    no token can start with is skipped, and comments are dropped. The names of
+    identifiers and variables are interned in ``symbols`` (a fresh SymbolTable by
+    default). Each character is read at most ``automaton.lookahead()`` more times, so
+    the scan takes linear time.
+    """
+    if symbols is None:
+        symbols = SymbolTable()
+    names = symbols.names
+    class_map = automaton.class_map
+    transitions = automaton.transitions
+    accepts = automaton.accepts
+    n_classes = automaton.n_classes
+    kinds = automaton.kinds
+    length = len(text)
+    pos = 0
+    while pos < length:
+        state = START
+        index = pos
+        last_kind = -1
+        last_end = pos
+        while index < length:
+            code = ord(text[index])
+            state = transitions[state * n_classes + class_map[code if code < ASCII else OTHER]]
+            if state == DEAD:
+                break
+            index += 1
+            if accepts[state] >= 0:
+                last_kind = accepts[state]
+                last_end = index
+        if last_kind < 0:
+            pos += 1
+            continue
+        kind = kinds[last_kind]
+        if kind is Token_type.identifier or kind is Token_type.variable:
+            symbol = symbols[text[pos:last_end]]
+            yield Token(names[symbol], kind, pos, last_end, symbol)
+        elif isinstance(kind, Token_type):
+            yield Token(text[pos:last_end], kind, pos, last_end)
+        pos = last_end
+
+
+class DFAScanner(Scanner):
+    """
+    A Scanner that lexes by running the compiled DFA tables instead of the master regex.
+    """
+
+    def find_tokens(self, text):
+        return self.collect(dfa_tokens(text, symbols=self.symbols))
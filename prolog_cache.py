@@ -0,0 +1,266 @@
+"""
+Content-addressed on-disk cache of token streams and parse results.
+
+An entry is keyed by a hash of the source and of the code of this module, the parser
+and every module they import, so editing any of them invalidates it. Each entry is a single binary file holding the
+token arrays of a TokenStream, the syntax tree flattened by prolog_ast.pack, the error
+list and the exception if the parser crashed. Entries are written to a temporary file
+and renamed into place, so several processes can share a directory, and the least
+recently used ones are evicted once the directory grows past max_bytes.
+
+Loading maps the entry file and casts its columns in place, so a hit costs little more
+than hashing the source, whatever its size.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+import prolog_ast
+import prolog_parser
+from prolog_scanner import Scanner, TokenStream
+
+DEFAULT_DIRECTORY = Path(os.environ.get('PROLOG_CACHE_DIR', Path.home() / '.cache' / 'prolog_parser'))
+DEFAULT_MAX_BYTES = 1 << 30
+
+MAGIC = b'PLC1'
+# magic, parsed flag, token count, node count, bytes of labels JSON, bytes of result JSON
+HEADER = struct.Struct('<4sBxxxIIII')
+# (typecode, per token or per node) in file order, widest first to keep columns aligned
+TOKEN_COLUMNS = (('I', 'starts'), ('I', 'ends'), ('B', 'types'))
+NODE_COLUMNS = (('i', 'tokens'), ('I', 'sizes'), ('H', 'label_ids'), ('B', 'kinds'))
+
+_code_version = None
+
+
+def local_imports(path):
+    """
+    The files of the modules beside path that its module imports at module level, read
+    from its import statements.
+    """
+    import ast
+    names = set()
+    for statement in ast.parse(path.read_bytes()).body:
+        if isinstance(statement, ast.Import):
+            names.update(alias.name for alias in statement.names)
+        elif isinstance(statement, ast.ImportFrom) and statement.level == 0:
+            names.add(statement.module)
+    return {path.with_name(name + '.py') for name in names} & set(path.parent.glob('*.py'))
+
+
+def code_files():
+    """
+    This module's file and those of every module of the project it imports, directly or
+    through another: together they decide tokens, trees, error lists and the entry
+    format. Following the import statements means a new dependency of the parser is
+    found without being listed here.
+    """
+    files = {Path(__file__).resolve()}
+    pending = list(files)
+    while pending:
+        for path in local_imports(pending.pop()) - files:
+            files.add(path)
+            pending.append(path)
+    return files
+
+
+def code_version():
+    """
+    Hash of the code_files(), plus the byte order of the arrays.
+    """
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256(sys.byteorder.encode())
+        for path in sorted(code_files()):
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+        _code_version = digest.digest()
+    return _code_version
+
+
+class CacheEntry:
+    """
+    A cached scan and, if ``parsed``, parse of one source. The syntax tree is rebuilt
+    from its arrays on first access to ``program``.
+    """
+
+    def __init__(self, source, tokens, error_list=None, exception=None, packed=None, program=None):
+        self.source = source
+        self.tokens = tokens
+        self.error_list = error_list
+        self.exception = exception
+        self.parsed = error_list is not None
+        self._packed = packed
+        self._program = program
+
+    @property
+    def program(self):
+        if self._program is None and self._packed is not None:
+            self._program = prolog_ast.unpack(*self._packed, self.tokens.__getitem__)
+        return self._program
+
+
+class ParseCache:
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        # bytes stored since the directory was last measured; the first store measures
+        self.written = max_bytes
+
+    def key(self, source):
+        """
+        The cache key of a str or bytes-like source.
+        """
+        digest = hashlib.sha256(code_version())
+        if isinstance(source, str):
+            digest.update(b'str')
+            digest.update(source.encode('utf-8', 'surrogatepass'))
+        else:
+            digest.update(b'bytes')
+            digest.update(source)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return self.directory / key[:2] / key
+
+    def parse(self, source):
+        """
+        Scan and parse source, or load both from the cache. Returns a CacheEntry with the
+        tokens, the error list, the syntax tree and, if the parser crashed, the exception
+        as "Type: message" (the tree then holds what was built before the crash).
+        """
+        key = self.key(source)
+        entry = self.load(key, source)
+        if entry is not None and entry.parsed:
+            return entry
+        tokens = TokenStream(source)
+        parser = prolog_parser.Parser(Scanner(source, tokens=tokens))
+        exception = None
+        try:
+            parser.parse()
+        except Exception as error:
+            exception = f"{type(error).__name__}: {error}"
+        program = parser.program_node
+        packed = prolog_ast.pack(program, lambda token: bisect_left(tokens.starts, token.start))
+        entry = CacheEntry(source, tokens, parser.error_list, exception, packed, program)
+        self.store(key, entry)
+        return entry
+
+    def load(self, key, source):
+        """
+        Read an entry, or return None when it is missing or unreadable.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as entry_file:
+                data = mmap.mmap(entry_file.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(path)  # the modification time orders entries for eviction
+        except (OSError, ValueError):
+            return None
+        try:
+            return _decode(data, source)
+        except (ValueError, TypeError, struct.error, UnicodeDecodeError):
+            return None
+
+    def store(self, key, entry):
+        path = self.path(key)
+        data = _encode(entry)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        except OSError:
+            return  # a cache that cannot be written only costs time
+        try:
+            with os.fdopen(descriptor, 'wb') as output:
+                output.write(data)
+            os.replace(temporary, path)
+        except OSError:
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+            return
+        self.written += len(data)
+        if self.written >= self.max_bytes // 16:
+            self.evict()
+
+    def entries(self):
+        """
+        (modification time, size, path) of every entry, oldest first.
+        """
+        entries = []
+        for path in self.directory.glob('??/*'):
+            if path.name.startswith('.tmp-'):
+                continue
+            try:
+                status = path.stat()
+            except OSError:
+                continue
+            entries.append((status.st_mtime, status.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache fits in max_bytes.
+        """
+        self.written = 0
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                pass  # another process evicted it first
+            total -= size
+
+
+def _encode(entry):
+    tokens = entry.tokens
+    token_columns = {'types': tokens.types, 'starts': tokens.starts, 'ends': tokens.ends}
+    if entry.parsed:
+        labels, kinds, label_ids, node_tokens, sizes = entry._packed
+        node_columns = {'kinds': kinds, 'label_ids': label_ids, 'tokens': node_tokens, 'sizes': sizes}
+        nodes = len(kinds)
+    else:
+        labels, node_columns, nodes = [], {}, 0
+    labels = json.dumps(labels).encode()
+    result = json.dumps({'errors': entry.error_list or [], 'exception': entry.exception}).encode()
+    parts = [HEADER.pack(MAGIC, entry.parsed, len(tokens), nodes, len(labels), len(result))]
+    for typecode, name in TOKEN_COLUMNS:
+        parts.append(array(typecode, token_columns[name]).tobytes())
+    for typecode, name in NODE_COLUMNS if entry.parsed else ():
+        parts.append(array(typecode, node_columns[name]).tobytes())
+    parts.append(labels)
+    parts.append(result)
+    return b''.join(parts)
+
+
+def _decode(data, source):
+    magic, parsed, count, nodes, labels_size, result_size = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a cache entry")
+    view = memoryview(data)
+    offset = HEADER.size
+    columns = {}
+    for typecode, name in TOKEN_COLUMNS + (NODE_COLUMNS if parsed else ()):
+        size = array(typecode).itemsize * (count if (typecode, name) in TOKEN_COLUMNS else nodes)
+        if offset + size > len(data):
+            raise ValueError("truncated cache entry")
+        columns[name] = view[offset:offset + size].cast(typecode)
+        offset += size
+    labels = json.loads(bytes(view[offset:offset + labels_size]))
+    result = json.loads(bytes(view[offset + labels_size:offset + labels_size + result_size]))
+    tokens = TokenStream(source, (columns['types'], columns['starts'], columns['ends']))
+    if not parsed:
+        return CacheEntry(source, tokens)
+    packed = (labels, columns['kinds'], columns['label_ids'], columns['tokens'], columns['sizes'])
+    return CacheEntry(source, tokens, result['errors'], result['exception'], packed)
@@ -0,0 +1,239 @@
+"""
+Answers goals from the facts of parsed programs.
+
+A FactDatabase keeps the facts of each predicate as rows of values, with hash indexes
+from a value to the rows that hold it at one argument position: always the first, and
+every position with index_all=True. solve() unifies a goal's arguments
+with the rows and yields one dict of variable bindings per matching fact, lazily, so
+the first answer comes before the rest are looked for. A bound argument at an
+indexed position narrows the rows with one dict lookup, however many facts the
+predicate has; only a goal without any bound indexed argument scans them all.
+
+    program = Parser(Scanner(source)).parse()
+    database = FactDatabase.from_program(program)
+    for answer in database.ask(program.goal):   # graph(c, X).
+        print(answer)                           # {'X': 'd'}
+
+A value is a pair of the token type of its literal and its Python value: integers and
+reals become int and float, a char or string the text between its quotes, and a
+symbol its name. The type keeps the char 'c', the string "c" and the symbol c apart,
+and 1 apart from 1.0, as the language does; answers bind variables to the Python
+values alone. Predicates are told apart by name and arity, as in Prolog. A goal must
+fit the signature its predicate was declared with. Only facts are consulted: rules
+read and write, which answering does not do.
+"""
+from prolog_ast import Fact
+from prolog_scanner import scan_text
+from prolog_tokens import Token_type, ValueDataTypes
+
+
+def _unquote(lex):
+    return lex[1:-1]
+
+
+VALUES = {
+    Token_type.integer: int,
+    Token_type.real: float,
+    Token_type.char: _unquote,
+    Token_type.string: _unquote,
+    Token_type.identifier: str,
+}
+ANONYMOUS = '_'
+
+
+class Variable:
+    """
+    A variable in a goal. Every occurrence of one name must bind the same value,
+    except for '_', which matches anything and is not reported.
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"Variable({self.name!r})"
+
+
+def value_of(token):
+    """
+    The (Token_type, Python value) pair of a value token, or a Variable for a variable
+    token.
+    """
+    if token.token_type == Token_type.variable:
+        return Variable(token.lex)
+    return token.token_type, VALUES[token.token_type](token.lex)
+
+
+class Relation:
+    """
+    The facts of one predicate: its rows of values, and for each indexed position a
+    dict from a value to the row holding it there, or to the list of rows when
+    several do. Positions that are not indexed have None.
+    """
+    __slots__ = ('arity', 'rows', 'indexes')
+
+    def __init__(self, arity, index_all=False):
+        self.arity = arity
+        self.rows = []
+        self.indexes = [{} if position == 0 or index_all else None for position in range(arity)]
+
+    def add(self, values):
+        row = len(self.rows)
+        self.rows.append(values)
+        for index, value in zip(self.indexes, values):
+            if index is None:
+                continue
+            entry = index.get(value)
+            if entry is None:
+                index[value] = row
+            elif type(entry) is int:
+                index[value] = [entry, row]
+            else:
+                entry.append(row)
+
+    def candidates(self, arguments):
+        """
+        The numbers of the rows that can match arguments: the fewest rows any bound
+        indexed argument is found in, or every row when no indexed argument is bound.
+        """
+        best = None
+        for index, argument in zip(self.indexes, arguments):
+            if index is None or type(argument) is Variable:
+                continue
+            entry = index.get(argument)
+            if entry is None:
+                return ()
+            if type(entry) is int:
+                return entry,
+            if best is None or len(entry) < len(best):
+                best = entry
+        return range(len(self.rows)) if best is None else best
+
+
+class FactDatabase:
+    """
+    The facts of one or more programs, keyed by predicate name and arity, and the
+    signatures their predicates were declared with.
+    """
+
+    def __init__(self, index_all=False):
+        self.index_all = index_all
+        self.relations = {}  # (name, arity) -> Relation
+        self.signatures = {}  # name -> tuple of data types, as in prolog_semantics.PredicateIndex
+
+    @classmethod
+    def from_program(cls, program, index_all=False):
+        database = cls(index_all)
+        database.add_program(program)
+        return database
+
+    def add_program(self, program):
+        """
+        Add the signature of every predicate a parsed Program declares, and every fact.
+        """
+        for declaration in program.predicates:
+            self.signatures[declaration.name.lex] = tuple(token.token_type for token in declaration.parameters)
+        for clause in program.clauses:
+            if isinstance(clause, Fact) and clause.name is not None:
+                self.add(clause.name.lex, tuple((token.token_type, VALUES[token.token_type](token.lex))
+                                                for token in clause.arguments))
+
+    def add(self, name, values):
+        """
+        Add the fact name(values...), given as a tuple of (Token_type, value) pairs.
+        """
+        relation = self.relations.get((name, len(values)))
+        if relation is None:
+            relation = self.relations[name, len(values)] = Relation(len(values), self.index_all)
+        relation.add(values)
+
+    def __len__(self):
+        return sum(len(relation.rows) for relation in self.relations.values())
+
+    def check(self, name, arguments):
+        """
+        Raise ValueError unless the goal name(arguments...) fits the signature its
+        predicate was declared with, as prolog_semantics.check_goal requires: each
+        value's literal must be of the declared data type. A predicate that no program
+        declared is not checked.
+        """
+        signature = self.signatures.get(name)
+        if signature is None:
+            return
+        if len(arguments) != len(signature):
+            raise ValueError(f"{name} takes {len(signature)} values")
+        for argument, data_type in zip(arguments, signature):
+            if type(argument) is not Variable and ValueDataTypes.get(argument[0]) != data_type:
+                raise ValueError(f"values do not match the signature of {name}")
+
+    def solve(self, name, arguments=()):
+        """
+        Return an iterator of a dict from variable name to value for each fact that
+        unifies with name(arguments...), where each argument is a (Token_type, value)
+        pair or a Variable. A goal without variables yields one empty dict per fact it
+        matches. Raises ValueError if the goal does not fit its predicate's signature.
+        """
+        self.check(name, arguments)
+        relation = self.relations.get((name, len(arguments)))
+        if relation is None:
+            return iter(())
+        return self.answers(relation, arguments)
+
+    @staticmethod
+    def answers(relation, arguments):
+        """
+        Yield the answers of solve() from the facts of one relation.
+        """
+        bound = []  # (position, value) that the row must hold
+        same = []  # (position, earlier position) of a variable seen before
+        outputs = []  # (variable name, position of its first occurrence)
+        first = {}
+        for position, argument in enumerate(arguments):
+            if type(argument) is not Variable:
+                bound.append((position, argument))
+            elif argument.name == ANONYMOUS:
+                continue
+            elif argument.name in first:
+                same.append((position, first[argument.name]))
+            else:
+                first[argument.name] = position
+                outputs.append((argument.name, position))
+        rows = relation.rows
+        for number in relation.candidates(arguments):
+            row = rows[number]
+            if all(row[position] == value for position, value in bound) and \
+                    all(row[position] == row[earlier] for position, earlier in same):
+                yield {name: row[position][1] for name, position in outputs}
+
+    def ask(self, goal):
+        """
+        Solve a parsed Goal, returning its answers as solve() does. A program without
+        a goal has no answers.
+        """
+        if goal is None or goal.name is None:
+            return iter(())
+        return self.solve(goal.name.lex, tuple(value_of(token) for token in goal.arguments))
+
+
+def parse_goal(text):
+    """
+    Read a goal written as in a program's goal section, such as 'graph(c, X).', into
+    the name and arguments that solve() takes. Raises ValueError if it is not one;
+    solve() checks it against its predicate's signature.
+    """
+    tokens = list(scan_text(text))
+    if tokens and tokens[-1].token_type == Token_type.Dot:
+        tokens.pop()
+    if not tokens or tokens[0].token_type != Token_type.identifier:
+        raise ValueError(f"a goal starts with a predicate name: {text!r}")
+    if len(tokens) == 1:
+        return tokens[0].lex, ()
+    inner = tokens[2:-1]
+    if (tokens[1].token_type != Token_type.open_bracket or tokens[-1].token_type != Token_type.close_bracket or
+            not inner or any(token.token_type != Token_type.And for token in inner[1::2]) or len(inner) % 2 == 0):
+        raise ValueError(f"a goal's arguments are values and variables between brackets, separated by commas: {text!r}")
+    for token in inner[::2]:
+        if token.token_type not in VALUES and token.token_type != Token_type.variable:
+            raise ValueError(f"{token.lex!r} is not a value or a variable")
+    return tokens[0].lex, tuple(value_of(token) for token in inner[::2])
@@ -0,0 +1,220 @@
+"""
+The grammar of the Prolog subset, written down once as data, and the LL(1) parse table
+that prolog_parser.Parser drives.
+
+GRAMMAR maps each nonterminal to its alternatives, each a list of symbols:
+- a Token_type is a terminal, and END is the end of the input
+- (Token_type, label) is a terminal that adds a leaf with that label to the syntax
+  tree; the label LEXEME stands for the token's own text
+- a name in GRAMMAR is a nonterminal
+- a name starting with '@' is an action: the parser method of that name runs when the
+  parser reaches it, to build nodes and make the semantic checks
+
+FIRST and FOLLOW are computed at import time, and from them TABLE: for each nonterminal
+a list indexed by token code (Token_type value, 0 for END) giving the alternative to
+expand on that lookahead, or None where the nonterminal cannot continue. Import fails
+with GrammarError if two alternatives compete for one lookahead. SYNC holds the codes
+each nonterminal's row accepts, the synchronization sets for error recovery.
+"""
+from prolog_tokens import Token_type, ValueDataTypes
+
+END = None
+LEXEME = '<lexeme>'
+CODES = max(token_type.value for token_type in Token_type) + 1
+
+DATA_TYPES = tuple(ValueDataTypes.values())
+VALUES = tuple(ValueDataTypes)
+OPERANDS = ((Token_type.integer, 'integer'), (Token_type.real, 'real'), (Token_type.char, 'char'),
+            (Token_type.string, 'string'), (Token_type.variable, 'Variable'))
+READS = (Token_type.readln, Token_type.readint, Token_type.readchar)
+
+GRAMMAR = {
+    'program': [['@enter_predicates', (Token_type.predicates, 'predicates'), 'declarations',
+                 '@enter_clauses', (Token_type.clauses, 'clauses'), 'clauses',
+                 '@enter_goal', (Token_type.goal, 'goal'), 'goal', (Token_type.Dot, '.'), END]],
+
+    'declarations': [['declaration', 'declarations'], []],
+    'declaration': [['@start_declaration', (Token_type.identifier, 'Predicate ID'), 'parameters',
+                     '@declare', '@end_unit']],
+    'parameters': [[(Token_type.open_bracket, '('), 'data_type', 'more_data_types',
+                    (Token_type.close_bracket, ')')], []],
+    'more_data_types': [[(Token_type.And, ','), 'data_type', 'more_data_types'], []],
+    'data_type': [[(data_type, 'Data Type'), '@parameter'] for data_type in DATA_TYPES],
+
+    'clauses': [['clause', 'clauses'], []],
+    'clause': [['@start_clause', Token_type.identifier, 'clause_body', '@end_unit']],
+    'clause_body': [['@start_fact', (Token_type.open_bracket, '('), 'value', 'more_values', '@check_values',
+                     (Token_type.close_bracket, ')'), (Token_type.Dot, '.')],
+                    ['@start_rule', (Token_type.imply, ':-'), 'body', (Token_type.Dot, '.')],
+                    ['@start_fact', (Token_type.Dot, '.')]],
+    'more_values': [[(Token_type.And, ','), 'value', 'more_values'], []],
+    'value': [[(value, 'Value'), '@argument'] for value in VALUES],
+
+    # statements are separated by ',' or ';', and an arithmetic or relational one must
+    # be followed by a separator
+    'body': [['statement', 'after_statement'], ['expression', 'separator', 'body'], ['separator', 'body'], []],
+    'after_statement': [['separator', 'body'], []],
+    'separator': [[(Token_type.And, ',')], [(Token_type.Or, ';')]],
+    'statement': [['@start_write', (Token_type.write, 'write'), (Token_type.open_bracket, '('), 'write_arguments',
+                   (Token_type.close_bracket, ')'), '@end_statement']] +
+                 [['@start_read', (read, read.name), (Token_type.open_bracket, '('), '@bind',
+                   (Token_type.variable, 'Variable'), (Token_type.close_bracket, ')'), '@end_statement']
+                  for read in READS],
+    'write_arguments': [['write_argument', 'more_write_arguments']],
+    'write_argument': [[(Token_type.string, 'string')], ['@check_written', (Token_type.variable, 'Variable')], []],
+    'more_write_arguments': [[(Token_type.And, ','), 'write_arguments'], []],
+    'expression': [['@start_expression', (Token_type.variable, 'Variable'), '@operand', 'operations',
+                    '@end_expression']],
+    'operations': [[(Token_type.Arithmetic_op, LEXEME), 'operand', 'operations'],
+                   [(Token_type.Relational_op, LEXEME), 'operand', 'comparison']],
+    'comparison': [[(Token_type.Arithmetic_op, LEXEME), 'operand', 'comparison'], []],
+    'operand': [[operand, '@operand'] for operand in OPERANDS],
+
+    # a goal's arguments may also be variables, which prolog_engine binds to answer it
+    'goal': [[(Token_type.identifier, 'Predicate ID'), '@call', 'goal_values']],
+    'goal_values': [[(Token_type.open_bracket, '('), 'goal_value', 'more_goal_values',
+                     (Token_type.close_bracket, ')'), '@check_values'],
+                    ['@check_arity']],
+    'more_goal_values': [[(Token_type.And, ','), 'goal_value', 'more_goal_values'], []],
+    'goal_value': [[(value, 'Value'), '@argument'] for value in VALUES] +
+                  [[(Token_type.variable, 'Variable'), '@argument']],
+}
+START = 'program'
+# actions that still run when error recovery pops them: they only track which section,
+# unit and statement the parser is in, and declare a predicate whatever its parameters
+RECOVERY_ACTIONS = frozenset({'@enter_predicates', '@enter_clauses', '@enter_goal', '@declare', '@end_unit',
+                              '@end_statement'})
+
+TERMINAL, NONTERMINAL, ACTION = 0, 1, 2
+
+
+class GrammarError(Exception):
+    pass
+
+
+def is_action(symbol):
+    return isinstance(symbol, str) and symbol.startswith('@')
+
+
+def terminal_code(symbol):
+    """
+    The token code of a terminal symbol, with or without a leaf label.
+    """
+    if isinstance(symbol, tuple):
+        symbol = symbol[0]
+    return 0 if symbol is END else symbol.value
+
+
+def first_of(symbols, first, nullable):
+    """
+    The codes that can begin symbols, and whether symbols can derive nothing.
+    """
+    codes = set()
+    for symbol in symbols:
+        if is_action(symbol):
+            continue
+        if symbol in GRAMMAR:
+            codes |= first[symbol]
+            if symbol not in nullable:
+                return codes, False
+        else:
+            codes.add(terminal_code(symbol))
+            return codes, False
+    return codes, True
+
+
+def first_and_follow():
+    """
+    Compute FIRST and FOLLOW of every nonterminal, as sets of token codes, and the set
+    of nullable nonterminals, by iterating to a fixed point.
+    """
+    first = {name: set() for name in GRAMMAR}
+    follow = {name: set() for name in GRAMMAR}
+    nullable = set()
+    changed = True
+    while changed:
+        changed = False
+        for name, alternatives in GRAMMAR.items():
+            for alternative in alternatives:
+                codes, empty = first_of(alternative, first, nullable)
+                if not codes <= first[name] or (empty and name not in nullable):
+                    first[name] |= codes
+                    if empty:
+                        nullable.add(name)
+                    changed = True
+    follow[START].add(0)
+    changed = True
+    while changed:
+        changed = False
+        for name, alternatives in GRAMMAR.items():
+            for alternative in alternatives:
+                for index, symbol in enumerate(alternative):
+                    if symbol not in GRAMMAR or is_action(symbol):
+                        continue
+                    codes, empty = first_of(alternative[index + 1:], first, nullable)
+                    if empty:
+                        codes = codes | follow[name]
+                    if not codes <= follow[symbol]:
+                        follow[symbol] |= codes
+                        changed = True
+    return first, follow, nullable
+
+
+def parse_table():
+    """
+    Build TABLE[nonterminal][code] -> index of the alternative to expand, or None.
+    """
+    table = {}
+    for name, alternatives in GRAMMAR.items():
+        row = [None] * CODES
+        for index, alternative in enumerate(alternatives):
+            codes, empty = first_of(alternative, FIRST, NULLABLE)
+            if empty:
+                codes = codes | FOLLOW[name]
+            for code in codes:
+                if row[code] is not None:
+                    raise GrammarError(f"{name} is not LL(1): alternatives {row[code]} and {index} "
+                                       f"both start with token code {code}")
+                row[code] = index
+        table[name] = row
+    return table
+
+
+def compile_table(leaves=True):
+    """
+    Turn TABLE into the form the parser walks: every symbol becomes a (kind, value,
+    label) triple, where value is the token code of a terminal, the row of a
+    nonterminal or the position of an action in ACTIONS. A row maps each code to its
+    alternative with the symbols reversed, ready to push onto a stack. Without leaves,
+    terminals carry no labels, for a parser that builds no tree.
+
+    Returns the reversed symbols of the START production, the bottom of the stack: END
+    lies under everything, so error recovery can always stop there.
+    """
+    rows = {name: [None] * CODES for name in GRAMMAR}
+    symbols = {name: (NONTERMINAL, rows[name], name) for name in GRAMMAR}
+
+    def compiled(symbol):
+        if is_action(symbol):
+            return ACTION, ACTIONS.index(symbol[1:]), symbol
+        if symbol in GRAMMAR:
+            return symbols[symbol]
+        label = symbol[1] if leaves and isinstance(symbol, tuple) else None
+        return TERMINAL, terminal_code(symbol), label
+
+    for name, alternatives in GRAMMAR.items():
+        expansions = [tuple(compiled(symbol) for symbol in reversed(alternative)) for alternative in alternatives]
+        for code, index in enumerate(TABLE[name]):
+            if index is not None:
+                rows[name][code] = expansions[index]
+    start, = GRAMMAR[START]
+    return tuple(compiled(symbol) for symbol in reversed(start))
+
+
+FIRST, FOLLOW, NULLABLE = first_and_follow()
+TABLE = parse_table()
+# the codes at which each nonterminal can continue, where error recovery stops skipping:
+# its FIRST, and its FOLLOW too when it can derive nothing
+SYNC = {name: frozenset(code for code, index in enumerate(row) if index is not None) for name, row in TABLE.items()}
+ACTIONS = sorted({symbol[1:] for alternatives in GRAMMAR.values()
+                  for alternative in alternatives for symbol in alternative if is_action(symbol)})
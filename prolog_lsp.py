@@ -0,0 +1,356 @@
+"""
+A language server for the Prolog subset, speaking the Language Server Protocol's
+JSON-RPC over stdin and stdout:
+
+    python -m prolog_parser lsp
+
+Each open document keeps its Scanner and IncrementalParser for as long as the server
+runs. A didChange notification is applied with Scanner.apply_edit, so only the edited
+region is lexed again, and the next parse replays every declaration and clause the
+edit did not touch. Diagnostics are published once no more messages are waiting, so a
+burst of keystrokes is parsed once; a change that arrives while a document is being
+parsed cancels that parse, as the GUI's ParseWorker does.
+
+Go to definition jumps from any predicate name, in a clause head or the goal, to its
+declaration in the predicates section, looked up in an index of the declarations by
+symbol id that is rebuilt after each parse.
+"""
+import json
+import queue
+import re
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+
+from prolog_parser import IncrementalParser, ParseCancelled
+from prolog_scanner import Scanner, text_edit
+from prolog_tokens import Token_type
+
+LINE_BREAK = re.compile(r'\r\n|\r|\n')
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+METHOD_NOT_FOUND = -32601
+INTERNAL_ERROR = -32603
+SERVER_NOT_INITIALIZED = -32002
+ERROR_SEVERITY = 1
+ERROR_MESSAGE = 1  # the MessageType of a window/logMessage notification
+
+
+class Document:
+    """
+    One open text document, with its scanner and parser kept warm between edits.
+    Positions are (line, character) pairs; characters count UTF-16 code units unless
+    the client agreed to 'utf-32', which counts code points as Python does.
+    """
+
+    def __init__(self, uri, text, version, encoding='utf-16', cancelled=None):
+        self.uri = uri
+        self.version = version
+        self.encoding = encoding
+        self.scanner = Scanner(text)
+        self.parser = IncrementalParser(self.scanner, cancelled=cancelled)
+        self.parsed = False
+        self.line_starts = None
+        self.declarations = None
+
+    @property
+    def text(self):
+        return self.scanner.text
+
+    def change(self, changes, version):
+        """
+        Apply a didChange notification's content changes, in order.
+        """
+        for change in changes:
+            if 'range' in change:
+                start = self.offset(change['range']['start'])
+                end = self.offset(change['range']['end'])
+                new_text = change['text']
+            else:
+                start, end, new_text = text_edit(self.text, change['text'])
+            self.scanner.apply_edit(start, end, new_text)
+            self.edit_lines(start, end, len(new_text))
+        self.version = version
+        self.parsed = False
+
+    def parse(self):
+        """
+        Parse the current text, reusing the units unchanged since the last parse.
+        """
+        self.parser.parse()  # which also settles the offsets of the tokens after an edit
+        self.parsed = True
+        self.declarations = None
+
+    def lines(self):
+        """
+        The offset at which each line starts.
+        """
+        if self.line_starts is None:
+            self.line_starts = [0] + [match.end() for match in LINE_BREAK.finditer(self.text)]
+        return self.line_starts
+
+    def edit_lines(self, start, end, length):
+        """
+        Update the line starts after text[start:end] was replaced by length characters:
+        only line breaks in the new characters are searched for, with one character on
+        each side in case a '\r' and a '\n' now meet or have been parted.
+        """
+        lines = self.line_starts
+        if lines is None:
+            return
+        stop = start + length
+        head = max(bisect_left(lines, start), 1)
+        tail = bisect_right(lines, end + 1)
+        delta = length - (end - start)
+        lines[head:] = ([match.end() for match in LINE_BREAK.finditer(self.text, max(start - 1, 0), stop + 2)
+                         if start <= match.end() <= stop + 1] +
+                        [line + delta for line in lines[tail:]])
+
+    def offset(self, position):
+        """
+        The offset in the text of an LSP position. Characters past the end of a line
+        mean its end, and lines past the last mean the end of the text.
+        """
+        lines = self.lines()
+        if position['line'] >= len(lines):
+            return len(self.text)
+        start = lines[position['line']]
+        end = lines[position['line'] + 1] if position['line'] + 1 < len(lines) else len(self.text)
+        line = self.text[start:end].rstrip('\r\n')
+        character = position['character']
+        if self.encoding == 'utf-16' and not line.isascii():
+            units = 0
+            for index, char in enumerate(line):
+                if units >= character:
+                    return start + index
+                units += 2 if ord(char) > 0xFFFF else 1
+            return start + len(line)
+        return start + min(character, len(line))
+
+    def position(self, offset):
+        """
+        The LSP position of an offset in the text.
+        """
+        lines = self.lines()
+        line = bisect_right(lines, offset) - 1
+        prefix = self.text[lines[line]:offset]
+        if self.encoding == 'utf-16' and not prefix.isascii():
+            return {'line': line, 'character': len(prefix.encode('utf-16-le')) // 2}
+        return {'line': line, 'character': len(prefix)}
+
+    def range(self, start, end):
+        return {'start': self.position(start), 'end': self.position(end)}
+
+    def diagnostics(self):
+        """
+        The parser's errors as LSP diagnostics.
+        """
+        return [{'range': self.range(diagnostic.start, diagnostic.end), 'severity': ERROR_SEVERITY,
+                 'source': 'prolog', 'message': diagnostic.message}
+                for diagnostic in self.parser.diagnostics]
+
+    def token_at(self, offset):
+        """
+        The token that contains offset or ends at it, or None.
+        """
+        tokens = self.scanner.tokens
+        index = bisect_right(tokens, offset, key=attrgetter('start')) - 1
+        if index >= 0 and offset <= tokens[index].end:
+            return tokens[index]
+        return None
+
+    def definition(self, position):
+        """
+        The name token of the declaration of the predicate named at position, or None.
+        """
+        token = self.token_at(self.offset(position))
+        if token is None or token.token_type != Token_type.identifier:
+            return None
+        if self.declarations is None:
+            # a later declaration of a name replaces an earlier one, as in the parser
+            self.declarations = {declaration.name.symbol: declaration.name
+                                 for declaration in self.parser.program_node.predicates}
+        return self.declarations.get(token.symbol)
+
+
+class LanguageServer:
+    """
+    Reads JSON-RPC messages from a binary input on a background thread and handles
+    them in order on the calling thread, writing responses and notifications to a
+    binary output. run() returns the exit status once the client sends 'exit' or
+    closes the input.
+    """
+
+    def __init__(self, input=None, output=None):
+        self.input = input if input is not None else sys.stdin.buffer
+        self.output = output if output is not None else sys.stdout.buffer
+        self.incoming = queue.Queue()
+        self.cancelled = threading.Event()
+        self.parsing = False  # set while parsing for diagnostics, which a change cancels
+        self.documents = {}
+        self.stale = {}  # uri -> Document whose diagnostics are out of date, oldest first
+        self.encoding = 'utf-16'
+        self.initialized = False
+        self.shut_down = False
+        self.handlers = {
+            'initialize': self.initialize,
+            'initialized': lambda params: None,
+            'shutdown': self.shutdown,
+            'textDocument/didOpen': self.did_open,
+            'textDocument/didChange': self.did_change,
+            'textDocument/didClose': self.did_close,
+            'textDocument/definition': self.definition,
+        }
+
+    def run(self):
+        threading.Thread(target=self.read_messages, name="prolog-lsp-reader", daemon=True).start()
+        while True:
+            if self.incoming.empty():
+                self.publish_diagnostics()
+            message = self.incoming.get()
+            if message is None:
+                return 1  # the client went away without 'exit'
+            if isinstance(message, ValueError):
+                self.send({'id': None, 'error': {'code': PARSE_ERROR, 'message': str(message)}})
+                continue
+            if message.get('method') == 'exit':
+                return 0 if self.shut_down else 1
+            self.dispatch(message)
+
+    def read_messages(self):
+        """
+        Put each message read from the input on the incoming queue, and None at its end.
+        """
+        while True:
+            length = None
+            while True:
+                line = self.input.readline()
+                if not line:
+                    self.incoming.put(None)
+                    return
+                line = line.strip()
+                if not line:
+                    break
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-length':
+                    length = int(value)
+            if length is None:
+                continue
+            body = self.input.read(length)
+            try:
+                message = json.loads(body)
+            except ValueError as error:
+                message = error
+            else:
+                if self.parsing and message.get('method') in ('textDocument/didChange', 'textDocument/didClose'):
+                    self.cancelled.set()
+            self.incoming.put(message)
+            if isinstance(message, dict) and message.get('method') == 'exit':
+                return  # nothing follows, and a thread blocked on the input would stall shutdown
+
+    def send(self, message):
+        body = json.dumps({'jsonrpc': '2.0', **message}, ensure_ascii=False).encode()
+        self.output.write(b'Content-Length: %d\r\n\r\n' % len(body) + body)
+        self.output.flush()
+
+    def dispatch(self, message):
+        """
+        Handle one request or notification, and answer a request. A notification has no
+        reply to carry an error, so one that fails is logged to the client instead.
+        """
+        method = message.get('method')
+        handler = self.handlers.get(method)
+        if 'id' not in message:
+            if handler is not None and (self.initialized or method == 'initialized'):
+                try:
+                    handler(message.get('params') or {})
+                except Exception as exception:
+                    self.send({'method': 'window/logMessage',
+                               'params': {'type': ERROR_MESSAGE,
+                                          'message': f"{method}: {type(exception).__name__}: {exception}"}})
+            return
+        if handler is None:
+            error = {'code': METHOD_NOT_FOUND, 'message': f"unknown method {method}"}
+        elif not self.initialized and method != 'initialize':
+            error = {'code': SERVER_NOT_INITIALIZED, 'message': "the server is not initialized"}
+        else:
+            try:
+                self.send({'id': message['id'], 'result': handler(message.get('params') or {})})
+                return
+            except Exception as exception:
+                error = {'code': INTERNAL_ERROR, 'message': f"{type(exception).__name__}: {exception}"}
+        self.send({'id': message['id'], 'error': error})
+
+    def publish_diagnostics(self):
+        """
+        Parse each document changed since its diagnostics were last published, and
+        publish them, until a new message arrives.
+        """
+        while self.stale and self.incoming.empty():
+            uri, document = next(iter(self.stale.items()))
+            if not document.parsed:
+                self.cancelled.clear()
+                self.parsing = True
+                try:
+                    document.parse()
+                except ParseCancelled:
+                    return
+                finally:
+                    self.parsing = False
+            del self.stale[uri]
+            self.send({'method': 'textDocument/publishDiagnostics',
+                       'params': {'uri': uri, 'version': document.version, 'diagnostics': document.diagnostics()}})
+
+    def initialize(self, params):
+        encodings = params.get('capabilities', {}).get('general', {}).get('positionEncodings', ())
+        self.encoding = 'utf-32' if 'utf-32' in encodings else 'utf-16'
+        self.initialized = True
+        return {'capabilities': {'positionEncoding': self.encoding,
+                                 'textDocumentSync': {'openClose': True, 'change': 2},  # incremental
+                                 'definitionProvider': True},
+                'serverInfo': {'name': 'prolog-lsp'}}
+
+    def shutdown(self, params):
+        self.shut_down = True
+        return None
+
+    def did_open(self, params):
+        item = params['textDocument']
+        document = Document(item['uri'], item['text'], item.get('version'), self.encoding, self.cancelled)
+        self.documents[item['uri']] = self.stale[item['uri']] = document
+
+    def did_change(self, params):
+        uri = params['textDocument']['uri']
+        document = self.documents[uri]
+        document.change(params['contentChanges'], params['textDocument'].get('version'))
+        self.stale.pop(uri, None)
+        self.stale[uri] = document
+
+    def did_close(self, params):
+        uri = params['textDocument']['uri']
+        self.documents.pop(uri, None)
+        self.stale.pop(uri, None)
+        # clear what the editor shows for a closed document
+        self.send({'method': 'textDocument/publishDiagnostics', 'params': {'uri': uri, 'diagnostics': []}})
+
+    def definition(self, params):
+        uri = params['textDocument']['uri']
+        document = self.documents.get(uri)
+        if document is None:
+            return None
+        if not document.parsed:
+            self.cancelled.clear()  # only a parse for diagnostics is cancelled
+            document.parse()
+        name = document.definition(params['position'])
+        if name is None:
+            return None
+        return {'uri': uri, 'range': document.range(name.start, name.end)}
+
+
+def serve(input=None, output=None):
+    """
+    Run a language server over stdin and stdout, or the given binary streams, and
+    return its exit status.
+    """
+    return LanguageServer(input, output).run()
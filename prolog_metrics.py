@@ -0,0 +1,115 @@
+"""
+Opt-in instrumentation for the scanner and parser.
+
+Pass a Metrics to Scanner(..., metrics=...) and Parser(..., metrics=...) to record wall
+time per phase, tokens scanned by type, error_found calls and the tokens error recovery
+skipped. Without one, the scanner and parser only test an attribute once per phase, so
+leaving instrumentation off costs nothing measurable.
+"""
+import json
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from prolog_tokens import Token_type
+
+
+class Metrics:
+    def __init__(self):
+        self.seconds = defaultdict(float)  # phase -> total wall time
+        self.calls = defaultdict(int)  # phase -> times the phase ran
+        self.token_types = Counter()  # Token_type name -> tokens scanned
+        self.errors = 0
+        self.skipped_tokens = 0
+        self.sources = 0
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+    def timed(self, name, function, *args):
+        with self.phase(name):
+            return function(*args)
+
+    def count_tokens(self, tokens):
+        """
+        Count a list of Tokens or a TokenStream by type.
+        """
+        self.sources += 1
+        if hasattr(tokens, 'types'):
+            for code, count in Counter(tokens.types).items():
+                self.token_types[Token_type(code).name] += count
+        else:
+            self.token_types.update(token.token_type.name for token in tokens)
+
+    def counted(self, stream):
+        """
+        Wrap a token iterator so the tokens it yields are counted as they pass.
+        """
+        self.sources += 1
+        token_types = self.token_types
+        for token in stream:
+            token_types[token.token_type.name] += 1
+            yield token
+
+    @property
+    def tokens(self):
+        return sum(self.token_types.values())
+
+    def merge(self, other):
+        """
+        Add the measurements of another Metrics, or of its to_dict(), into this one.
+        """
+        if isinstance(other, Metrics):
+            other = other.to_dict()
+        for name, seconds in other['seconds'].items():
+            self.seconds[name] += seconds
+        for name, calls in other['calls'].items():
+            self.calls[name] += calls
+        self.token_types.update(other['token_types'])
+        self.errors += other['errors']
+        self.skipped_tokens += other['skipped_tokens']
+        self.sources += other['sources']
+        return self
+
+    def to_dict(self):
+        return {
+            'sources': self.sources,
+            'tokens': self.tokens,
+            'errors': self.errors,
+            'skipped_tokens': self.skipped_tokens,
+            'seconds': dict(self.seconds),
+            'calls': dict(self.calls),
+            'token_types': dict(self.token_types),
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix='prolog'):
+        """
+        The measurements in the Prometheus text exposition format, all as counters.
+        """
+        lines = []
+
+        def counter(name, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for labels, value in samples:
+                lines.append(f"{prefix}_{name}{labels} {value}")
+
+        counter('sources_total', 'Sources scanned.', [('', self.sources)])
+        counter('tokens_total', 'Tokens scanned, by token type.',
+                [(f'{{type="{name}"}}', count) for name, count in sorted(self.token_types.items())])
+        counter('errors_total', 'Syntax errors reported (error_found calls).', [('', self.errors)])
+        counter('skipped_tokens_total', 'Tokens skipped while recovering from errors.', [('', self.skipped_tokens)])
+        counter('phase_seconds_total', 'Wall time spent in each phase.',
+                [(f'{{phase="{name}"}}', repr(seconds)) for name, seconds in sorted(self.seconds.items())])
+        counter('phase_calls_total', 'Times each phase ran.',
+                [(f'{{phase="{name}"}}', calls) for name, calls in sorted(self.calls.items())])
+        return '\n'.join(lines) + '\n'
@@ -1,427 +1,946 @@
+import json
+import mmap
+import os
+import sys
+import time
+from functools import partial
 from prolog_scanner import *
-from nltk.tree import *
+from itertools import islice
+from prolog_ast import Leaf, Program, Section, PredicateDecl, Fact, Rule, Statement, Goal
+from prolog_metrics import Metrics
+from prolog_semantics import READ_TYPES, OPERAND_TYPES, matches
+from prolog_grammar import ACTIONS, RECOVERY_ACTIONS, SYNC, LEXEME, TERMINAL, NONTERMINAL, ACTION, compile_table
+
+# nltk, the process pool, pathlib and argparse are imported where they are used, so
+# that importing the parser only loads the standard library modules it needs.
+
+class ParseCancelled(Exception):
+    pass
+
+
+class ErrorLimitReached(Exception):
+    pass
+
+
+class EndOfInput(Token):
+    """
+    The token a parser sees once its scanner has no more: it has no type and is false,
+    so loops that run "while self.current_token" stop at it.
+    """
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+
+class Diagnostic:
+    """
+    One error found while parsing: the token it was found at and the section being
+    parsed. The message is only formatted when asked for.
+    """
+    __slots__ = ('token', 'token_type', 'section')
+
+    def __init__(self, token, section):
+        self.token = token
+        self.token_type = token.token_type
+        self.section = section
+
+    @property
+    def start(self):
+        return self.token.start
+
+    @property
+    def end(self):
+        return self.token.end
+
+    @property
+    def message(self):
+        if not self.token:
+            return "Error at end of input"
+        return f"Error at token: {self.token.lex} of type {self.token_type}"
+
+    def __repr__(self):
+        return f"Diagnostic({self.token!r}, {self.section!r})"
 
 
 class Parser:
-    def __init__(self, scanner: Scanner):
+    # the symbols of the start production, reversed to form the bottom of the stack
+    start = compile_table()
+
+    def __init__(self, scanner: Scanner, metrics=None, cancelled=None, semantic=True, max_errors=None):
         """
-        Initialize the parser with a scanner instance.
+        Initialize the parser with a scanner instance, and optionally a
+        prolog_metrics.Metrics to record into (by default the scanner's) and a
+        threading.Event that stops the parse with ParseCancelled once set.
+
+        With semantic=False only the syntax is checked: declarations, signatures and
+        variable types are left to prolog_semantics.check(). With max_errors, parsing
+        stops at that many errors and truncated is set.
         """
         self.scanner = scanner
+        self.semantic = semantic
+        self.max_errors = max_errors
+        self.truncated = False
+        self.metrics = metrics if metrics is not None else getattr(scanner, 'metrics', None)
+        self.cancelled = cancelled
         self.current_token = None
+        self.previous_token = None
+        self.code = 0
+        self.stack = []
+        self.actions = []
+        self.recoveries = 0
+        # after a syntax error, until its clause's '.' or the next declaration or section:
+        # further errors are not reported, as they are most likely caused by the first
+        self.quiet = False
+        # keyed by Token.symbol: predicate -> signature tuple of data types, variable -> type
         self.dict_identifiers = dict()
         self.dict_variables = dict()
-        self.error_list = []
-        self.Nodes = []
+        self.diagnostics = []
+        self.program_node = Program()
+        self.section_node = None
+        self.unit = None
+        self.parent = None
         self.section = ''
+        self.section_started = 0.0
+        # the unit being parsed: its name token, the signature it was declared with, and
+        # the parameters, arguments and operand types matched so far
+        self.name = None
+        self.declared = None
+        self.parameters = []
+        self.arguments = []
+        self.read_type = None
+        self.operand_types = set()
 
-    def parse(self) -> Tree:
+    @property
+    def error_list(self):
         """
-        Parse the input and return the parse tree.
+        The message of each error found so far.
+        """
+        return [diagnostic.message for diagnostic in self.diagnostics]
+
+    def parse(self) -> Program:
+        """
+        Parse the input and return its syntax tree. Call draw() or to_tree() on the result
+        to get the nltk parse tree.
         """
         self.advance()
-        return self.program()
+        try:
+            self.program()
+        except ErrorLimitReached:
+            self.truncated = True
+        return self.program_node
 
     def advance(self):
         """
-        Advance to the next token.
+        Advance to the next token, and set code to the token's code in the parse table.
         """
-        self.current_token = self.scanner.get_next_token()
+        token = self.scanner.get_next_token()
+        if token is None:
+            self.end_of_input()
+        else:
+            self.previous_token = self.current_token
+            self.current_token = token
+            self.code = token.token_type.code
 
-    def add_node(self, node, loc0=None, loc1=None):
+    def end_of_input(self):
         """
-        Add a node to the parse tree.
+        Advance to an EndOfInput, as the scanner has no tokens left.
         """
-        if loc1 is None:
-            if loc0 is None:
-                self.Nodes.append(node)
-            else:
-                self.Nodes[loc0].append(node)
-        else:
-            self.Nodes[loc0][loc1].append(node)
+        token = self.current_token
+        if not isinstance(token, EndOfInput):
+            end = token.end if token is not None else 0
+            token = EndOfInput('', None, end, end)
+        self.previous_token = self.current_token
+        self.current_token = token
+        self.code = 0
 
-    def error_found(self, loc0=None, loc1=None):
+    def add_leaf(self, label, token):
         """
-        Handle errors by adding them to the error list and advancing the token.
+        Add a leaf for token to the node being built; LEXEME labels it with its text.
         """
-        self.error_list.append(f"Error at token: {self.current_token.lex} of type {self.current_token.token_type}")
-        self.add_node('Error', loc0, loc1)
-        self.skip_to_next_valid_token()
+        self.parent.children.append(Leaf(token.lex if label is LEXEME else label, token))
 
-    def skip_to_next_valid_token(self):
+    def error_found(self, token=None):
+        """
+        Record an error at token, by default the current one, with an 'Error' leaf in the
+        tree, unless quiet after a syntax error. Raises ErrorLimitReached once max_errors
+        errors are recorded.
+        """
+        if self.quiet:
+            return
+        if token is None:
+            token = self.current_token
+        if self.record_error(token):
+            if token:
+                self.add_leaf('Error', token)
+            if len(self.diagnostics) == self.max_errors:
+                raise ErrorLimitReached()
+
+    def record_error(self, token) -> bool:
         """
-        Skip tokens until a valid token is found based on the current section.
+        Add a diagnostic for token, unless the last one is already for it, so that
+        recovery reports each token at most once.
         """
-        if self.section == 'predicates':
-            while self.current_token and self.current_token.token_type not in {Token_type.identifier,
-                                                                               Token_type.clauses}:
-                self.advance()
-        elif self.section == 'clauses':
-            while self.current_token and self.current_token.token_type not in {Token_type.Dot, Token_type.goal}:
-                self.advance()
-        elif self.section == 'goal':
-            while self.current_token:
-                self.advance()
-        if self.current_token and self.current_token.token_type == Token_type.Dot:
+        if self.diagnostics and self.diagnostics[-1].token is token:
+            return False
+        self.diagnostics.append(Diagnostic(token, self.section))
+        if self.metrics is not None:
+            self.metrics.errors += 1
+        return True
+
+    def recover(self, symbol):
+        """
+        Report a syntax error at the current token, where symbol could not continue,
+        unless quiet after an earlier one. Then resynchronize: skip tokens until symbol or
+        one below it on the stack can continue, a terminal by matching the token and a
+        nonterminal by being in SYNC (FIRST, and FOLLOW when it derives nothing), then pop
+        the symbols above it. Popped RECOVERY_ACTIONS still run. The END at the bottom of
+        the stack always matches once the tokens run out.
+
+        The parser stays quiet until the clause's '.' or the next declaration or
+        section. A clause left by resynchronizing, say at an identifier in its body
+        that could start the next clause, has not reached its '.', so popping its
+        end_unit does not end the quiet.
+        """
+        self.recoveries += 1
+        self.error_found()
+        self.quiet = True
+        section = self.section
+        stack = self.stack
+        stack.append(symbol)
+        codes = set()
+        for kind, value, label in stack:
+            if kind == TERMINAL:
+                codes.add(value)
+            elif kind == NONTERMINAL:
+                codes |= SYNC[label]
+        skipped = 0
+        while self.code not in codes:
             self.advance()
+            skipped += 1
+        code = self.code
+        index = len(stack) - 1
+        while True:
+            kind, value, label = stack[index]
+            if value == code if kind == TERMINAL else kind == NONTERMINAL and value[code] is not None:
+                break
+            index -= 1
+        popped = stack[index + 1:]
+        del stack[index + 1:]
+        for kind, value, label in reversed(popped):
+            if kind == ACTION and label in RECOVERY_ACTIONS:
+                self.actions[value]()
+        self.quiet = self.section == section
+        if self.metrics is not None:
+            self.metrics.skipped_tokens += skipped
+
+    def program(self) -> Program:
+        """
+        Parse the entire program by the LL(1) table of prolog_grammar: expand the
+        nonterminal on top of the stack by the alternative its row gives for the current
+        token's code, match terminals against the token, and run actions.
+        """
+        stack = self.stack = list(self.start)
+        actions = self.actions = [getattr(self, name) for name in ACTIONS]
+        add_leaf = self.add_leaf
+        next_token = self.scanner.get_next_token
+        pop = stack.pop
+        extend = stack.extend
+        code = self.code
+        self.quiet = False
+        try:
+            while stack:
+                symbol = pop()
+                kind, value, label = symbol
+                if kind == TERMINAL:
+                    if value == code:
+                        # advance() inlined, as this runs once per token
+                        token = self.current_token
+                        if label is not None:
+                            add_leaf(label, token)
+                        following = next_token()
+                        if following is None:
+                            self.end_of_input()
+                        else:
+                            self.previous_token = token
+                            self.current_token = following
+                            self.code = following.token_type.code
+                    else:
+                        self.recover(symbol)
+                    code = self.code
+                elif kind == NONTERMINAL:
+                    expansion = value[code]
+                    if expansion is None:
+                        self.recover(symbol)
+                        code = self.code
+                    else:
+                        extend(expansion)
+                else:
+                    actions[value]()
+                    code = self.code
+        finally:
+            self.actions = []  # its bound methods would make this parser a reference cycle
+        self.enter_section('')
+        return self.program_node
 
-    def consume(self, expected_token_type, node=None, loc0=None, loc1=None) -> bool:
+    def timed(self, name, function):
         """
-        Consume the current token if it matches the expected token type.
+        Run function, timing it as phase name when metrics are being recorded.
         """
-        if self.current_token and self.current_token.token_type == expected_token_type:
-            if node:
-                self.add_node(node, loc0, loc1)
-            self.advance()
-            return True
-        else:
-            self.error_found(loc0, loc1)
-            return False
+        if self.metrics is None:
+            return function()
+        return self.metrics.timed(name, function)
+
+    def enter_section(self, section):
+        """
+        Make section the one being parsed, timing each section as a metrics phase. A
+        syntax error before it is not held against it.
+        """
+        self.quiet = False
+        if self.metrics is not None:
+            now = time.perf_counter()
+            if self.section:
+                name = 'section_' + self.section
+                self.metrics.seconds[name] += now - self.section_started
+                self.metrics.calls[name] += 1
+            self.section_started = now
+        self.section = section
 
-    def program(self) -> Tree:
+    def check_cancelled(self):
         """
-        Parse the entire program.
+        Raise ParseCancelled if the cancellation event has been set; called before each
+        declaration and clause.
         """
-        self.section = 'predicates'
-        self.section_predicates()
-        self.section = 'clauses'
-        self.section_clauses()
-        self.section = 'goal'
-        self.section_goal()
-        return self.display_parse_tree()
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise ParseCancelled()
+
+    # Building the tree. Validator overrides these to build nothing.
 
-    def section_predicates(self):
+    def open_section(self, label):
         """
-        Parse the predicates section.
+        Add a section node to the program and make it the parent of the leaves that follow.
         """
-        if self.consume(Token_type.predicates, 'Predicates'):
-            self.add_node(['predicates'])
-        while self.current_token and self.current_token.token_type != Token_type.clauses:
-            self.predicate_declaration()
+        self.section_node = self.parent = Section(label)
+        self.program_node.children.append(self.section_node)
 
-    def predicate_declaration(self):
+    def open_unit(self, node_type):
         """
-        Parse a predicate declaration.
+        Add a declaration, fact or rule named by the unit's first token to the current
+        section and make it the current unit.
         """
-        predicate_name = self.current_token.lex
-        self.dict_identifiers[predicate_name] = []
-        if self.consume(Token_type.identifier, 'Predicate Declaration', 1):
-            self.add_node(['Predicate ID'], 1)
-        if self.current_token and self.current_token.token_type == Token_type.open_bracket:
-            self.parameter_list(predicate_name)
+        self.unit = self.parent = node_type(self.name)
+        self.section_node.children.append(self.unit)
+        return self.unit
 
-    def parameter_list(self, predicate_name):
+    def open_goal(self):
         """
-        Parse a parameter list.
+        Add the goal node to the program.
         """
-        self.consume(Token_type.open_bracket, '(', 1, -1)
-        self.data_type(predicate_name)
-        while self.current_token and self.current_token.token_type == Token_type.And:
-            self.consume(Token_type.And, ',', 1, -1)
-            self.data_type(predicate_name)
-        self.consume(Token_type.close_bracket, ')', 1, -1)
+        self.section_node = self.unit = self.parent = Goal()
+        self.program_node.children.append(self.unit)
+        return self.unit
 
-    def data_type(self, predicate_name):
+    def open_statement(self, label):
         """
-        Parse a data type.
+        Add a statement to the body of the current rule.
         """
-        data_types = [
-            Token_type.data_type_integer,
-            Token_type.data_type_symbol,
-            Token_type.data_type_char,
-            Token_type.data_type_string,
-            Token_type.data_type_real
-        ]
-        if self.current_token.token_type in data_types:
-            self.dict_identifiers[predicate_name].append(self.current_token.token_type)
-            self.consume(self.current_token.token_type, 'Data Type', 1, -1)
-        else:
-            self.error_found(1, -1)
-
-    def section_clauses(self):
-        """
-        Parse the clauses section.
-        """
-        if self.consume(Token_type.clauses, 'Clauses'):
-            self.add_node(['clauses'])
-        while self.current_token and self.current_token.token_type != Token_type.goal:
-            clause_ident = self.current_token.lex
-            if clause_ident not in self.dict_identifiers:
-                self.error_found(3)
-                continue
-            self.consume(Token_type.identifier)
-            if self.current_token.token_type == Token_type.open_bracket:
-                self.add_node('Fact', 3)
-                self.add_node(['Predicate ID'], 3)
-                self.value_list(clause_ident)
-            elif self.current_token.token_type == Token_type.imply:
-                if self.dict_identifiers[clause_ident]:
-                    self.error_found(3)
-                else:
-                    self.add_node('Rule', 3)
-                    self.add_node(['Predicate ID'], 3)
-                    self.body()
-            else:
-                if self.consume(Token_type.Dot):
-                    self.add_node('Fact', 3)
-                    self.add_node(['Predicate ID', '.'], 3)
-
-    def value_list(self, clause_ident):
-        """
-        Parse a value list.
-        """
-        self.consume(Token_type.open_bracket, '(', 3, -1)
-        value_list = [self.values()]
-        while self.current_token.token_type == Token_type.And:
-            self.consume(Token_type.And, ',', 3, -1)
-            value_list.append(self.values())
-        if value_list != self.dict_identifiers[clause_ident]:
-            self.error_found(3, -1)
-        self.consume(Token_type.close_bracket, ')', 3, -1)
-        self.consume(Token_type.Dot, '.', 3, -1)
-
-    def values(self):
-        """
-        Parse values.
-        """
-        values = [
-            Token_type.integer,
-            Token_type.identifier,
-            Token_type.char,
-            Token_type.string,
-            Token_type.real
-        ]
-        if self.current_token.token_type in values:
-            temp = self.current_token.token_type
-            if self.section == 'clauses':
-                self.consume(self.current_token.token_type, 'Value', 3, -1)
-            elif self.section == 'goal':
-                self.consume(self.current_token.token_type, 'Value', 5)
-            return temp
-        else:
-            if self.section == 'clauses':
-                self.error_found(3, -1)
-            elif self.section == 'goal':
-                self.error_found(5)
+        statement = self.parent = Statement(label)
+        self.unit.body.append(statement)
+        self.unit.children.append(statement)
+
+    # Actions, named in prolog_grammar.GRAMMAR with a leading '@'.
 
-    def body(self):
+    def enter_predicates(self):
         """
-        Parse the body of a rule.
+        Start the predicates section.
         """
-        self.consume(Token_type.imply, ':-', 3, -1)
-        while True:
-            if self.current_token.token_type == Token_type.And:
-                self.consume(Token_type.And, ',', 3, -1)
-            elif self.current_token.token_type == Token_type.Or:
-                self.consume(Token_type.Or, ';', 3, -1)
-            if self.current_token.token_type == Token_type.write:
-                self.write()
-            elif self.current_token.token_type == Token_type.readln:
-                self.readln()
-            elif self.current_token.token_type == Token_type.readint:
-                self.readint()
-            elif self.current_token.token_type == Token_type.readchar:
-                self.readchar()
-            elif self.current_token.token_type == Token_type.variable:
-                self.statements()
-            if self.current_token.token_type not in {Token_type.And, Token_type.Or}:
-                break
-        self.consume(Token_type.Dot, '.', 3, -1)
+        self.enter_section('predicates')
+        self.open_section('Predicates')
 
-    def write(self):
+    def enter_clauses(self):
         """
-        Parse a write statement.
+        Start the clauses section.
         """
-        self.consume(Token_type.write, 'write statement', 3, -1)
-        write_list = ['write']
-        if self.consume(Token_type.open_bracket):
-            write_list.append('(')
-        while True:
-            if self.current_token.token_type == Token_type.string:
-                if self.consume(Token_type.string):
-                    write_list.append('string')
-            elif self.current_token.token_type == Token_type.variable:
-                if self.current_token.lex not in self.dict_variables:
-                    self.error_found(3)
-                    break
-                if self.dict_variables[self.current_token.lex] != Token_type.integer:
-                    self.error_found(3)
-                    break
-                if self.consume(Token_type.variable):
-                    write_list.append('Variable')
-            if self.current_token.token_type == Token_type.And:
-                if self.consume(Token_type.And):
-                    write_list.append(',')
-            elif self.current_token.token_type == Token_type.close_bracket:
-                break
-            else:
-                self.error_found(3)
-        if self.consume(Token_type.close_bracket):
-            write_list.append(')')
-        self.add_node(write_list, 3, -1)
+        self.enter_section('clauses')
+        self.open_section('Clauses')
 
-    def readln(self):
+    def enter_goal(self):
         """
-        Parse a readln statement.
+        Start the goal section.
         """
-        self.consume(Token_type.readln, 'read statement', 3, -1)
-        read_list = ['readln']
-        if self.consume(Token_type.open_bracket):
-            read_list.append('(')
-        if self.current_token.lex in self.dict_variables:
-            self.error_found(3)
-        else:
-            self.dict_variables[self.current_token.lex] = Token_type.string
-            if self.consume(Token_type.variable):
-                read_list.append('Variable')
-            if self.consume(Token_type.close_bracket):
-                read_list.append(')')
-            self.add_node(read_list, 3, -1)
-
-    def readint(self):
-        """
-        Parse a readint statement.
-        """
-        self.consume(Token_type.readint, 'read statement', 3, -1)
-        read_list = ['readint']
-        if self.consume(Token_type.open_bracket):
-            read_list.append('(')
-        if self.current_token.lex in self.dict_variables:
-            self.error_found(3)
-        else:
-            self.dict_variables[self.current_token.lex] = Token_type.integer
-        if self.consume(Token_type.variable):
-            read_list.append('Variable')
-        if self.consume(Token_type.close_bracket):
-            read_list.append(')')
-        self.add_node(read_list, 3, -1)
-
-    def readchar(self):
-        """
-        Parse a readchar statement.
-        """
-        self.consume(Token_type.readchar, 'read statement', 3, -1)
-        read_list = ['readchar']
-        if self.consume(Token_type.open_bracket):
-            read_list.append('(')
-        if self.current_token.lex in self.dict_variables:
-            self.error_found(3)
+        self.enter_section('goal')
+        unit = self.open_goal()
+        self.arguments = [] if unit is None else unit.arguments
+        self.name = self.declared = None
+
+    def start_declaration(self):
+        """
+        Start a predicate declaration at its name, which ends the quiet after a syntax
+        error: in the predicates section only a declaration starts with an identifier.
+        """
+        self.check_cancelled()
+        self.quiet = False
+        self.name = self.current_token
+        unit = self.open_unit(PredicateDecl)
+        self.parameters = [] if unit is None else unit.parameters
+
+    def parameter(self):
+        """
+        Add the data type just matched to the parameters of the declaration.
+        """
+        self.parameters.append(self.previous_token)
+
+    def declare(self):
+        """
+        Record the signature of the declared predicate.
+        """
+        self.dict_identifiers[self.name.symbol] = tuple(token.token_type for token in self.parameters)
+
+    def end_unit(self):
+        """
+        End a declaration or clause. Unless recovery popped it, a clause has reached its
+        '.', which ends the quiet after a syntax error in it.
+        """
+        self.parent = self.section_node
+        self.quiet = False
+
+    def start_clause(self):
+        """
+        Start a fact or rule at the name of its predicate, which must be declared.
+        """
+        self.check_cancelled()
+        self.name = self.current_token
+        self.declared = self.dict_identifiers.get(self.name.symbol)
+        if self.semantic and self.declared is None:
+            self.error_found()
+
+    def start_fact(self):
+        """
+        Start a fact, once its '(' or '.' shows it is one.
+        """
+        unit = self.open_unit(Fact)
+        self.add_leaf('Predicate ID', self.name)
+        self.arguments = [] if unit is None else unit.arguments
+
+    def start_rule(self):
+        """
+        Start a rule; only predicates without parameters have rules.
+        """
+        if self.semantic and self.declared:
+            self.error_found()
+        self.open_unit(Rule)
+        self.add_leaf('Predicate ID', self.name)
+
+    def argument(self):
+        """
+        Add the value, or a goal's variable, just matched to the arguments of the fact
+        or goal.
+        """
+        self.arguments.append(self.previous_token)
+
+    def check_values(self):
+        """
+        Check the values of a fact or goal against the signature of its predicate.
+        """
+        if self.semantic and self.declared is not None and not matches(self.arguments, self.declared):
+            self.error_found()
+
+    def start_write(self):
+        """
+        Start a write statement.
+        """
+        self.open_statement('write statement')
+
+    def start_read(self):
+        """
+        Start a readln, readint or readchar statement, which binds a variable of the type
+        its keyword reads.
+        """
+        self.open_statement('read statement')
+        self.read_type = READ_TYPES[self.current_token.token_type]
+
+    def end_statement(self):
+        """
+        End a statement, so that the leaves that follow go to the rule again.
+        """
+        self.parent = self.unit
+
+    def check_written(self):
+        """
+        Check that the variable about to be written is bound to an integer.
+        """
+        if self.semantic and self.dict_variables.get(self.current_token.symbol) != Token_type.integer:
+            self.error_found()
+
+    def bind(self):
+        """
+        Bind the variable a read statement is about to read, unless it is already bound.
+        """
+        token = self.current_token
+        if token.token_type != Token_type.variable:
+            return
+        if self.semantic and token.symbol in self.dict_variables:
+            self.error_found()
         else:
-            self.dict_variables[self.current_token.lex] = Token_type.char
-        if self.consume(Token_type.variable):
-            read_list.append('Variable')
-        if self.consume(Token_type.close_bracket):
-            read_list.append(')')
-        self.add_node(read_list, 3, -1)
+            self.dict_variables[token.symbol] = self.read_type
+
+    def start_expression(self):
+        """
+        Start an arithmetic or relational statement.
+        """
+        self.open_statement('Statement')
+        self.operand_types = set()
+
+    def operand(self):
+        """
+        Record the type of the operand just matched; a variable must be bound.
+        """
+        token = self.previous_token
+        if token.token_type in OPERAND_TYPES:
+            self.operand_types.add(token.token_type)
+        elif token.symbol in self.dict_variables:
+            self.operand_types.add(self.dict_variables[token.symbol])
+        elif self.semantic:
+            self.error_found(token)
+
+    def end_expression(self):
+        """
+        End an arithmetic or relational statement, whose operands must have one type.
+        """
+        if self.semantic and len(self.operand_types) > 1:
+            self.error_found()
+        self.parent = self.unit
+
+    def call(self):
+        """
+        Record the predicate the goal calls, which must be declared.
+        """
+        self.name = self.previous_token
+        if self.unit is not None:
+            self.unit.name = self.name
+        self.declared = self.dict_identifiers.get(self.name.symbol)
+        if self.semantic and self.declared is None:
+            self.error_found(self.name)
+
+    def check_arity(self):
+        """
+        Check that a goal without values calls a predicate without parameters.
+        """
+        if self.semantic and self.declared:
+            self.error_found()
+
+    def display_parse_tree(self):
+        """
+        Display the parse tree, as an nltk Tree.
+        """
+        return self.timed('tree', self.program_node.to_tree)
+
+
+class IncrementalParser(Parser):
+    """
+    A parser that can be re-run after the scanner's tokens change, reusing the result of
+    every predicate declaration and clause that is unaffected.
+
+    Each declaration or clause that parses without errors is cached under its first
+    token, together with the exact tokens it consumed and the state it read: the
+    signature of its predicate and the types of its variables. On the next parse() a
+    unit whose tokens are the very same Token objects (as Scanner.apply_edit keeps them)
+    and whose state matches is replayed instead of parsed, so only edited units and the
+    clauses of predicates whose declaration changed are checked again.
+    """
+
+    def __init__(self, scanner: Scanner, cancelled=None):
+        super().__init__(scanner, cancelled=cancelled)
+        self.cache = {}
+        self.previous_cache = {}
+        self.reused = 0
+        self.snapshot = None
+
+    def parse(self) -> Program:
+        """
+        Parse the scanner's current tokens from the start, reusing unchanged units.
+        """
+        self.scanner.rewind()
+        self.current_token = None
+        self.previous_token = None
+        self.dict_identifiers = dict()
+        self.dict_variables = dict()
+        self.diagnostics = []
+        self.truncated = False
+        self.program_node = Program()
+        self.section_node = None
+        self.unit = None
+        self.section = ''
+        self.snapshot = None
+        self.previous_cache, self.cache = self.cache, {}
+        self.reused = 0
+        try:
+            return super().parse()
+        except ParseCancelled:
+            # keep the units the cancelled parse did not reach for the next one
+            self.cache = {**self.previous_cache, **self.cache}
+            raise
+
+    def start_declaration(self):
+        self.quiet = False  # as Parser.start_declaration does, before replayed() looks at it
+        if not self.replayed():
+            super().start_declaration()
+
+    def start_clause(self):
+        if not self.replayed():
+            super().start_clause()
 
-    def statements(self):
+    def replayed(self) -> bool:
         """
-        Parse statements.
+        Replay a cached unit starting at the current token, popping the rest of its
+        production off the stack, or note where it starts so that end_unit() can cache it.
+        """
+        self.check_cancelled()
+        self.snapshot = None
+        tokens = self.scanner.tokens
+        if not isinstance(tokens, list):
+            return False
+        first = self.current_token
+        start = self.scanner.current_token_index - 1
+        entry = self.previous_cache.get(first)
+        if entry is not None and self.replay(entry, tokens, start):
+            self.cache[first] = entry
+            self.reused += 1
+            while self.stack.pop()[2] != '@end_unit':
+                pass
+            self.replay_following(tokens)
+            return True
+        if self.diagnostics and self.diagnostics[-1].token is first:
+            return False  # recovery stopped at an error here, which hides the unit's own
+        if self.quiet:
+            return False  # the unit's own errors would not be reported, nor cached
+        self.snapshot = (first, start, len(self.diagnostics), self.recoveries, len(self.program_node.children),
+                         len(self.section_node.children), len(self.dict_variables))
+        return False
+
+    def replay_following(self, tokens):
+        """
+        Replay the cached units that directly follow a replayed one. Between two units
+        the stack holds the same symbols, so there is no need to expand each unit's
+        production from the table only to pop it again.
         """
-        type_list = []
-        statement_list = []
-        flag = False
         while True:
-            if self.current_token.token_type == Token_type.integer:
-                type_list.append(Token_type.integer)
-                self.consume(Token_type.integer)
-                statement_list.append('integer')
-            elif self.current_token.token_type == Token_type.real:
-                type_list.append(Token_type.real)
-                self.consume(Token_type.real)
-                statement_list.append('real')
-            elif self.current_token.token_type == Token_type.char:
-                type_list.append(Token_type.char)
-                self.consume(Token_type.char)
-                statement_list.append('char')
-            elif self.current_token.token_type == Token_type.string:
-                type_list.append(Token_type.string)
-                self.consume(Token_type.string)
-                statement_list.append('string')
-            elif self.current_token.lex not in self.dict_variables:
-                self.error_found(3)
-            else:
-                type_list.append(self.dict_variables[self.current_token.lex])
-                self.consume(Token_type.variable)
-                statement_list.append('Variable')
+            first = self.current_token
+            entry = self.previous_cache.get(first)
+            if entry is None:
+                return
+            self.check_cancelled()
+            if not self.replay(entry, tokens, self.scanner.current_token_index - 1):
+                return
+            self.cache[first] = entry
+            self.reused += 1
 
-            if not flag:
-                if self.current_token.token_type not in {Token_type.Relational_op, Token_type.Arithmetic_op}:
-                    self.error_found(3)
-                else:
-                    statement_list.append(self.current_token.lex)
-                    if self.current_token.token_type == Token_type.Relational_op:
-                        flag = True
-                        self.consume(Token_type.Relational_op)
-                    elif self.current_token.lex == "=":
-                        flag = True
-                        self.consume(Token_type.Arithmetic_op)
-                    else:
-                        self.consume(Token_type.Arithmetic_op)
+    def end_unit(self):
+        super().end_unit()
+        if self.snapshot is None:
+            return
+        first, start, errors, recoveries, top, nodes, variables = self.snapshot
+        self.snapshot = None
+        if (len(self.diagnostics) != errors or self.recoveries != recoveries or
+                len(self.program_node.children) != top):
+            return  # a unit with errors, even unreported ones, is parsed again every time
+        tokens = self.scanner.tokens
+        section = self.section_node.children
+        end = self.scanner.current_token_index - (1 if self.current_token else 0)
+        added = dict(islice(reversed(self.dict_variables.items()), len(self.dict_variables) - variables))
+        span = tuple(tokens[start:end + 1])
+        symbols = tuple(token.symbol for token in span[:end - start] if token.token_type == Token_type.variable)
+        read = tuple(None if symbol in added else self.dict_variables.get(symbol) for symbol in symbols)
+        declared = self.dict_identifiers.get(first.symbol)
+        self.cache[first] = (end - start, span, self.signature(first.symbol), symbols, read, section[nodes:], added,
+                             declared if self.section == 'predicates' else None)
+
+    def replay(self, entry, tokens, start):
+        consumed, span, signature, symbols, read, nodes, added, declared = entry
+        if len(span) == consumed and len(tokens) != start + consumed:
+            return False  # the unit ran into the end of the tokens, which has moved
+        # tokens have no __eq__, so this compares identities
+        if span != tuple(tokens[start:start + len(span)]):
+            return False
+        if signature != self.signature(span[0].symbol):
+            return False
+        if read != tuple(map(self.dict_variables.get, symbols)):
+            return False
+        self.section_node.children.extend(nodes)
+        self.dict_variables.update(added)
+        if declared is not None:
+            self.dict_identifiers[span[0].symbol] = declared
+        self.scanner.current_token_index = start + consumed
+        self.advance()
+        self.quiet = False  # as the unit's end_unit would have left it
+        return True
+
+    def signature(self, name):
+        """
+        The part of the declarations a unit depends on: for a clause, its predicate's
+        signature (or None when undeclared); declarations depend on nothing.
+        """
+        if self.section == 'predicates':
+            return None
+        declared = self.dict_identifiers.get(name)
+        return None if declared is None else tuple(declared)
+
+
+class Validator(Parser):
+    """
+    A parser that only recognizes: it runs the same table and actions as Parser,
+    consuming the same tokens and finding the same errors, but builds no tree. Its table
+    has no leaf labels, and the methods that build nodes do nothing. The only things it
+    keeps are the predicate signatures and variable types the checks need, and a
+    Diagnostic per error.
+
+    validate() returns the diagnostics, the same as Parser.parse() would record. Over a
+    streaming Scanner memory grows only with the number of distinct names in the
+    source, not with its length.
+    """
+    start = compile_table(leaves=False)
+
+    def __init__(self, scanner: Scanner, metrics=None, cancelled=None, semantic=True, max_errors=None):
+        super().__init__(scanner, metrics, cancelled, semantic, max_errors)
+        self.program_node = None
+
+    def validate(self) -> list:
+        """
+        Check the input and return the list of diagnostics, empty if it is valid.
+        """
+        self.advance()
+        try:
+            self.program()
+        except ErrorLimitReached:
+            self.truncated = True
+        return self.diagnostics
+
+    def parse(self):
+        raise TypeError("Validator builds no tree; call validate()")
+
+    def add_leaf(self, label, token):
+        pass
+
+    def open_section(self, label):
+        pass
+
+    def open_unit(self, node_type):
+        return None
+
+    def open_goal(self):
+        return None
+
+    def open_statement(self, label):
+        pass
+
+
+def parse_source(text, cache=None, instrument=False, validate=False, max_errors=None):
+    """
+    Scan and parse one program and return its result: token count, error list, whether
+    parsing stopped at max_errors, the exception if the parser crashed, and the time
+    taken. With a prolog_cache.ParseCache the result of an unchanged source is loaded
+    instead, with all its errors. With instrument, the result also holds the
+    Metrics.to_dict() of the run under 'metrics'. With validate, and no cache, the
+    program is checked by a Validator without building its tree.
+    """
+    started = time.perf_counter()
+    metrics = Metrics() if instrument else None
+    if cache is not None:
+        entry = cache.parse(text) if metrics is None else metrics.timed('cache', cache.parse, text)
+        result = {'tokens': len(entry.tokens), 'errors': entry.error_list, 'truncated': False,
+                  'exception': entry.exception}
+        if metrics is not None:
+            metrics.count_tokens(entry.tokens)
+            metrics.errors += len(entry.error_list)
+    else:
+        scanner = Scanner(text, metrics=metrics)
+        parser = (Validator if validate else Parser)(scanner, max_errors=max_errors)
+        exception = None
+        try:
+            if validate:
+                parser.validate()
             else:
-                if self.current_token.token_type == Token_type.Relational_op or self.current_token.lex == "=":
-                    self.error_found(3)
-                elif self.current_token.token_type == Token_type.Arithmetic_op:
-                    statement_list.append(self.current_token.lex)
-                    self.consume(Token_type.Arithmetic_op)
-                elif self.current_token.token_type in {Token_type.And, Token_type.Or}:
-                    break
-                else:
-                    self.error_found(3)
-
-        if len(set(type_list)) != 1:
-            self.error_found(3)
-        self.add_node('Statement', 3, -1)
-        self.add_node(statement_list, 3, -1)
-
-    def section_goal(self):
-        """
-        Parse the goal section.
-        """
-        if self.consume(Token_type.goal, 'Goal'):
-            self.add_node(['goal'])
-        goal_ident = self.current_token.lex
-        if goal_ident not in self.dict_identifiers:
-            self.error_found(5)
-        self.consume(Token_type.identifier, 'Predicate ID', 5)
-        if self.current_token.token_type == Token_type.open_bracket:
-            self.value_list(goal_ident)
-        elif self.dict_identifiers[goal_ident]:
-            self.error_found(5)
-        self.consume(Token_type.Dot, '.', 5)
-        if self.current_token:
-            self.error_found(5)
-
-    def goal_value(self, goal_ident):
-        """
-        Parse goal values.
-        """
-        self.consume(Token_type.open_bracket, '(', 5)
-        value_list = [self.values()]
-        while self.current_token.token_type == Token_type.And:
-            self.consume(Token_type.And, ',', 5)
-            value_list.append(self.values())
-        self.consume(Token_type.close_bracket, ')', 5)
-        if value_list != self.dict_identifiers[goal_ident]:
-            self.error_found(5)
-
-    def display_parse_tree(self) -> Tree:
-        """
-        Display the parse tree.
-        """
-        parse_tree = Tree('Program', [])
-        self.build_parse_tree(parse_tree, self.Nodes)
-        return parse_tree
-
-    def build_parse_tree(self, parent: Tree, nodes_list: list):
-        """
-        Build the parse tree recursively.
-        """
-        while nodes_list:
-            node = nodes_list.pop(0)
-            if isinstance(node, str):
-                item = Tree(node, [])
-                parent.append(item)
-            elif isinstance(node, list):
-                new_parent = parent[-1]
-                self.build_parse_tree(new_parent, node)
+                parser.parse()
+        except Exception as error:
+            exception = f"{type(error).__name__}: {error}"
+        result = {'tokens': len(scanner.tokens), 'errors': parser.error_list, 'truncated': parser.truncated,
+                  'exception': exception}
+    result['seconds'] = round(time.perf_counter() - started, 6)
+    if metrics is not None:
+        result['metrics'] = metrics.to_dict()
+    return result
+
+
+def parse_file(path, cache=None, instrument=False, validate=False, max_errors=None):
+    """
+    Parse one source file and return its parse_source() result with its path.
+    """
+    with open(path, encoding='utf-8', errors='replace') as source:
+        return {'path': str(path), **parse_source(source.read(), cache, instrument, validate, max_errors)}
+
+
+def parallel_map(function, items, workers=None, chunksize=64):
+    """
+    Map function over items across a pool of worker processes, yielding results in the
+    order of items as soon as each is ready. Items are sent to the workers chunksize at
+    a time; with a single worker everything runs in this process.
+    """
+    if workers == 1:
+        yield from map(function, items)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(function, items, chunksize=chunksize)
+
+
+def batch(paths, workers=None, chunksize=64, cache=None, instrument=False, validate=False, max_errors=None):
+    """
+    Parse every path, yielding one parse_file() result per path in order.
+    """
+    return parallel_map(partial(parse_file, cache=cache, instrument=instrument, validate=validate,
+                                max_errors=max_errors), paths, workers, chunksize)
+
+
+def parse_programs(text, workers=1, chunksize=4, cache=None, instrument=False, validate=False, max_errors=None):
+    """
+    Split text into the programs concatenated in it and parse each one on its own,
+    optionally across worker processes. Yields one parse_source() result per program,
+    in order, with the offset and line at which the program starts in text.
+    """
+    offsets = program_offsets(text)
+    ends = offsets[1:] + [len(text)]
+    shards = (text[start:end] for start, end in zip(offsets, ends))
+    line = 1
+    previous = 0
+    results = parallel_map(partial(parse_source, cache=cache, instrument=instrument, validate=validate,
+                                   max_errors=max_errors), shards, workers, chunksize)
+    for offset, result in zip(offsets, results):
+        line += text.count('\n', previous, offset)
+        previous = offset
+        yield {'offset': offset, 'line': line, **result}
+
+
+def source_files(directory, pattern='*'):
+    """
+    The files under directory matching pattern, sorted so batch output is deterministic.
+    """
+    from pathlib import Path
+    return sorted(path for path in Path(directory).rglob(pattern) if path.is_file())
+
+
+def solve(path, goal=None, index_all=False, limit=None):
+    """
+    Parse a file, load its facts and print each answer to its goal, or to goal, as a
+    JSON line. A file with errors is not answered. Raises ValueError if goal cannot be
+    parsed or does not fit its predicate.
+    """
+    from prolog_engine import FactDatabase, parse_goal
+    if goal is not None:
+        goal = parse_goal(goal)
+    scanner = Scanner.from_file(path)
+    try:
+        parser = Parser(scanner)
+        program = parser.parse()
+        if parser.diagnostics:
+            for message in parser.error_list:
+                print(message, file=sys.stderr)
+            return 1
+        database = FactDatabase.from_program(program, index_all)
+        answers = database.ask(program.goal) if goal is None else database.solve(*goal)
+        count = 0
+        for answer in islice(answers, limit):
+            print(json.dumps(answer))
+            count += 1
+    finally:
+        if isinstance(scanner.text, mmap.mmap):
+            scanner.text.close()  # the tokens' lexes are read from it until here
+    print(f"{count} {'answer' if count == 1 else 'answers'} from {len(database)} facts", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    import argparse
+    from pathlib import Path
+    arguments = argparse.ArgumentParser(prog='python -m prolog_parser', description='Headless Prolog scanning and parsing.')
+    commands = arguments.add_subparsers(dest='command', required=True)
+    batch_command = commands.add_parser('batch', help='parse every file under a directory and print one JSON line per file')
+    batch_command.add_argument('directory')
+    batch_command.add_argument('--pattern', default='*', help="glob matched recursively (default '*')")
+    batch_command.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (default: all cores)')
+    batch_command.add_argument('--chunksize', type=int, default=64, help='files sent to a worker at a time')
+    programs_command = commands.add_parser('programs', help='parse each program concatenated in a file and print one JSON line per program')
+    programs_command.add_argument('file')
+    programs_command.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (default: all cores)')
+    programs_command.add_argument('--chunksize', type=int, default=4, help='programs sent to a worker at a time')
+    commands.add_parser('lsp', help='run a language server over stdin and stdout')
+    solve_command = commands.add_parser('solve', help="answer a program's goal from its facts, one JSON line per answer")
+    solve_command.add_argument('file')
+    solve_command.add_argument('--goal', help="ask this goal instead of the program's, e.g. 'graph(c, X)'")
+    solve_command.add_argument('--index-all', action='store_true', help='index every argument, not only the first')
+    solve_command.add_argument('--limit', type=int, default=0, metavar='N', help='stop after N answers, 0 for all')
+    serve_command = commands.add_parser('serve', help='parse sources sent over a socket, one JSON line per request')
+    address = serve_command.add_mutually_exclusive_group()
+    address.add_argument('--socket', metavar='PATH', help='listen on this unix socket')
+    address.add_argument('--port', type=int, default=8765, help='listen on this localhost port (default 8765)')
+    serve_command.add_argument('--host', default='127.0.0.1', help='address to listen on with --port')
+    serve_command.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (default: all cores)')
+    serve_command.add_argument('--queue', type=int, default=256, metavar='N',
+                               help='distinct requests waiting for a worker before clients are held back (default 256)')
+    for command in (batch_command, programs_command, serve_command):
+        command.add_argument('--cache', metavar='DIR', help='reuse results of unchanged sources from this cache directory')
+        command.add_argument('--cache-size', type=int, default=1024, metavar='MB', help='evict least recently used entries beyond this size')
+        command.add_argument('--max-errors', type=int, default=100, metavar='N',
+                             help='stop parsing a source after N errors, 0 for no limit (default 100; ignored with --cache)')
+    for command in (batch_command, programs_command):
+        command.add_argument('--metrics', metavar='FILE', help='write phase timings and token, error and recovery counts here')
+        command.add_argument('--metrics-format', choices=('json', 'prometheus'), default='json')
+        command.add_argument('--validate', action='store_true',
+                             help='only check for errors, without building syntax trees (ignored with --cache)')
+    options = arguments.parse_args(argv)
+    if options.command == 'lsp':
+        from prolog_lsp import serve
+        return serve()
+    if options.command == 'solve':
+        try:
+            return solve(options.file, options.goal, options.index_all, options.limit or None)
+        except ValueError as error:
+            arguments.error(str(error))
+
+    cache = None
+    if options.cache:
+        from prolog_cache import ParseCache
+        cache = ParseCache(options.cache, options.cache_size << 20)
+    if options.command == 'serve':
+        from prolog_service import run
+        return run(options.socket, options.host, options.port, options.workers, options.queue, cache,
+                   options.max_errors or None)
+    instrument = options.metrics is not None
+    if options.command == 'batch':
+        results = batch(source_files(options.directory, options.pattern), options.workers, options.chunksize,
+                        cache, instrument, options.validate, options.max_errors or None)
+    else:
+        with open(options.file, encoding='utf-8', errors='replace') as source:
+            results = parse_programs(source.read(), options.workers, options.chunksize, cache, instrument,
+                                     options.validate, options.max_errors or None)
+    metrics = Metrics()
+    count = failed = 0
+    started = time.perf_counter()
+    for result in results:
+        if 'path' in result:
+            result['path'] = Path(result['path']).relative_to(options.directory).as_posix()
+        if instrument:
+            metrics.merge(result.pop('metrics'))
+        count += 1
+        failed += bool(result['errors'] or result['exception'])
+        print(json.dumps(result), flush=True)
+    if instrument:
+        metrics.seconds['wall'] = time.perf_counter() - started
+        metrics.calls['wall'] = 1
+        with open(options.metrics, 'w') as output:
+            output.write(metrics.to_json() + '\n' if options.metrics_format == 'json' else metrics.to_prometheus())
+    print(f"{count} {'files' if options.command == 'batch' else 'programs'}, {failed} with errors", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
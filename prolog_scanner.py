@@ -1,55 +1,537 @@
+import bisect
+import codecs
+import mmap
 import re
-from prolog_tokens import Token, Token_type, ReservedWords, Operators
+from array import array
+from collections import Counter
+from functools import partial
+from prolog_tokens import Token, Token_type, ReservedWords, Operators, ValuePatterns, CommentPatterns, SymbolTable
+
+CHUNK_SIZE = 1 << 16
+
+# ValuePatterns' string with a possessive repeat: on a line whose string is never closed
+# the string group fails without backtracking, and the error group takes the line once.
+STRING_PATTERN = r'"(?:\\[^\n]|[^"\\\n])*+"'
+
+# One pass over the source: the named group that matched classifies the token, and
+# comments are consumed by the same sweep. Characters no group matches are skipped.
+# The most frequent kinds come first; comments only have to precede the '/' operator.
+TOKEN_PATTERN = re.compile('|'.join('(?P<%s>%s)' % group for group in (
+    ('identifier', ValuePatterns[Token_type.identifier]),
+    ('variable', ValuePatterns[Token_type.variable]),
+    ('block_comment', CommentPatterns['block_comment']),
+    ('line_comment', CommentPatterns['line_comment']),
+    ('operator', '|'.join(re.escape(op) for op in sorted(Operators, key=len, reverse=True))),
+    ('string', STRING_PATTERN),
+    ('error', ValuePatterns[Token_type.error]),
+    ('real', ValuePatterns[Token_type.real]),
+    ('integer', ValuePatterns[Token_type.integer]),
+    ('char', ValuePatterns[Token_type.char]),
+    ('stray', "[':]"),
+)))
+
+BYTES_TOKEN_PATTERN = re.compile(TOKEN_PATTERN.pattern.encode())
+
+GROUP_TYPES = {
+    'variable': Token_type.variable,
+    'error': Token_type.error,
+    'real': Token_type.real,
+    'integer': Token_type.integer,
+    'char': Token_type.char,
+    'string': Token_type.string,
+}
+
+
+class TokenStatistics:
+    """
+    Tokens per type and how often each distinct lexeme occurs, kept up to date as a
+    Scanner lexes and re-lexes edits.
+    """
+
+    def __init__(self):
+        self.lexemes = {}  # Token_type -> Counter of lexemes
+
+    def counted(self, tokens):
+        """
+        Wrap a token iterator so the tokens it yields are counted as they pass.
+        """
+        lexemes = self.lexemes
+        for token in tokens:
+            counter = lexemes.get(token.token_type)
+            if counter is None:
+                counter = lexemes[token.token_type] = Counter()
+            lex = token.lex
+            counter[lex] = counter.get(lex, 0) + 1  # skips Counter.__missing__ for new lexemes
+            yield token
+
+    def add(self, tokens):
+        for _ in self.counted(tokens):
+            pass
+
+    def remove(self, tokens):
+        for token in tokens:
+            counter = self.lexemes[token.token_type]
+            counter[token.lex] -= 1
+            if not counter[token.lex]:
+                del counter[token.lex]
+                if not counter:
+                    del self.lexemes[token.token_type]
+
+    def count(self, token_type):
+        return self.lexemes[token_type].total() if token_type in self.lexemes else 0
+
+    def distinct(self, token_type):
+        return len(self.lexemes.get(token_type, ()))
+
+    @property
+    def tokens(self):
+        return sum(counter.total() for counter in self.lexemes.values())
+
+    def copy(self):
+        statistics = TokenStatistics()
+        statistics.lexemes = {token_type: counter.copy() for token_type, counter in self.lexemes.items()}
+        return statistics
 
 
 class Scanner:
-    def __init__(self, text):
-        self.tokens = self.find_tokens(text)
+    def __init__(self, text, chunk_size=CHUNK_SIZE, tokens=None, metrics=None, statistics=False):
+        self.text = None
+        self.metrics = metrics
+        # with statistics, a TokenStatistics of the current tokens, counted as they are lexed
+        self.statistics = TokenStatistics() if statistics else None
+        # the ids in Token.symbol of identifiers and variables; for adopted tokens it is
+        # rebuilt if an edit needs it
+        self.symbols = SymbolTable() if tokens is None else getattr(tokens, 'symbols', None)
+        if tokens is not None:
+            # tokens already scanned from text, e.g. loaded from a cache
+            self.text = text
+            self.tokens = tokens
+            self.stream = None
+        elif isinstance(text, str):
+            self.text = text
+            self.tokens = self.find_tokens(text) if metrics is None else metrics.timed('tokenize', self.find_tokens, text)
+            self.stream = None
+        elif isinstance(text, (bytes, bytearray, memoryview, mmap.mmap)):
+            # raw UTF-8 source: keep the compact array-backed token stream
+            self.text = text
+            self.tokens = TokenStream(text) if metrics is None else metrics.timed('tokenize', TokenStream, text)
+            self.symbols = self.tokens.symbols
+            self.stream = None
+        else:
+            # file object or iterable of chunks: tokens are produced on demand
+            self.tokens = None
+            self.stream = iter_tokens(read_chunks(text, chunk_size), self.symbols)
+            if self.statistics is not None:
+                self.stream = self.statistics.counted(self.stream)
+        if self.statistics is not None and (tokens is not None or isinstance(self.tokens, TokenStream)):
+            self.statistics.add(self.tokens)  # tokens scanned elsewhere, or a TokenStream's arrays
+        if metrics is not None:
+            # a stream is lexed while it is parsed, so its tokens are counted but not timed
+            if self.stream is not None:
+                self.stream = metrics.counted(self.stream)
+            else:
+                metrics.count_tokens(self.tokens)
         self.current_token_index = 0
+        # offsets of tokens from _shift_index on are behind by _shift (see apply_edit)
+        self._shift_index = len(self.tokens) if self.tokens is not None else 0
+        self._shift = 0
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Scan a file through a read-only memory map into a compact TokenStream.
+        """
+        with open(path, 'rb') as source:
+            if source.seek(0, 2) == 0:
+                return cls(b'')
+            return cls(mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ))
 
     def get_next_token(self):
+        if self.stream is not None:
+            return next(self.stream, None)
         if self.current_token_index < len(self.tokens):
+            if self.current_token_index >= self._shift_index:
+                self.settle(self.current_token_index + 1)
             token = self.tokens[self.current_token_index]
             self.current_token_index += 1
             return token
 
+    def rewind(self):
+        """
+        Start handing out tokens from the beginning again, e.g. to parse after an edit.
+        """
+        self.current_token_index = 0
+
     def find_tokens(self, text):
-        Tokens = []  # to add tokens to list
-        lines = re.sub(re.compile(r"/\*.*?\*/", re.DOTALL), "", text)
-        lines = re.sub(re.compile(r"//.*?$", re.MULTILINE), "", lines)
-        inside_comment = False
-
-        for line in lines.split('\n'):
-            if '*/' in line and inside_comment:
-                inside_comment = False
+        return self.collect(scan_text(text, symbols=self.symbols))
+
+    def collect(self, tokens):
+        """
+        List the tokens of an iterator, counting them into the statistics if kept.
+        """
+        if self.statistics is not None:
+            tokens = self.statistics.counted(tokens)
+        return list(tokens)
+
+    def location(self, offset):
+        """
+        Return the 1-based (line, column) of a source offset.
+        """
+        if self.text is None:
+            raise ValueError("a streamed source keeps no text to map offsets back to")
+        newline = '\n' if isinstance(self.text, str) else b'\n'
+        line_start = self.text.rfind(newline, 0, offset) + 1
+        return self.text.count(newline, 0, offset) + 1, offset - line_start + 1
+
+    def apply_edit(self, start, end, new_text):
+        """
+        Replace text[start:end] with new_text and re-lex only the damaged region.
+
+        Lexing restarts right after the last token that ends before the edited line,
+        which is never inside a comment or a string. It stops as soon as a new token
+        starts exactly where an old token after the edit now starts: the text from there
+        on is unchanged, so the remaining old tokens are kept. Their offsets are corrected
+        lazily, and the cost of an edit is proportional to the damaged region plus the
+        distance to the previous edit, not to the size of the source.
+        """
+        if not isinstance(self.tokens, list):
+            raise TypeError("only a Scanner built from a str can be edited")
+        if not 0 <= start <= end <= len(self.text):
+            raise ValueError(f"edit range {start}:{end} is outside the text")
+        tokens = self.tokens
+        count = len(tokens)
+        delta = len(new_text) - (end - start)
+        if self.symbols is None:
+            self.symbols = SymbolTable.from_tokens(tokens)
+        self.text = self.text[:start] + new_text + self.text[end:]
+
+        line_start = self.text.rfind('\n', 0, start) + 1
+        first = bisect.bisect_right(range(count), line_start, key=self._token_end)
+        restart = self._token_end(first - 1) if first else 0
+        old = bisect.bisect_left(range(count), end, lo=first, key=self._token_start)
+
+        relexed = []
+        for token in scan_text(self.text, restart, self.symbols):
+            while old < count and self._token_start(old) + delta < token.start:
+                old += 1
+            if old < count and self._token_start(old) + delta == token.start:
+                break
+            relexed.append(token)
+        else:
+            old = count
+
+        # make the pending shift uniform over the tokens that survive after the splice
+        if self._shift_index < first:
+            self.settle(first)
+        elif self._shift_index > old and self._shift:
+            for token in tokens[old:self._shift_index]:
+                token.start -= self._shift
+                token.end -= self._shift
+        if self.statistics is not None:
+            self.statistics.remove(tokens[first:old])
+            self.statistics.add(relexed)
+        tokens[first:old] = relexed
+        self._shift_index = first + len(relexed)
+        self._shift += delta
+        return first, old - first, len(relexed)
+
+    def settle(self, upto=None):
+        """
+        Apply pending offset corrections to the tokens before index ``upto`` (all by default).
+        """
+        upto = len(self.tokens) if upto is None else upto
+        if self._shift:
+            for token in self.tokens[self._shift_index:upto]:
+                token.start += self._shift
+                token.end += self._shift
+        if upto >= len(self.tokens):
+            self._shift = 0
+        self._shift_index = max(self._shift_index, upto)
+
+    def _token_start(self, index):
+        token = self.tokens[index]
+        return token.start + self._shift if index >= self._shift_index else token.start
+
+    def _token_end(self, index):
+        token = self.tokens[index]
+        return token.end + self._shift if index >= self._shift_index else token.end
+
+
+def scan_text(text, pos=0, symbols=None):
+    """
+    Yield the tokens of a complete text, starting at offset ``pos``, with the names of
+    identifiers and variables interned in ``symbols`` (a fresh SymbolTable by default).
+    """
+    if symbols is None:
+        symbols = SymbolTable()
+    names = symbols.names
+    for match in TOKEN_PATTERN.finditer(text, pos):
+        kind = match.lastgroup
+        symbol = None
+        if kind == 'identifier':
+            word = match.group()
+            token_type = ReservedWords.get(word)
+            if token_type is None:
+                token_type = Token_type.identifier
+                symbol = symbols[word]
+                word = names[symbol]
+        elif kind == 'variable':
+            token_type = Token_type.variable
+            symbol = symbols[match.group()]
+            word = names[symbol]
+        elif kind == 'operator':
+            word = match.group()
+            token_type = Operators[word]
+        elif kind in GROUP_TYPES:
+            word = match.group()
+            token_type = GROUP_TYPES[kind]
+        else:
+            continue
+        start, end = match.span()
+        yield Token(word, token_type, start, end, symbol)
+
+
+# Candidate program boundaries: a 'predicates' keyword, skipping strings and comments
+# so that a keyword inside them is never taken for one. An unclosed string runs to the
+# end of its line, as the error token the lexers make of it does.
+PROGRAM_PATTERN = re.compile('|'.join('(?P<%s>%s)' % group for group in (
+    ('string', STRING_PATTERN + '?'),
+    ('block_comment', CommentPatterns['block_comment']),
+    ('line_comment', CommentPatterns['line_comment']),
+    ('predicates', r'predicates(?![a-zA-Z_0-9])'),
+)))
+
+
+def program_offsets(text):
+    """
+    Return the offsets at which the programs concatenated in ``text`` start: 0, and every
+    top-level 'predicates' keyword after the first token. A candidate found by the
+    pre-scan is confirmed by lexing its line up to it, so that a keyword which is only
+    the tail of a longer word is not split at.
+    """
+    offsets = [0]
+    resume = 0
+    for match in PROGRAM_PATTERN.finditer(text):
+        if match.lastgroup != 'predicates':
+            resume = match.end()
+            continue
+        start = match.start()
+        line = max(text.rfind('\n', 0, start) + 1, resume)
+        last = None
+        for last in scan_text(text[line:match.end()]):
+            pass
+        if last is None or last.start != start - line or last.token_type != Token_type.predicates:
+            continue
+        resume = match.end()
+        if len(offsets) == 1 and next(scan_text(text[:start]), None) is None:
+            continue  # only blanks and comments before the first program
+        offsets.append(start)
+    return offsets
+
+
+def text_edit(old, new):
+    """
+    Return (start, end, new_text) such that replacing old[start:end] with new_text gives new.
+    """
+    low, high = 0, min(len(old), len(new))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[:middle] == new[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    prefix = low
+    low, high = 0, min(len(old), len(new)) - prefix
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[len(old) - middle:] == new[len(new) - middle:]:
+            low = middle
+        else:
+            high = middle - 1
+    return prefix, len(old) - low, new[prefix:len(new) - low]
+
+
+class TokenStream:
+    """
+    Token storage without a Python object per token.
+
+    Token types live in an array('B') and start and end offsets into the source in two
+    array('I'), about nine bytes per token. Lexemes stay in the source (str, bytes or an
+    mmap) and are sliced out on demand; indexing builds a Token view, so the stream can
+    stand in for a list of Tokens. Passing ``columns`` (types, starts, ends) adopts
+    arrays scanned earlier instead of scanning ``source``.
+    """
+    __slots__ = ('source', 'types', 'starts', 'ends', 'symbols')
+
+    def __init__(self, source, columns=None):
+        self.source = source
+        self.symbols = SymbolTable()  # filled with names as tokens are built
+        if columns is not None:
+            self.types, self.starts, self.ends = columns
+            return
+        self.types = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        if isinstance(source, str):
+            pattern, reserved, operators = TOKEN_PATTERN, RESERVED_CODES, OPERATOR_CODES
+        else:
+            pattern, reserved, operators = BYTES_TOKEN_PATTERN, BYTES_RESERVED_CODES, BYTES_OPERATOR_CODES
+        add_type = self.types.append
+        add_start = self.starts.append
+        add_end = self.ends.append
+        for match in pattern.finditer(source):
+            kind = match.lastgroup
+            if kind == 'identifier':
+                code = reserved.get(match.group(), IDENTIFIER_CODE)
+            elif kind == 'operator':
+                code = operators[match.group()]
+            elif kind in GROUP_CODES:
+                code = GROUP_CODES[kind]
+            else:
                 continue
-            if inside_comment:
+            add_type(code)
+            start, end = match.span()
+            add_start(start)
+            add_end(end)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        code = self.types[index]
+        lex = self.lexeme(index)
+        symbol = None
+        if code == IDENTIFIER_CODE or code == VARIABLE_CODE:
+            symbol = self.symbols[lex]
+            lex = self.symbols.names[symbol]
+        return Token(lex, TOKEN_TYPES[code], self.starts[index], self.ends[index], symbol)
+
+    def __iter__(self):
+        for index in range(len(self.types)):
+            yield self[index]
+
+    def lexeme(self, index):
+        lex = self.source[self.starts[index]:self.ends[index]]
+        return lex if isinstance(lex, str) else bytes(lex).decode()
+
+
+# the Token_type of each code, as the token arrays and the binary formats store them
+TOKEN_TYPES = [None] * (max(token_type.value for token_type in Token_type) + 1)
+for token_type in Token_type:
+    TOKEN_TYPES[token_type.value] = token_type
+IDENTIFIER_CODE = Token_type.identifier.value
+VARIABLE_CODE = Token_type.variable.value
+GROUP_CODES = {kind: token_type.value for kind, token_type in GROUP_TYPES.items()}
+RESERVED_CODES = {word: token_type.value for word, token_type in ReservedWords.items()}
+OPERATOR_CODES = {operator: token_type.value for operator, token_type in Operators.items()}
+BYTES_RESERVED_CODES = {word.encode(): code for word, code in RESERVED_CODES.items()}
+BYTES_OPERATOR_CODES = {operator.encode(): code for operator, code in OPERATOR_CODES.items()}
+
+
+def read_chunks(source, chunk_size=CHUNK_SIZE):
+    """
+    Turn a file object or an iterable of strings into an iterator of text chunks. A
+    file opened in binary mode is read as UTF-8, as a memory-mapped source is.
+    """
+    if hasattr(source, 'read'):
+        empty = source.read(0)  # '' or b'', whichever read() returns at the end of the file
+        chunks = iter(partial(source.read, chunk_size), empty)
+        return codecs.iterdecode(chunks, 'utf-8') if isinstance(empty, bytes) else chunks
+    return iter(source)
+
+
+def iter_tokens(chunks, symbols=None):
+    """
+    Yield tokens lazily from an iterable of text chunks.
+
+    Between chunks only the unfinished tail of the input is kept: a token that touches
+    the end of the buffer is held back until more input decides it, and the body of a
+    comment is dropped as soon as it is seen. Memory therefore stays bounded by twice
+    the longest line, however large the source is. Chunks are read until they add at
+    least as much as is held back, so a token spanning many chunks is searched again a
+    number of times logarithmic in its length, and lexing stays linear.
+    """
+    if symbols is None:
+        symbols = SymbolTable()
+    names = symbols.names
+    chunks = iter(chunks)
+    buffer = ''
+    base = 0  # source offset of buffer[0]
+    comment = None
+    eof = False
+    while not eof:
+        parts = [buffer]
+        added = 0
+        while True:
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+                break
+            parts.append(chunk)
+            added += len(chunk)
+            if added >= len(buffer):
+                break
+        buffer = ''.join(parts)
+        end = len(buffer)
+        pos = 0
+        while True:
+            if comment == '/*':
+                close = buffer.find('*/', pos)
+                if close == -1:
+                    # keep a trailing '*' in case the next chunk starts with '/'
+                    pos = max(pos, end - 1)
+                    break
+                pos = close + 2
+                comment = None
+            elif comment == '//':
+                newline = buffer.find('\n', pos)
+                if newline == -1:
+                    pos = end
+                    break
+                pos = newline + 1
+                comment = None
+
+            match = TOKEN_PATTERN.search(buffer, pos)
+            if match is None:
+                pos = end
+                break
+            kind = match.lastgroup
+            start, stop = match.span()
+            if kind == 'block_comment':
+                if not eof and (stop - start < 4 or buffer[stop - 2:stop] != '*/'):
+                    # unterminated so far: drop the body, keep a trailing '*'
+                    comment = '/*'
+                    pos = max(start + 2, stop - 1)
+                    break
+                pos = stop
                 continue
-            if '/*' in line:
-                inside_comment = True
+            if kind == 'line_comment':
+                if not eof and stop == end:
+                    comment = '//'
+                pos = stop
                 continue
-            words = re.findall(
-                r"[0-9]*[a-zA-Z_]+[0-9]*|[0-9]+(?:\.[0-9]+)?|'[a-zA-Z0-9]?'|\"(?:\\.|[^\"])*\"|<=|>=|<|:-|>|\.|<>|[(){};,\[\]=+\-*/]",
-                line)
-            for word in words:
-                if word.strip() == "":
-                    continue
-                elif word in ReservedWords:
-                    Tokens.append(Token(word, ReservedWords[word]))
-                elif word in Operators:
-                    Tokens.append(Token(word, Operators[word]))
-                elif re.match(r"^[a-z][a-zA-Z0-9_]*$", word):
-                    Tokens.append(Token(word, Token_type.identifier))
-                elif re.match(r"^[A-Z_][a-zA-Z0-9_]*$", word):
-                    Tokens.append(Token(word, Token_type.variable))
-                elif re.match(r"^[0-9]+$", word):
-                    Tokens.append(Token(word, Token_type.integer))
-                elif re.match(r"^'[a-zA-Z0-9]?'$", word):
-                    Tokens.append(Token(word, Token_type.char))
-                elif re.match(r"^[0-9]+(\.[0-9]+)?$", word):
-                    Tokens.append(Token(word, Token_type.real))
-                elif word.startswith('"') and word.endswith('"'):
-                    Tokens.append(Token(word, Token_type.string))
+            if not eof and end - stop < 2:
+                # the token may still grow ('1.' + '5', '<' + '=', an unclosed string that
+                # the next chunk closes) once more input arrives
+                pos = start
+                break
+            word = match.group()
+            if kind != 'stray':  # a lone quote or colon is skipped
+                symbol = None
+                if kind == 'identifier':
+                    token_type = ReservedWords.get(word)
+                    if token_type is None:
+                        token_type = Token_type.identifier
+                        symbol = symbols[word]
+                elif kind == 'operator':
+                    token_type = Operators[word]
                 else:
-                    Tokens.append(Token(word, Token_type.error))
-        return Tokens
+                    token_type = GROUP_TYPES[kind]
+                    if kind == 'variable':
+                        symbol = symbols[word]
+                if symbol is not None:
+                    word = names[symbol]
+                yield Token(word, token_type, base + start, base + stop, symbol)
+            pos = stop
+        buffer = buffer[pos:]
+        base += pos
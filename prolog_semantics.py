@@ -0,0 +1,175 @@
+"""
+Declaration and type checks over a parsed Program, separate from parsing.
+
+Parse with Parser(scanner, semantic=False) to check only the syntax, then pass the tree
+to check(). The predicate declarations are indexed first. After that every fact and
+rule is checked on its own, against the index and an environment holding only that
+rule's variables, so clauses can be checked in batches on several processes.
+
+The checks are the ones Parser makes while parsing when semantic=True:
+- clauses and the goal must name a declared predicate
+- the values of a fact or goal must match its signature
+- only predicates without parameters have rules
+- a read statement binds a new variable
+- write takes bound integer variables
+- the operands of an arithmetic or relational statement have one type
+
+Parser keeps one variable table for the whole program. check() scopes variables to
+their rule, as Prolog does, unless shared_variables is set.
+"""
+from functools import partial
+
+from prolog_ast import Rule
+from prolog_tokens import Token_type, ValueDataTypes
+
+READ_TYPES = {
+    Token_type.readln: Token_type.string,
+    Token_type.readint: Token_type.integer,
+    Token_type.readchar: Token_type.char,
+}
+OPERAND_TYPES = {Token_type.integer, Token_type.real, Token_type.char, Token_type.string}
+
+
+class PredicateIndex:
+    """
+    The signature of each declared predicate, a tuple of data types keyed by the
+    symbol id of its name. A later declaration of a name replaces an earlier one, as in
+    Parser, so a name also fixes the arity.
+    """
+
+    def __init__(self, predicates=()):
+        self.signatures = {}
+        for declaration in predicates:
+            self.declare(declaration)
+
+    def declare(self, declaration):
+        signature = tuple(token.token_type for token in declaration.parameters)
+        self.signatures[declaration.name.symbol] = signature
+
+    def signature(self, name):
+        """
+        The signature of the predicate a name token refers to, or None if undeclared.
+        """
+        return self.signatures.get(name.symbol)
+
+
+def matches(arguments, signature):
+    """
+    Whether the value and variable tokens of a fact or goal fit a signature: a
+    variable, which only a goal can have, fits any data type.
+    """
+    if tuple(ValueDataTypes.get(token.token_type) for token in arguments) == signature:
+        return True
+    return len(arguments) == len(signature) and all(
+        token.token_type == Token_type.variable or ValueDataTypes[token.token_type] == data_type
+        for token, data_type in zip(arguments, signature))
+
+
+def error(token, reason):
+    return f"Error at token: {token.lex} of type {token.token_type}: {reason}"
+
+
+def clause_unit(clause):
+    """
+    The parts of a fact or rule that check_unit() reads, as plain tuples of tokens that
+    can be sent to another process: (name, arguments, statements), where statements is
+    None for a fact and a list of (label, tokens) for a rule.
+    """
+    if isinstance(clause, Rule):
+        return clause.name, None, [(statement.label, [leaf.token for leaf in statement.children])
+                                   for statement in clause.body]
+    return clause.name, list(clause.arguments), None
+
+
+def check_unit(signatures, unit, variables=None):
+    """
+    Return the errors in one clause_unit(), given the predicate signatures by symbol.
+    ``variables`` maps the symbols of bound variables to their types; a rule gets an
+    empty environment of its own unless one is passed in.
+    """
+    name, arguments, statements = unit
+    signature = signatures.get(name.symbol)
+    if signature is None:
+        return [error(name, "undeclared predicate")]
+    if statements is None:
+        if arguments and not matches(arguments, signature):
+            return [error(name, f"values do not match the signature of {name.lex}")]
+        return []
+    if signature:
+        return [error(name, "only predicates without parameters can have rules")]
+
+    errors = []
+    if variables is None:
+        variables = {}
+    for label, tokens in statements:
+        if label == 'read statement':
+            for token in tokens:
+                if token.token_type == Token_type.variable:
+                    if token.symbol in variables:
+                        errors.append(error(token, "variable is already bound"))
+                    else:
+                        variables[token.symbol] = READ_TYPES[tokens[0].token_type]
+                    break
+        elif label == 'write statement':
+            for token in tokens:
+                if token.token_type == Token_type.variable:
+                    bound = variables.get(token.symbol)
+                    if bound is None:
+                        errors.append(error(token, "variable is not bound"))
+                        break
+                    if bound != Token_type.integer:
+                        errors.append(error(token, "write takes integer variables"))
+                        break
+        else:
+            operand_types = set()
+            for token in tokens:
+                if token.token_type in OPERAND_TYPES:
+                    operand_types.add(token.token_type)
+                elif token.token_type == Token_type.variable:
+                    bound = variables.get(token.symbol)
+                    if bound is None:
+                        errors.append(error(token, "variable is not bound"))
+                    else:
+                        operand_types.add(bound)
+            if len(operand_types) != 1 and tokens:
+                errors.append(error(tokens[0], "operands are not all of one type"))
+    return errors
+
+
+def check_goal(signatures, goal):
+    """
+    Return the errors in the goal, given the predicate signatures by symbol.
+    """
+    if goal is None or goal.name is None:
+        return []
+    name = goal.name
+    signature = signatures.get(name.symbol)
+    if signature is None:
+        return [error(name, "undeclared predicate")]
+    if goal.arguments:
+        if not matches(goal.arguments, signature):
+            return [error(name, f"values do not match the signature of {name.lex}")]
+    elif signature:
+        return [error(name, f"{name.lex} takes {len(signature)} values")]
+    return []
+
+
+def check(program, workers=1, chunksize=1024, shared_variables=False):
+    """
+    Return the semantic errors in a Program, in source order. With workers other than
+    1 the clauses are checked in chunks of ``chunksize`` on a process pool (None for
+    one process per core). shared_variables keeps one variable environment for the
+    whole program, as Parser does, which requires checking in order on one process.
+    """
+    from prolog_parser import parallel_map
+
+    index = PredicateIndex(program.predicates)
+    units = [clause_unit(clause) for clause in program.clauses]
+    if shared_variables:
+        variables = {}
+        results = [check_unit(index.signatures, unit, variables) for unit in units]
+    else:
+        results = parallel_map(partial(check_unit, index.signatures), units, workers, chunksize)
+    errors = [message for result in results for message in result]
+    errors.extend(check_goal(index.signatures, program.goal))
+    return errors
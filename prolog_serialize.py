@@ -0,0 +1,505 @@
+"""
+Serialized parse trees: a compact binary format that can be written while parsing and
+read back lazily, and a streaming JSON writer.
+
+The binary format holds the nodes in postorder, so a node is written once all its
+children are. Each node has:
+- its kind, a prolog_ast.NODE_CODES code
+- its number of children and of descendants
+- its label, as an id in an interned label table
+- its token (a leaf's token or a unit's name): the lexeme's id in an interned lexeme
+  table, its Token_type value and its start and end offsets in the source
+
+A file is a header followed by blocks of up to block_size nodes. Each block holds its
+node columns as arrays, and the labels and lexemes first used in it. An empty block
+ends the file. The descendant counts let a reader walk from any node to its children
+without building the nodes in between:
+
+    with open('tree.bin', 'wb') as output:
+        WritingParser(Scanner(source), TreeWriter(output)).parse()
+    reader = TreeReader.open('tree.bin')
+    for unit in reader.units():   # one declaration, clause or goal at a time
+        ...
+    program = reader.program      # or the whole tree
+
+write_json() streams a tree, or a TreeReader's root, as JSON text.
+"""
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+from prolog_ast import (NODE_CODES, NODE_TYPES, Leaf, Program, Section, Goal, PredicateDecl, Fact, Rule, make_node,
+                        attach)
+from prolog_parser import Parser
+from prolog_scanner import TOKEN_TYPES
+from prolog_tokens import Token, SymbolTable
+
+MAGIC = b'PLTREE\x00\x01'
+HEADER = struct.Struct('<8sB7x')  # magic, 1 if the columns are little-endian
+BLOCK = struct.Struct('<IIIII')  # nodes, new labels, new lexemes, label bytes, lexeme bytes
+# (typecode, name) in block order, widest first to keep columns aligned
+COLUMNS = (('I', 'children'), ('I', 'descendants'), ('I', 'starts'), ('I', 'ends'), ('i', 'lexemes'),
+           ('H', 'labels'), ('B', 'kinds'), ('B', 'types'))
+LEAF = NODE_CODES[Leaf]
+UNIT_CODES = frozenset(NODE_CODES[node_type] for node_type in (PredicateDecl, Fact, Rule, Goal))
+OUTER_CODES = frozenset((NODE_CODES[Program], NODE_CODES[Section]))
+LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+def _padding(size):
+    return b'\0' * (-size % 4)
+
+
+class TreeWriter:
+    """
+    Writes nodes to a binary output in postorder. Nodes are gathered into columns and
+    a block is written every block_size nodes, so output starts while the tree is still
+    being built. write() adds a whole subtree; close_node() adds a node whose children
+    were written just before it. finish() writes the last block and the end marker.
+    """
+
+    def __init__(self, output, block_size=65536):
+        self.output = output
+        self.block_size = block_size
+        self.labels = SymbolTable()
+        self.lexemes = SymbolTable()
+        self.written_labels = 0
+        self.written_lexemes = 0
+        self.count = 0
+        self.flushed = 0  # nodes written in earlier blocks
+        # for each subtree written whose parent is not yet, the index of its first node
+        self.firsts = array('q')
+        self.columns = {name: array(typecode) for typecode, name in COLUMNS}
+        output.write(HEADER.pack(MAGIC, LITTLE_ENDIAN))
+
+    def write(self, node):
+        """
+        Add node and all its descendants.
+        """
+        if type(node) is Leaf:
+            self.close_node(node, 0)
+            return
+        columns = self.columns
+        counts, descendants = columns['children'].append, columns['descendants'].append
+        starts, ends, lexemes = columns['starts'].append, columns['ends'].append, columns['lexemes'].append
+        labels, kinds, types = columns['labels'].append, columns['kinds'].append, columns['types'].append
+        label_ids, lexeme_ids = self.labels, self.lexemes
+        index = first = self.count
+        limit = self.flushed + self.block_size
+        # the nodes whose children are being written, with their first descendant's index
+        stack = [(node, index, iter(node.children))]
+        while stack:
+            parent, start, children = stack[-1]
+            for child in children:
+                if type(child) is not Leaf:
+                    stack.append((child, index, iter(child.children)))
+                    break
+                token = child.token
+                kinds(LEAF)
+                counts(0)
+                descendants(0)
+                labels(label_ids[child.label])
+                if token is None:
+                    lexemes(-1)
+                    types(0)
+                    starts(0)
+                    ends(0)
+                else:
+                    lexemes(lexeme_ids[token.lex])
+                    types(token.token_type.code)
+                    starts(token.start)
+                    ends(token.end)
+                index += 1
+                if index >= limit:
+                    self.count = index
+                    self.flush()
+                    limit = self.flushed + self.block_size
+            else:
+                stack.pop()
+                token = getattr(parent, 'name', None)
+                kinds(NODE_CODES[type(parent)])
+                counts(len(parent.children))
+                descendants(index - start)
+                labels(label_ids[parent.label])
+                if token is None:
+                    lexemes(-1)
+                    types(0)
+                    starts(0)
+                    ends(0)
+                else:
+                    lexemes(lexeme_ids[token.lex])
+                    types(token.token_type.code)
+                    starts(token.start)
+                    ends(token.end)
+                index += 1
+                if index >= limit:
+                    self.count = index
+                    self.flush()
+                    limit = self.flushed + self.block_size
+        self.count = index
+        self.firsts.append(first)
+
+    def close_node(self, node, children):
+        """
+        Add node, whose children are the last ``children`` subtrees added.
+        """
+        columns = self.columns
+        index = self.count
+        if children:
+            first = self.firsts[-children]
+            del self.firsts[-children:]
+        else:
+            first = index
+        self.firsts.append(first)
+        node_type = type(node)
+        token = node.token if node_type is Leaf else getattr(node, 'name', None)
+        columns['kinds'].append(NODE_CODES[node_type])
+        columns['children'].append(children)
+        columns['descendants'].append(index - first)
+        columns['labels'].append(self.labels[node.label])
+        if token is None:
+            columns['lexemes'].append(-1)
+            columns['types'].append(0)
+            columns['starts'].append(0)
+            columns['ends'].append(0)
+        else:
+            columns['lexemes'].append(self.lexemes[token.lex])
+            columns['types'].append(token.token_type.code)
+            columns['starts'].append(token.start)
+            columns['ends'].append(token.end)
+        self.count += 1
+        if self.count - self.flushed >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the nodes gathered so far as a block.
+        """
+        columns = self.columns
+        labels = self.labels.names[self.written_labels:]
+        lexemes = self.lexemes.names[self.written_lexemes:]
+        self.written_labels += len(labels)
+        self.written_lexemes += len(lexemes)
+        self.flushed = self.count
+        label_bytes = [label.encode() for label in labels]
+        lexeme_bytes = [lexeme.encode() for lexeme in lexemes]
+        label_data = b''.join(label_bytes)
+        lexeme_data = b''.join(lexeme_bytes)
+        write = self.output.write
+        write(BLOCK.pack(len(columns['kinds']), len(labels), len(lexemes), len(label_data), len(lexeme_data)))
+        write(array('I', map(len, label_bytes + lexeme_bytes)).tobytes())
+        write(label_data + lexeme_data + _padding(len(label_data) + len(lexeme_data)))
+        for typecode, name in COLUMNS:
+            column = columns[name]
+            data = column.tobytes()
+            write(data + _padding(len(data)))
+            del column[:]
+
+    def finish(self):
+        """
+        Write the last block and the end marker. The output is left open.
+        """
+        if self.columns['kinds']:
+            self.flush()
+        self.flush()  # an empty block ends the file
+
+
+def dump(node, output, block_size=65536):
+    """
+    Write the tree under node to a binary output.
+    """
+    writer = TreeWriter(output, block_size)
+    writer.write(node)
+    writer.finish()
+
+
+class WritingParser(Parser):
+    """
+    A parser that writes its tree to a TreeWriter as it goes. Each declaration and
+    clause is written as soon as it ends and then dropped, so with a streaming Scanner
+    the tree is never held in memory. parse() returns the Program with its sections
+    emptied; the full tree is in the output.
+    """
+
+    def __init__(self, scanner, writer, **options):
+        super().__init__(scanner, **options)
+        self.writer = writer
+        self.written = 0  # children of the current section already written
+
+    def parse(self):
+        program = super().parse()
+        self.close_section()
+        self.writer.close_node(program, len(program.children))
+        self.writer.finish()
+        return program
+
+    def end_unit(self):
+        super().end_unit()
+        self.write_section()
+
+    def open_section(self, label):
+        self.close_section()
+        super().open_section(label)
+
+    def open_goal(self):
+        self.close_section()
+        return super().open_goal()
+
+    def write_section(self):
+        """
+        Write the children the current section has gained since the last call.
+        """
+        children = self.section_node.children
+        for child in children:
+            self.writer.write(child)
+        self.written += len(children)
+        children.clear()
+
+    def close_section(self):
+        """
+        Write what remains of the current section, or the goal, and the node itself.
+        """
+        node = self.section_node
+        if node is None:
+            return
+        if type(node) is Goal:
+            self.writer.write(node)
+        else:
+            self.write_section()
+            self.writer.close_node(node, self.written)
+        self.written = 0
+        self.section_node = None
+
+
+class TreeReader:
+    """
+    A binary tree opened for reading. Opening copies the node columns of all blocks
+    into arrays and decodes the label and lexeme tables; no node is built until one
+    is asked for. Nodes are numbered in postorder, so the root is the last.
+
+    node(index) builds one subtree, units() each declaration, clause and goal in turn,
+    and program the whole tree. view(index) gives a NodeView that reads the columns
+    without building anything.
+    """
+
+    def __init__(self, data):
+        magic, little_endian = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("not a serialized tree")
+        self.columns = {name: array(typecode) for typecode, name in COLUMNS}
+        self.labels = []
+        self.lexemes = []
+        view = memoryview(data)
+        offset = HEADER.size
+        while True:
+            if offset + BLOCK.size > len(data):
+                raise ValueError("truncated tree: no end marker")
+            nodes, labels, lexemes, label_size, lexeme_size = BLOCK.unpack_from(data, offset)
+            offset += BLOCK.size
+            if not nodes and not labels and not lexemes:
+                break
+            lengths = array('I')
+            lengths.frombytes(view[offset:offset + 4 * (labels + lexemes)])
+            if little_endian != LITTLE_ENDIAN:
+                lengths.byteswap()
+            offset += 4 * (labels + lexemes)
+            strings = bytes(view[offset:offset + label_size + lexeme_size])
+            offset += label_size + lexeme_size + len(_padding(label_size + lexeme_size))
+            position = 0
+            for number, length in enumerate(lengths):
+                text = strings[position:position + length].decode()
+                (self.labels if number < labels else self.lexemes).append(text)
+                position += length
+            for typecode, name in COLUMNS:
+                size = array(typecode).itemsize * nodes
+                if offset + size > len(data):
+                    raise ValueError("truncated tree")
+                self.columns[name].frombytes(view[offset:offset + size])
+                offset += size + len(_padding(size))
+        if little_endian != LITTLE_ENDIAN:
+            for column in self.columns.values():
+                column.byteswap()
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open a file written by TreeWriter, through a read-only memory map.
+        """
+        with open(path, 'rb') as source:
+            return cls(mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self):
+        return len(self.columns['kinds'])
+
+    def token(self, index):
+        """
+        The token of node index, or None. Its symbol is the lexeme's id in the file, so
+        equal lexemes get equal symbols, as from one Scanner.
+        """
+        columns = self.columns
+        lexeme = columns['lexemes'][index]
+        if lexeme < 0:
+            return None
+        return Token(self.lexemes[lexeme], TOKEN_TYPES[columns['types'][index]], columns['starts'][index],
+                     columns['ends'][index], lexeme)
+
+    def rows(self, first, end):
+        """
+        Iterate over the kind, label, child count and token fields of nodes first to end.
+        """
+        columns = self.columns
+        return zip(*(columns[name][first:end]
+                     for name in ('kinds', 'labels', 'children', 'lexemes', 'types', 'starts', 'ends')))
+
+    def node(self, index):
+        """
+        Build the subtree rooted at node index.
+        """
+        label_names, lexemes = self.labels, self.lexemes
+        stack = []
+        push = stack.append
+        for kind, label, count, lexeme, code, start, end in self.rows(index - self.columns['descendants'][index],
+                                                                      index + 1):
+            token = None if lexeme < 0 else Token(lexemes[lexeme], TOKEN_TYPES[code], start, end, lexeme)
+            if kind == LEAF:
+                push(Leaf(label_names[label], token))
+                continue
+            node = make_node(NODE_TYPES[kind], label_names[label], token)
+            if count:
+                for child in stack[-count:]:
+                    attach(node, child)
+                del stack[-count:]
+            push(node)
+        return stack[0]
+
+    @property
+    def program(self):
+        return self.node(len(self) - 1)
+
+    def units(self):
+        """
+        Build and yield each predicate declaration, fact, rule and goal in source order.
+        Only one unit is held at a time, however large the file.
+        """
+        label_names, lexemes = self.labels, self.lexemes
+        stack = []
+        push = stack.append
+        for kind, label, count, lexeme, code, start, end in self.rows(0, len(self)):
+            if kind in OUTER_CODES:
+                del stack[:]
+                continue
+            token = None if lexeme < 0 else Token(lexemes[lexeme], TOKEN_TYPES[code], start, end, lexeme)
+            if kind == LEAF:
+                push(Leaf(label_names[label], token))
+                continue
+            node = make_node(NODE_TYPES[kind], label_names[label], token)
+            if count:
+                for child in stack[-count:]:
+                    attach(node, child)
+                del stack[-count:]
+            if kind in UNIT_CODES:
+                del stack[:]  # leaves of the section, such as its keyword
+                yield node
+            else:
+                push(node)
+
+    def children(self, index):
+        """
+        The indexes of the children of node index, in order.
+        """
+        descendants = self.columns['descendants']
+        children = []
+        child = index - 1
+        for _ in range(self.columns['children'][index]):
+            children.append(child)
+            child -= descendants[child] + 1
+        children.reverse()
+        return children
+
+    def view(self, index=None):
+        """
+        A NodeView of node index, by default the root.
+        """
+        return NodeView(self, len(self) - 1 if index is None else index)
+
+
+class NodeView:
+    """
+    One node of a TreeReader, read from its columns when its attributes are used.
+    """
+    __slots__ = ('reader', 'index')
+
+    def __init__(self, reader, index):
+        self.reader = reader
+        self.index = index
+
+    @property
+    def node_type(self):
+        return NODE_TYPES[self.reader.columns['kinds'][self.index]]
+
+    @property
+    def label(self):
+        return self.reader.labels[self.reader.columns['labels'][self.index]]
+
+    @property
+    def token(self):
+        return self.reader.token(self.index)
+
+    @property
+    def children(self):
+        return [NodeView(self.reader, child) for child in self.reader.children(self.index)]
+
+
+def _token_json(token):
+    return {'lex': token.lex, 'type': token.token_type.name, 'start': token.start, 'end': token.end}
+
+
+def json_chunks(root):
+    """
+    Yield the JSON text of a tree, or of a NodeView, in pieces. A node is an object
+    with its kind and label, and then the token of a leaf or the children of any
+    other node.
+    """
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    stack = [root]
+    pop, push = stack.pop, stack.append
+    while stack:
+        node = pop()
+        if isinstance(node, str):
+            yield node
+            continue
+        node_type = node.node_type if isinstance(node, NodeView) else type(node)
+        head = f'{{"kind": "{node_type.__name__}", "label": {encode(node.label)}'
+        if node_type is Leaf:
+            token = node.token
+            yield f'{head}, "token": {"null" if token is None else encode(_token_json(token))}}}'
+            continue
+        children = node.children
+        if not children:
+            yield head + ', "children": []}'
+            continue
+        yield head + ', "children": ['
+        push(']}')
+        for position in range(len(children) - 1, -1, -1):
+            push(children[position])
+            if position:
+                push(', ')
+
+
+def write_json(root, output, buffer=1 << 16):
+    """
+    Write the JSON text of a tree or NodeView to a text output, about buffer
+    characters at a time.
+    """
+    pieces = []
+    size = 0
+    for piece in json_chunks(root):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= buffer:
+            output.write(''.join(pieces))
+            pieces.clear()
+            size = 0
+    output.write(''.join(pieces))
@@ -0,0 +1,249 @@
+"""
+A long-running asyncio service that scans and parses sources for many clients, so a
+CI fleet talks to one warm process instead of starting Python for every check:
+
+    python -m prolog_parser serve [--socket PATH | --port 8765] [--workers N] [--queue 256]
+
+Clients connect over a unix socket or a localhost TCP port and send one JSON object per
+line; answers come back one per line, in the order they finish:
+
+    {"id": 1, "source": "predicates ...", "validate": true, "max_errors": 100}
+    {"id": 1, "tokens": 42, "errors": [], "truncated": false, "exception": null,
+     "seconds": 0.0007, "coalesced": false}
+
+Every field but "source" is optional, and the answer is parse_source()'s result. A
+request {"id": 2, "stats": true} is answered at once with the service's statistics:
+requests seen, parses run, requests coalesced, queue depth now and at its deepest, times
+the process pool was restarted, and percentiles of the latency from reading a request to
+writing its answer.
+
+Requests are keyed by a hash of their source and options. While one is queued or being
+parsed, an identical request waits for the same result, so concurrent copies of a
+source are parsed once; its answer says "coalesced": true. Distinct requests wait in a
+bounded queue for --workers tasks, each feeding one parse at a time to a process pool.
+When the queue is full the service stops reading from the connection that sent the
+request until there is room, so a client that sends faster than the pool parses is
+slowed down instead of growing the queue without bound. If a worker process dies, the
+requests it broke are answered with the exception and a new pool takes over.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import deque
+from functools import partial
+
+from prolog_parser import parse_source
+
+MAX_REQUEST_BYTES = 1 << 26  # longest request line accepted
+LATENCY_HISTORY = 10000  # latencies kept for the percentiles
+
+
+def request_key(source, validate, max_errors):
+    """
+    The hash under which identical requests are coalesced.
+    """
+    digest = hashlib.sha256(json.dumps([validate, max_errors]).encode())
+    digest.update(source.encode('utf-8', 'surrogatepass'))
+    return digest.digest()
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else None
+
+
+class ParseService:
+    """
+    Coalesces, queues and parses requests; handle() serves one client connection.
+    The queue and tasks are created by serve(), on the loop that runs the service.
+    """
+
+    def __init__(self, workers=None, queue_size=256, cache=None, max_errors=100):
+        self.workers = workers or os.cpu_count()
+        self.queue_size = queue_size
+        self.cache = cache
+        self.max_errors = max_errors
+        self.queue = None
+        self.pool = None
+        self.pending = {}  # request key -> future of its result, while queued or running
+        self.latencies = deque(maxlen=LATENCY_HISTORY)
+        self.requests = 0
+        self.parsed = 0
+        self.coalesced = 0
+        self.running = 0
+        self.deepest = 0
+        self.restarts = 0
+
+    async def serve(self, socket_path=None, host='127.0.0.1', port=8765, ready=None):
+        """
+        Listen on socket_path, or on host and port, until cancelled. ready, if given,
+        is called with the listening server.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        self.queue = asyncio.Queue(self.queue_size)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            # start the worker processes and import the parser in them before any client waits
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(self.pool, parse_source, '') for _ in range(self.workers)))
+            tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+            if socket_path is not None:
+                server = await asyncio.start_unix_server(self.handle, socket_path, limit=MAX_REQUEST_BYTES)
+            else:
+                server = await asyncio.start_server(self.handle, host, port, limit=MAX_REQUEST_BYTES)
+            try:
+                async with server:
+                    if ready is not None:
+                        ready(server)
+                    await server.serve_forever()
+            finally:
+                for task in tasks:
+                    task.cancel()
+        finally:
+            self.pool.shutdown()  # the pool running now, which may have replaced a broken one
+
+    async def work(self):
+        """
+        Parse queued requests one at a time in the process pool.
+        """
+        from concurrent.futures.process import BrokenProcessPool
+        loop = asyncio.get_running_loop()
+        while True:
+            key, source, validate, max_errors, future = await self.queue.get()
+            self.running += 1
+            pool = self.pool
+            try:
+                result = await loop.run_in_executor(pool, partial(
+                    parse_source, source, self.cache, validate=validate, max_errors=max_errors))
+            except BrokenProcessPool as error:  # a worker process died, taking the pool with it
+                future.set_exception(error)
+                self.restart(pool)
+            except Exception as error:  # the request could not be sent
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+            finally:
+                self.running -= 1
+                self.parsed += 1
+                del self.pending[key]
+                self.queue.task_done()
+
+    def restart(self, broken):
+        """
+        Replace the broken pool with a new one, unless another task already has.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        if self.pool is broken:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            self.restarts += 1
+            broken.shutdown(wait=False)
+
+    async def enqueue(self, source, validate=False, max_errors=None):
+        """
+        Return the future of a request's result and whether it joined an identical
+        one already pending. Waits while the queue is full.
+        """
+        self.requests += 1
+        key = request_key(source, validate, max_errors)
+        future = self.pending.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return future, True
+        future = self.pending[key] = asyncio.get_running_loop().create_future()
+        await self.queue.put((key, source, validate, max_errors, future))
+        self.deepest = max(self.deepest, self.queue.qsize())
+        return future, False
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        milliseconds = {name: None if value is None else round(value * 1000, 3) for name, value in (
+            ('p50', percentile(latencies, 0.5)), ('p90', percentile(latencies, 0.9)),
+            ('p99', percentile(latencies, 0.99)), ('max', latencies[-1] if latencies else None))}
+        return {'requests': self.requests, 'parsed': self.parsed, 'coalesced': self.coalesced,
+                'queue_depth': self.queue.qsize() if self.queue is not None else 0, 'max_queue_depth': self.deepest,
+                'running': self.running, 'restarts': self.restarts, 'latency_ms': milliseconds}
+
+    async def handle(self, reader, writer):
+        """
+        Serve one connection: read requests until it closes, answering each as soon as
+        its result is ready.
+        """
+        answers = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError) as error:  # a line over the limit, or a reset
+                    self.write(writer, {'id': None, 'error': str(error)})
+                    break
+                if not line:
+                    break
+                started = time.perf_counter()
+                request_id = None
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise TypeError("a request must be a JSON object")
+                    request_id = request.get('id')
+                    if request.get('stats'):
+                        self.write(writer, {'id': request_id, **self.stats()})
+                        continue
+                    source = request['source']
+                    validate = bool(request.get('validate', False))
+                    max_errors = request.get('max_errors', self.max_errors)
+                    if not isinstance(source, str):
+                        raise TypeError("source must be a string")
+                    if max_errors is not None and (type(max_errors) is not int or max_errors < 0):
+                        raise ValueError("max_errors must be null or a non-negative integer")
+                    max_errors = max_errors or None
+                except (ValueError, KeyError, TypeError) as error:
+                    self.write(writer, {'id': request_id, 'error': f"bad request: {error}"})
+                    continue
+                future, coalesced = await self.enqueue(source, validate, max_errors)
+                answer = asyncio.create_task(self.answer(writer, request_id, future, coalesced, started))
+                answers.add(answer)
+                answer.add_done_callback(answers.discard)
+            if answers:
+                await asyncio.wait(answers)
+        finally:
+            writer.close()
+
+    async def answer(self, writer, request_id, future, coalesced, started):
+        try:
+            result = await asyncio.shield(future)
+        except Exception as error:
+            result = {'exception': f"{type(error).__name__}: {error}"}
+        self.latencies.append(time.perf_counter() - started)
+        self.write(writer, {'id': request_id, **result, 'coalesced': coalesced})
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    @staticmethod
+    def write(writer, message):
+        if not writer.is_closing():
+            writer.write(json.dumps(message).encode() + b'\n')
+
+
+def run(socket_path=None, host='127.0.0.1', port=8765, workers=None, queue_size=256, cache=None, max_errors=100):
+    """
+    Run a ParseService until interrupted, then print its statistics to stderr.
+    """
+    service = ParseService(workers, queue_size, cache, max_errors)
+
+    def ready(server):
+        where = socket_path if socket_path is not None else f"{host}:{port}"
+        print(f"serving on {where} with {service.workers} workers", file=sys.stderr, flush=True)
+
+    try:
+        asyncio.run(service.serve(socket_path, host, port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if socket_path is not None and os.path.exists(socket_path):
+            os.unlink(socket_path)
+        print(json.dumps(service.stats()), file=sys.stderr)
+    return 0
@@ -33,18 +33,66 @@ class Token_type(Enum):
     error = 29
 
 
+# Each member's value as a plain attribute. The table-driven parser and the columnar
+# token formats read it for every token, and the enum's value property costs about ten
+# times as much to read.
+for _token_type in Token_type:
+    _token_type.code = _token_type.value
+del _token_type
+
+
 class Token:
-    def __init__(self, lex, token_type):
+    __slots__ = ('lex', 'token_type', 'start', 'end', 'symbol')
+
+    def __init__(self, lex, token_type, start=None, end=None, symbol=None):
         self.lex = lex
         self.token_type = token_type
+        self.start = start  # offset of the first character in the source
+        self.end = end  # offset just past the last character
+        self.symbol = symbol  # id of an identifier's or variable's lex in the scanner's SymbolTable
 
     def to_dict(self):
         return {
             "Lex": self.lex,
-            "token_type": self.token_type
+            "token_type": self.token_type,
+            "start": self.start,
+            "end": self.end
         }
 
 
+class SymbolTable(dict):
+    """
+    Interns names to dense integer ids. ``table[lex]`` returns the id of lex, assigning
+    the next free one the first time lex is seen, and ``table.names[id]`` is the single
+    copy of the lexeme that every token with that id shares. Scanners intern only the
+    names of identifiers and variables: literals would make the table grow with every
+    distinct value in a streamed source.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.names = []
+
+    def __missing__(self, lex):
+        symbol = self[lex] = len(self.names)
+        self.names.append(lex)
+        return symbol
+
+    @classmethod
+    def from_tokens(cls, tokens):
+        """
+        Rebuild the table that the tokens' symbol ids were assigned from.
+        """
+        table = cls()
+        for token in tokens:
+            if token.symbol is not None and token.lex not in table:
+                dict.__setitem__(table, token.lex, token.symbol)
+        table.names = [None] * (max(table.values(), default=-1) + 1)
+        for lex, symbol in table.items():
+            table.names[symbol] = lex
+        return table
+
+
 ReservedWords = {
     "predicates": Token_type.predicates,
     "clauses": Token_type.clauses,
@@ -60,6 +108,15 @@ ReservedWords = {
     "real": Token_type.data_type_real,
 }
 
+# The declared data type that each kind of value literal satisfies.
+ValueDataTypes = {
+    Token_type.integer: Token_type.data_type_integer,
+    Token_type.identifier: Token_type.data_type_symbol,
+    Token_type.char: Token_type.data_type_char,
+    Token_type.string: Token_type.data_type_string,
+    Token_type.real: Token_type.data_type_real,
+}
+
 Operators = {
     "<": Token_type.Relational_op,
     "<=": Token_type.Relational_op,
@@ -78,3 +135,27 @@ Operators = {
     ")": Token_type.close_bracket,
     ":-": Token_type.imply
 }
+
+
+# Lexical patterns for the token classes that are not fixed words, in priority order.
+# They are written in the subset of regular-expression syntax that prolog_automaton
+# compiles into a DFA (literals, escapes, [classes], (?:groups), |, *, + and ?), and
+# prolog_scanner joins the same patterns into its master regex.
+ValuePatterns = {
+    Token_type.identifier: r"[a-z][a-zA-Z_]*[0-9]*",
+    Token_type.variable: r"[A-Z_][a-zA-Z_]*[0-9]*",
+    Token_type.string: r'"(?:\\[^\n]|[^"\\\n])*"',
+    # an unclosed string is one error token up to the end of its line, so neither lexer
+    # looks for the closing quote from every '"' on the line again
+    Token_type.error: r'[0-9]+[a-zA-Z_]+[0-9]*|[{}\[\]]|"(?:\\[^\n]|[^"\\\n])*\\?',
+    Token_type.real: r"[0-9]+\.[0-9]+",
+    Token_type.integer: r"[0-9]+",
+    Token_type.char: r"'[a-zA-Z0-9]?'",
+}
+
+# Comments are recognized like tokens and then dropped. An unterminated block comment
+# runs to the end of the input.
+CommentPatterns = {
+    "block_comment": r"/\*(?:[^*]|\*+[^*/])*\*+/|/\*(?:[^*]|\*+[^*/])*\**",
+    "line_comment": r"//[^\n]*",
+}
@@ -0,0 +1,24 @@
+import ast
+import unittest
+from pathlib import Path
+
+import prolog_cache
+import prolog_parser
+
+
+class CodeVersionTest(unittest.TestCase):
+    def test_hashes_every_module_the_parser_imports(self):
+        parser = Path(prolog_parser.__file__).resolve()
+        imported = {statement.module for statement in ast.parse(parser.read_bytes()).body
+                    if isinstance(statement, ast.ImportFrom)}
+        names = {path.stem for path in prolog_cache.code_files()}
+        self.assertIn('prolog_semantics', names)
+        self.assertLessEqual({name for name in imported if name.startswith('prolog_')}, names)
+
+    def test_leaves_out_modules_imported_only_inside_functions(self):
+        # solve() imports prolog_engine when it runs; it does not decide a parse
+        self.assertNotIn('prolog_engine', {path.stem for path in prolog_cache.code_files()})
+
+
+if __name__ == '__main__':
+    unittest.main()
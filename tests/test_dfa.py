@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import graphviz
+
+import prolog_dfa
+from prolog_automaton import reserved_words_spec
+
+
+class RenderCacheTest(unittest.TestCase):
+    """
+    render_dfa runs Graphviz only when the stored key no longer matches the definition.
+    Digraph.render is replaced by a stand-in for dot that writes the source and an image
+    file, so the test counts the renderings without needing Graphviz installed.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.renders = 0
+        patches = (mock.patch.object(prolog_dfa, 'OUTPUT_DIRECTORY', self.directory),
+                   mock.patch.object(graphviz.Digraph, 'render',
+                                     lambda digraph, **options: self.render(digraph, **options)))
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def render(self, digraph, filename=None, directory=None, **options):
+        self.renders += 1
+        source = digraph.save(filename=filename, directory=directory)
+        with open(source + '.png', 'wb') as image:
+            image.write(b'\x89PNG\r\n\x1a\n')
+        return source + '.png'
+
+    def test_unchanged_definition_skips_dot(self):
+        path = prolog_dfa.render_dfa('dfa_reserved_words')
+        self.assertEqual(path, prolog_dfa.image_path('dfa_reserved_words'))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'dfa_reserved_words.key')))
+        self.assertEqual(prolog_dfa.render_dfa('dfa_reserved_words'), path)
+        self.assertEqual(self.renders, 1)
+
+    def test_changed_automaton_renders_again(self):
+        prolog_dfa.render_dfa('dfa_reserved_words')
+        spec = lambda: reserved_words_spec()[:-1]
+        with mock.patch.dict(prolog_dfa.DFAS, {'dfa_reserved_words': (spec, '1')}):
+            prolog_dfa.render_dfa('dfa_reserved_words')
+            prolog_dfa.render_dfa('dfa_reserved_words')
+        self.assertEqual(self.renders, 2)
+
+    def test_missing_image_renders_again(self):
+        prolog_dfa.render_dfa('dfa_reserved_words')
+        os.unlink(prolog_dfa.image_path('dfa_reserved_words'))
+        prolog_dfa.render_dfa('dfa_reserved_words')
+        self.assertEqual(self.renders, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+from pathlib import Path
+
+from prolog_parser import Parser
+from prolog_scanner import Scanner, program_offsets
+
+INPUT = Path(__file__).resolve().parent.parent / 'input.txt'
+
+
+class ErrorCountTest(unittest.TestCase):
+    def test_input_programs(self):
+        # one error per broken clause: its follow-on errors are not reported
+        text = INPUT.read_text()
+        offsets = program_offsets(text) + [len(text)]
+        counts = []
+        for start, end in zip(offsets, offsets[1:]):
+            parser = Parser(Scanner(text[start:end]))
+            parser.parse()
+            counts.append(len(parser.error_list))
+        self.assertEqual(counts, [1, 0, 0, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import asyncio
+import json
+import unittest
+
+from prolog_service import ParseService
+
+
+class Writer:
+    """
+    Collects what handle() writes to a connection.
+    """
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, data):
+        self.lines.extend(json.loads(line) for line in data.splitlines())
+
+    def is_closing(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class BadRequestTest(unittest.TestCase):
+    def handle(self, *requests):
+        async def serve():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b''.join(json.dumps(request).encode() + b'\n' for request in requests))
+            reader.feed_eof()
+            writer = Writer()
+            await ParseService().handle(reader, writer)
+            return writer.lines
+        return asyncio.run(serve())
+
+    def test_max_errors_must_be_null_or_a_non_negative_integer(self):
+        bad = [-1, 1.5, '10', True, [3]]
+        answers = self.handle(*({'id': index, 'source': 'goal', 'max_errors': value}
+                                for index, value in enumerate(bad)))
+        self.assertEqual([answer['id'] for answer in answers], list(range(len(bad))))
+        for answer in answers:
+            self.assertIn('max_errors', answer['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import prolog_parser
+from prolog_scanner import Scanner
+
+PROGRAM = """predicates
+edge(symbol,symbol)
+clauses
+edge(a,b).
+edge(b,c).
+goal
+edge(a,X).
+"""
+
+
+class SolveTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.pro')
+        with os.fdopen(handle, 'w') as source:
+            source.write(PROGRAM)
+        self.addCleanup(os.unlink, self.path)
+        self.scanners = []
+        from_file = Scanner.from_file
+
+        def recorded(path):
+            self.scanners.append(from_file(path))
+            return self.scanners[-1]
+        patcher = mock.patch.object(prolog_parser.Scanner, 'from_file', recorded)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def solve(self, *arguments):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(io.StringIO()):
+            status = prolog_parser.solve(self.path, *arguments)
+        return status, output.getvalue()
+
+    def test_answers_and_closes_the_file(self):
+        self.assertEqual(self.solve(), (0, '{"X": "b"}\n'))
+        self.assertTrue(self.scanners[0].text.closed)
+
+    def test_a_goal_that_does_not_fit_raises_value_error(self):
+        self.assertRaises(ValueError, self.solve, 'edge(a)')
+        self.assertTrue(self.scanners[0].text.closed)
+
+    def test_a_goal_that_does_not_parse_raises_value_error(self):
+        self.assertRaises(ValueError, self.solve, '(a, b)')
+
+
+if __name__ == '__main__':
+    unittest.main()